@@ -97,12 +97,22 @@
 #    "clicktrend":0
 #    }
 #
-# Tabelle stations
-# ----------------
+# Tabelle favorites
+# -----------------
 #    {
 #    "stationuuid":"960e57c5-0601-11e8-ae97-52543be04c81",
+#    "position":0
 #    } 
 #
+# Das Schema gehoert IRadio: beim Oeffnen der DB werden fehlende Migrationen
+# (siehe DB_MIGRATIONS, Version in "pragma user_version") ausgefuehrt. Dabei 
+# bekommt stations einen Primaerschluessel auf stationuuid, einen Index auf name 
+# (nocase) und favorites eine Spalte position (Reihenfolge der Stationsliste).
+# Andere Programme duerfen Favoriten weiterhin nur mit stationuuid einfuegen, position
+# setzt dann ein Trigger (ans Ende der Liste).
+# Dazu kommen history (Titel-Verlauf) und station_caching (gelernte network-caching
+# pro Station).
+#
 #
 # notwendige Python-Module
 # ========================
@@ -120,44 +130,71 @@
 # ToDo:
 # =====
 #
-# * was ist mit den Falschfarben beim Logo?
 # * anderes Default-Logo?
 # * haben wir ein Problem, wenn weniger Stationen vorhanden sind als 
 #   als der Index in den Settings adressiert...?
 # * ein Gehauuse :-)
 #
 #
+# Ohne Hardware (headless)
+# ========================
+#
+# Mit "./iradio.py headless [Sekunden]" laeuft das Radio komplett im Speicher: GPIO,
+# Display und VLC werden durch iradio_fake.py ersetzt, die Zeit ist virtuell (der Main-Loop
+# springt von Deadline zu Deadline). Ein kleines Skript schaltet ein, dreht an beiden
+# Encodern, waehlt eine Station und schaltet wieder aus; danach werden Frames, SPI-Bytes
+# und Scheduler-Statistik ausgegeben. iradio.py kann dafuer auch importiert werden
+# (hal_setup(iradio_fake.backend()), app_setup(), main_loop(until)); die Checks und Benchmarks
+# stehen in iradio_check.py.
+#
+# "./iradio.py bench-e2e [out.json]" spielt auf dieser Ersatz-Hardware Eingaben ab und misst
+# Einschalten --> Hauptbildschirm, Rastung --> Pixel, Auswahl --> "Playing", schnelles
+# Blaettern (auch mit zehnfacher Zeichenzeit, dann werden Bilder zusammengefasst) sowie einzelne
+# Funktionen (Zeichnen, Logos, Stationsliste); Ergebnis als JSON.
+#
+#
 # ---------
 # Have fun!
 #
 # ************************************************************************************************************'''
 
-import RPi.GPIO as GPIO
+# Startzeitpunkt fuer die Boot-Zeitleiste (siehe boot_mark())
+import time
+boot_t0 = time.perf_counter()
 
 from PIL import Image
 from PIL import ImageDraw
 from PIL import ImageFont
 from PIL import ImageColor
 
-import st7735
 
-import time
-from time import sleep
+import numpy as np
+
 from datetime import datetime
 
 import textwrap
+import math
 
 import os
+import sys
 import signal
 
+import heapq
+import bisect
+import queue
+import threading
+
 import json
 
 import sqlite3
 
-from urllib.request import urlopen
-
-import vlc
-from vlc import Meta
+from urllib.parse import quote, urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from collections import OrderedDict
+import hashlib
+import re
+from array import array
 
 
 # BCM-Pins Drehenimpulsgeber
@@ -168,6 +205,14 @@ SELECTION_DT_PIN = 6
 SELECTION_CLK_PIN = 5
 SELECTION_SW_PIN = 25
 
+# Drehimpulsgeber: voller Gray-Code-Zyklus pro Rastung, Ruhelage CLK=1/DT=1 (Pull-ups)
+ENCODER_STEPS_PER_DETENT = 4
+ENCODER_REST_STATE       = 0b11
+# Beschleunigung: (max. Abstand zur vorherigen Rastung in ms, Faktor), aufsteigend
+ENCODER_ACCEL_VOLUME     = ((40, 2),)
+ENCODER_ACCEL_SELECTION  = ((25, 5), (50, 3), (100, 2))
+VOLUME_STEP              = 5
+
 
 # Fonts
 FONT_NORMAL = "/usr/share/fontstruetype/dejavu/DejaVuSans.ttf"
@@ -176,13 +221,87 @@ FONT_BOLD   = "/usr/share/fontstruetype/dejavu/DejaVuSans-Bold.ttf"
 VOLUME_MAX = 100
 VOLUME_MIN = 0
 
-MAIN_SCREENS = 4
-
 TIMEOUT_CLOSE_WINDOW = 5000 # ms
-REFRESH_MEDIA_INFOS  = 5000 # ms
+REFRESH_MEDIA_INFOS  = 5000 # ms; nur fuer Streams, bei denen VLC keine Metadaten-Events liefert
+
+# "warm standby": beim Blaettern in der Stationsliste die markierte Station (und ggf. ihre
+# Nachbarn) stumm vorpuffern, damit beim Auswaehlen sofort umgeschaltet werden kann
+PREBUFFER_ENABLED       = False
+PREBUFFER_NEIGHBOURS    = False
+PREBUFFER_DELAY         = 700      # ms nach dem letzten Schritt in der Stationsliste
+PREBUFFER_MAX           = 2        # gleichzeitig vorgepufferte Streams
+PREBUFFER_MAX_KBITS     = 320      # Summe der Bitraten aller vorgepufferten Streams
+PREBUFFER_DEFAULT_KBITS = 128      # wenn Bitrate unbekannt
+
+# Stream-URLs aufloesen (Weiterleitungen, Playlisten)
+RESOLVE_TTL          = 86400000 # ms
+RESOLVE_TIMEOUT      = 5        # s
+RESOLVE_MAX_DEPTH    = 4        # verschachtelte Playlisten
+RESOLVE_MAX_PLAYLIST = 65536    # Bytes
+PLAYLIST_TYPES       = ("audio/x-scpls", "audio/scpls", "application/pls+xml", "audio/x-mpegurl", "audio/mpegurl", "application/x-mpegurl")
+
+# Settings erst nach dieser Ruhepause schreiben (nicht pro Encoder-Raste)
+SETTINGS_DEBOUNCE = 10000 # ms
+
+# Titel-Verlauf gesammelt schreiben
+HISTORY_FLUSH_INTERVAL = 600000 # ms
+
+# Streams im Hintergrund pruefen (alle Favoriten)
+PROBE_INTERVAL       = 3600000  # ms
+PROBE_FIRST_DELAY    = 30000    # ms nach dem Einschalten
+PROBE_PARALLEL       = 8        # gleichzeitige Verbindungen
+PROBE_TIMEOUT        = 5        # s
+PROBE_BYTES          = 4096
+PROBE_MAX_REDIRECTS  = 3
+
+# network-caching (Puffer von VLC) pro Station lernen: nach Aussetzern beim naechsten Start
+# mehr puffern, nach langer Zeit ohne Aussetzer schrittweise weniger (schnellerer Start)
+CACHING_DEFAULT        = 1000     # ms (wie VLC)
+CACHING_MIN            = 300      # ms
+CACHING_MAX            = 10000    # ms
+CACHING_UP             = 1.5      # Faktor nach Aussetzer
+CACHING_DOWN           = 0.8      # Faktor nach CACHING_CLEAN_TIME ohne Aussetzer
+CACHING_CHECK_INTERVAL = 30000    # ms (Zaehler von libvlc sind kumulativ)
+CACHING_CLEAN_TIME     = 1800000  # ms
+
+# Stations-DB
+DB_TIMEOUT           = 5        # s; Warten auf Sperre durch andere Prozesse (z.B. Import)
+
+# Logos im Hintergrund laden
+LOGO_FETCH_WORKERS   = 2
+LOGO_FETCH_TIMEOUT   = 5        # s
+LOGO_FETCH_MAX_SIZE  = 1000000  # Bytes
+LOGO_FAILED_RETRY    = 3600000  # ms; so lange wird eine defekte Logo-URL nicht erneut versucht
+
+# HTTP-Antworten stueckweise lesen (Gesamtdauer begrenzt, siehe http_read())
+HTTP_CHUNK_SIZE      = 16384    # Bytes
+
+# Display: nur geaenderte Bereiche uebertragen; geaenderte Zeilen, die weniger als
+# TFT_BAND_GAP Zeilen auseinander liegen, werden zu einem Fenster zusammengefasst
+TFT_BAND_GAP         = 4        # Zeilen
+TFT_CHUNK_SIZE       = 4096     # Bytes pro SPI-Transfer
+# Display-Controller ist (durch st7735-Modul) auf BGR-Reihenfolge eingestellt,
+# deshalb bei der Umwandlung nach RGB565 Rot und Blau tauschen (das waren die Falschfarben beim Logo)
+TFT_SWAP_RB          = True
+
+# Metriken: HTTP-Endpunkt (Prometheus-Text unter /metrics, JSON unter /metrics.json),
+# JSON-Dump per SIGUSR1 (METRICS_DUMP_FILE); METRICS_PORT = None schaltet den Endpunkt ab
+METRICS_ADDR         = "127.0.0.1"
+METRICS_PORT         = 9101
+METRICS_BUCKETS_MS   = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+METRICS_SKIP         = ("minute_start", "minute_idle_wakeups")
+METRICS_VLC_FIELDS   = ("read_bytes", "input_bitrate", "demux_read_bytes", "demux_bitrate", "demux_corrupted",
+                        "demux_discontinuity", "decoded_audio", "played_abuffers", "lost_abuffers")
+
+# Text-Cache (umgebrochene Zeilen, Textbreiten, gerasterte Texte)
+TEXT_CACHE_SIZE      = 256      # Eintraege
+
+# Logo-Cache (Speicher: fertig skalierte Bilder; Platte: Originale und skalierte Varianten)
+LOGO_MEM_CACHE_SIZE  = 16       # Anzahl Bilder
+LOGO_DISK_CACHE_MAX  = 5000000  # Bytes
 
 # Default, wenn keine sqlite3-DB da ist bzw. nicht sinnvolles drin ist
-stations = [
+DEFAULT_STATIONS = [
     {"name" : "Altrockmetal-Radiogirls", "url" : "http://stream.laut.fm/altrockmetal-radiogirls", "favicon" : ""},
     {"name" : "Best Net Radio - 80s Metal", "url" : "http://bigrradio-edge1.cdnstream.com/5146_128", "favicon" : ""},
     {"name" : "Digital Impulse - Heavy Metal", "url" : "http://orion.shoutca.st:8165/", "favicon" : ""},
@@ -199,17 +318,29 @@ stations = [
     {"name" : "Rock antenne soft Rock (64)", "url" : "http://mp3channels.webradio.rockantenne.de/soft-rock.aac", "favicon" : ""},
     {"name" : "Rockantenne Symphonic-Rock", "url" : "|http://stream.rockantenne.de/symphonic-rock/stream/mp3", "favicon" : "https://www.rockantenne.de/logos/rock-antenne/apple-touch-icon.png"},
 ]
-STATIONS_COUNT = len(stations)
+STATIONS_COUNT = len(DEFAULT_STATIONS)
+
+# aktuelle Stationsliste (StationList, siehe load_stations())
+stations = None
 
 # Setting-Defaults 
-config = {
+SETTINGS_DEFAULTS = {
             "volume"        : 50,
             "station_idx"   : 0
 }
+config = dict(SETTINGS_DEFAULTS)
+
+# Settings: Datei gelesen? zuletzt geschriebener Stand (Schreiben nur bei Aenderung)
+settings_state = {"loaded" : False, "written" : None}
 
 # Anzahl sichtbare Stationen in Stationsauswahlliste
 STATION_LIST_MAX_COUNT = 6
 
+# Stationsliste: Eintraege werden in Fenstern dieser Groesse aus der DB geholt
+STATION_PREFETCH           = 3 * STATION_LIST_MAX_COUNT
+STATION_CACHE_SIZE         = 3 * STATION_PREFETCH
+STATION_DETAILS_CACHE_SIZE = 8
+
 # temporaere Werte
 temps = {
             "application_on"        : False,           
@@ -217,17 +348,111 @@ temps = {
             "station_list_bottom"   : STATION_LIST_MAX_COUNT,
             "station_list_idx"      : 0,
             "main_screen_idx"       : 0,
-            "station_list"          : False
+            "station_list"          : False,
+            "volume_window"         : False
 }
 
 # Konfiguration "Task" im Main-Loop
+# (Reihenfolge der Eintraege entspricht der Prioritaet, wenn mehrere gleichzeitig faellig sind)
 cycles = {
-            "display_main"              : {"time" : 0, "start" : False},
-            "display_app_off"           : {"time" : 0, "start" : True},
-            "display_volume"            : {"time" : 0, "start" : False},
-            "display_stations"          : {"time" : 0, "start" : False},
-            "reset_temp_station_idx"    : {"time" : 0, "start" : False},
-            "display_media_infos"       : {"time" : 0, "start" : False},
+            "display_volume"            : {"time" : 0, "start" : False, "seq" : 0},
+            "display_stations"          : {"time" : 0, "start" : False, "seq" : 0},
+            "reset_temp_station_idx"    : {"time" : 0, "start" : False, "seq" : 0},
+            "display_main"              : {"time" : 0, "start" : False, "seq" : 0},
+            "display_app_off"           : {"time" : 0, "start" : True,  "seq" : 0},
+            "display_media_infos"       : {"time" : 0, "start" : False, "seq" : 0},
+            "prebuffer"                 : {"time" : 0, "start" : False, "seq" : 0},
+            "probe_streams"             : {"time" : 0, "start" : False, "seq" : 0},
+            "history_flush"             : {"time" : 0, "start" : False, "seq" : 0},
+            "caching_check"             : {"time" : 0, "start" : False, "seq" : 0},
+            "settings_write"            : {"time" : 0, "start" : False, "seq" : 0},
+}
+
+# Sperre fuer atomare Aenderungen an config/temps/stations (Render-Thread liest nur Snapshots)
+state_lock = threading.RLock()
+
+# Render-Thread: "latest state wins"-Briefkasten mit je einem Platz fuer Vollbild und Overlay-Fenster
+render_cond = threading.Condition()
+render_mailbox = {
+            "main"      : None,
+            "overlay"   : None,
+}
+render_stats = {
+            "requests"  : 0,
+            "frames"    : 0,
+            "dropped"   : 0,
+            "busy"      : False,
+            "free_at"   : 0,        # virtuelle Zeit: Render-Thread ist mit dem letzten Bild fertig
+            "flush"     : False,    # render_wait_idle(): alles sofort zeichnen
+}
+
+# aktuell abgespieltes Medium und dessen Metadaten
+media = None
+media_meta = {
+            "now_playing"   : None,
+            "title"         : None,
+            "genre"         : None,
+            "events"        : False,    # kamen schon Metadaten per Event?
+}
+
+# aufgeloeste Stream-URLs: url --> (aufgeloeste url, gueltig bis ms)
+resolve_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="resolve")
+resolve_lock = threading.Lock()
+resolve_cache = {}
+resolve_inflight = set()
+
+# Ergebnis der Stream-Pruefung: Original-URL der Station --> {"ok", "url" (funktionierende URL), "time"}
+stream_health = {}
+probe_state = {"running" : False}
+
+# Titel-Verlauf: laufender Titel und noch nicht geschriebene Eintraege
+history_current = {"uuid" : None, "station" : None, "title" : None, "start" : 0}
+history_buffer = []
+
+# network-caching: gelernte Werte (uuid bzw. URL --> {"caching", "bad", "underruns"}) und
+# Messung fuer das laufende Medium (siehe caching_watch())
+caching_values = {}
+caching_state = {"media" : None, "playing" : False, "rebuffering" : False, "rebuffers" : 0}
+caching_stats = {"underruns" : 0, "raised" : 0, "lowered" : 0}
+
+# URLs, die fuer die aktuelle Station noch probiert werden koennen (Failover)
+player_failover_urls = []
+
+# VLC (siehe player_setup(), laeuft beim Start im Hintergrund)
+vlc_instance = None
+player = None
+
+# vorgepufferte Streams: Original-URL der Station --> {"player", "media", "caching"}
+prebuffers = OrderedDict()
+
+# Zeitpunkt (ms) Einschalten bzw. Stationswechsel; Messung bis zum ersten Ton
+player_start_time = {"event" : None, "time" : 0}
+
+# Stations-DB: eine persistente (read-only) Verbindung pro Thread
+db_local = threading.local()
+db_schema_checked = None      # Inode der DB-Datei, deren Schema geprueft wurde
+db_stats = {
+            "queries"   : 0,
+            "errors"    : 0,
+            "time_ms"   : 0,
+}
+
+# Scheduler: Timer-Heap (Deadline, Sequenznummer, Name) und Queue fuer Eingabe-Events
+# (RLock: signal_handler() laeuft im Main-Thread und ruft ueber settings_write() bzw.
+# player_stop() cycle_stop() auf, auch wenn der Main-Loop die Sperre gerade haelt)
+cycle_heap = [(0, 0, "display_app_off")]
+cycle_lock = threading.RLock()
+cycle_seq = 0
+wakeup_queue = queue.SimpleQueue()
+
+# Statistik Main-Loop (idle = aufgewacht, obwohl nichts zu tun war)
+scheduler_stats = {
+            "wakeups"               : 0,
+            "idle_wakeups"          : 0,
+            "events"                : 0,
+            "minute_start"          : 0,
+            "minute_idle_wakeups"   : 0,
+            "idle_wakeups_per_min"  : 0,
 }
 
 # Verzeichnisse/Dateien
@@ -236,81 +461,883 @@ STATION_DB_FILE = F"{SCRIPT_PATH}/stations.db"
 PATH_LOGO_CACHE = F"{SCRIPT_PATH}/logo_cache/"
 DEFAULT_LOGO    = F"{SCRIPT_PATH}/icon_radio.png"
 SETTINGS_FILE   = F"{SCRIPT_PATH}/iradio.json"
+METRICS_DUMP_FILE = "/tmp/iradio-metrics.json"
+
+# Start in Stufen (siehe app_setup()): Zeitleiste, Hintergrund fertig?
+boot_timeline = []
+boot_done = threading.Event()
+boot_errors = {}                # Stufe --> Fehler (Boot-Thread; VLC wird beim Einschalten nochmal versucht)
+
+# Backends (siehe hal_setup())
+hal = {
+            "headless"      : False,
+            "clock"         : None,     # VirtualClock bei headless
+            "until"         : None,     # Ende von main_loop() in virtueller Zeit
+            "gpio"          : None,     # RPi.GPIO bzw. iradio_fake.FakeGPIO
+            "display"       : None,     # Modul mit ST7735 (st7735 bzw. iradio_fake)
+            "vlc"           : None,     # vlc bzw. iradio_fake.vlc
+            "http_open"     : None,     # siehe hal_network()
+            "probe_url"     : None,
+            "render_scale"  : None,     # virtuelle Zeit: Zeichenzeit * Faktor (None: kostet nichts)
+}
 
-# Farben
-COLOR_TEXT_NORMAL                   = 0xffffff
-COLOR_BACKGROUND_NORMAL             = 0x000000
+# Display-Statistik
+tft_stats = {
+            "frames"        : 0,
+            "windows"       : 0,
+            "bytes"         : 0,
+            "last_bytes"    : 0,
+}
 
-COLOR_BACKGROUND_CLOCK_BAR          = 0x2f4f4f
-COLOR_TEXT_CLOCK_BAR                = 0xffffff
+# Logo-Downloads (laufend bzw. fehlgeschlagen)
+logo_executor = ThreadPoolExecutor(max_workers=LOGO_FETCH_WORKERS, thread_name_prefix="logo")
+logo_lock = threading.Lock()
+logo_inflight = {}      # url --> Future
+logo_failed = {}        # url --> Zeitpunkt (ms) des Fehlschlages
+logo_mem_cache = OrderedDict()  # (quelle, dx, dy, mode) --> Bild
+logo_stats = {
+            "mem_hits"          : 0,
+            "mem_misses"        : 0,
+            "disk_hits"         : 0,
+            "downloads"         : 0,
+            "download_errors"   : 0,
+}
+
+# Metriken: Histogramme (name, labels) --> Histogram
+metrics_hist = {}
+
+# Encoder: Tastendruecke (Drehungen zaehlen die QuadratureDecoder selbst)
+encoder_stats = {"presses" : 0}
+volume_decoder = None
+selection_decoder = None
+
+# Text-Cache: (art, text, ...) --> Zeilen/Breite/(Sprite, Versatz); Uhrzeit-Leiste
+text_cache = OrderedDict()
+text_stats = {
+            "hits"          : 0,
+            "misses"        : 0,
+            "evictions"     : 0,
+            "clock_renders" : 0,
+}
+clock_bar = {"text" : None, "strip" : None}
+
+# Farben (#RRGGBB)
+COLOR_TEXT_NORMAL                   = ImageColor.getrgb("#ffffff")
+COLOR_BACKGROUND_NORMAL             = ImageColor.getrgb("#000000")
 
-COLOR_BACKGROUND_WINDOW             = 0x000000
-COLOR_FRAME_WINDOW                  = 0x2f4f4f
-COLOR_BACKGROUND_LABEL_WINDOW       = 0x2f4f4f
-COLOR_TEXT_LABEL_WINDOW             = 0xffffff
-COLOR_VOLUME_BAR                    = 0x0000ff
-COLOR_TEXT_WINDOW                   = 0xffffff
-COLOR_TEXT_SELECTED_STATION         = 0x000000
-COLOR_BACKGROUND_SELECTED_STATION   = 0xffffff
+COLOR_BACKGROUND_CLOCK_BAR          = ImageColor.getrgb("#2f4f4f")
+COLOR_TEXT_CLOCK_BAR                = ImageColor.getrgb("#ffffff")
+
+COLOR_BACKGROUND_WINDOW             = ImageColor.getrgb("#000000")
+COLOR_FRAME_WINDOW                  = ImageColor.getrgb("#2f4f4f")
+COLOR_BACKGROUND_LABEL_WINDOW       = ImageColor.getrgb("#2f4f4f")
+COLOR_TEXT_LABEL_WINDOW             = ImageColor.getrgb("#ffffff")
+COLOR_VOLUME_BAR                    = ImageColor.getrgb("#0000ff")
+COLOR_TEXT_WINDOW                   = ImageColor.getrgb("#ffffff")
+COLOR_TEXT_SELECTED_STATION         = ImageColor.getrgb("#000000")
+COLOR_BACKGROUND_SELECTED_STATION   = ImageColor.getrgb("#ffffff")
+COLOR_TEXT_DEAD_STATION             = ImageColor.getrgb("#808080")
 
 
 # ******************************************************************
 def signal_handler(SignalNumber,Frame):
     settings_write()
+    history_flush(close=True)
     player_stop()
-    GPIO.cleanup()
+    hal["gpio"].cleanup()
     exit()
 
 # ******************************************************************
 # Idee: https://github.com/bablokb/simple-dab-radio/blob/master/files/usr/local/sbin/simple-dab-radio.py
 def settings_read():
-    sname = os.path.expanduser(SETTINGS_FILE)
-    if os.path.exists(sname):
-        with open(sname,"r") as f:
-            settings = json.load(f)
-        config["volume"] = settings['volume']
-        config["station_idx"] = settings['station_idx']
+    # Datei nur beim ersten Aufruf lesen; danach gilt der Stand im Speicher
+    if not settings_state["loaded"]:
+        settings_state["loaded"] = True
+        sname = os.path.expanduser(SETTINGS_FILE)
+        settings = {}
+        if os.path.exists(sname):
+            try:
+                with open(sname,"r") as f:
+                    settings = json.load(f)
+                if not isinstance(settings, dict):
+                    raise ValueError("kein JSON-Objekt")
+            except (OSError, ValueError) as e:
+                print(f"settings: {sname} unbrauchbar ({e}), verwende Defaults")
+                settings = {}
+        config["volume"] = settings_value(settings, "volume", 0, 100)
+        config["station_idx"] = settings_value(settings, "station_idx", 0, None)
+        settings_state["written"] = settings_snapshot()
+    temps["station_list_idx"] = config["station_idx"]
+    # ...fuer den seltenen Fall, dass eingelesener Index groesser ist, als die tatsaechliche Anzahl der Stationen
+    # (erst pruefbar, wenn die Stationen geladen sind; load_stations() prueft ebenfalls)
+    if stations is not None and (config["station_idx"] >= STATIONS_COUNT):
+        config["station_idx"] = 0
         temps["station_list_idx"] = config["station_idx"]
-        # ...fuer den seltenen Fall, dass eingelesener Index groesser ist, als die tatsaechliche Anzahl der Stationen
-        if (config["station_idx"] >= STATIONS_COUNT):
-            config["station_idx"] = 0
-            temps["station_list_idx"] = config["station_idx"]
-      
+
 # ******************************************************************
-# Idee: https://github.com/bablokb/simple-dab-radio/blob/master/files/usr/local/sbin/simple-dab-radio.py
-def settings_write():
-    settings = {
+def settings_value(settings, key, lo, hi):
+    # ganzzahligen Wert pruefen; sonst Default aus SETTINGS_DEFAULTS
+    value = settings.get(key)
+    if (isinstance(value, int) and not isinstance(value, bool) and value >= lo and
+        (hi is None or value <= hi)):
+        return value
+    if key in settings:
+        print(f"settings: ungueltiger Wert {key}={value!r}, verwende {SETTINGS_DEFAULTS[key]}")
+    return SETTINGS_DEFAULTS[key]
+
+# ******************************************************************
+def settings_snapshot():
+    return {
         'volume' : config["volume"],
         'station_idx': config["station_idx"],
-        'station_name': stations[config['station_idx']]['name'],
     }
+
+# ******************************************************************
+def settings_changed():
+    # Lautstaerke/Station geaendert: erst nach einer Ruhepause schreiben
+    cycle_start("settings_write", time_ms() + SETTINGS_DEBOUNCE, True)
+
+# ******************************************************************
+# Idee: https://github.com/bablokb/simple-dab-radio/blob/master/files/usr/local/sbin/simple-dab-radio.py
+def settings_write():
+    # nur bei Aenderungen; atomar ueber Temp-Datei + fsync + rename
+    cycle_stop("settings_write")
+    settings = settings_snapshot()
+    if settings == settings_state["written"]:
+        return False
+    if stations is not None and config["station_idx"] < len(stations):
+        settings['station_name'] = stations[config['station_idx']].name
     # ~ sname = os.path.expanduser(SETTINGS_FILE)
     sname = SETTINGS_FILE
+    tmp = f"{sname}.tmp"
     print("saving settings to: %s" % sname)
-    with open(sname,"w") as f:
-        json.dump(settings,f,indent=2)
+    try:
+        with open(tmp,"w") as f:
+            json.dump(settings,f,indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, sname)
+        # Verzeichniseintrag (rename) ebenfalls sichern
+        dfd = os.open(os.path.dirname(sname) or ".", os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError as e:
+        print(f"settings: schreiben fehlgeschlagen ({e})")
+        return False
+    settings_state["written"] = settings_snapshot()
+    return True
+
+# ***********************************************************************************************
+def hal_network():
+    # Netz-Backends: Stream-Aufloesung/Logos (http_open) und Stream-Pruefung (probe_url)
+    return {
+            "http_open"     : http_open,
+            "probe_url"     : probe_url,
+    }
+
+# ***********************************************************************************************
+def hal_hardware():
+    # echte Hardware (RPi.GPIO, st7735); erst hier importieren, damit iradio.py auch ohne
+    # Raspberry Pi importiert werden kann; vlc wird erst in player_setup() (im Hintergrund) geladen
+    import RPi.GPIO
+    import st7735
+    return {
+            "headless"      : False,
+            "clock"         : None,
+            "gpio"          : RPi.GPIO,
+            "display"       : st7735,
+            "vlc"           : None,
+            **hal_network(),
+    }
+
+# ***********************************************************************************************
+def hal_setup(backend):
+    # Backends uebernehmen: hal_hardware() oder Ersatz aus iradio_fake.backend() (virtuelle
+    # Zeit, Fake-GPIO, Framebuffer-Display, Fake-VLC, kein Netz); die Checks koennen auch nur
+    # einzelne Backends setzen (z.B. hal_network())
+    global SETTINGS_FILE, STATION_DB_FILE, PATH_LOGO_CACHE
+    hal.update(backend)
+    if "headless" in backend and backend["headless"]:
+        import atexit
+        import shutil
+        import tempfile
+        # Settings/DB/Logos des Radios nicht anfassen
+        # (temporaeres Verzeichnis, wird beim Beenden geloescht)
+        tmp = tempfile.mkdtemp(prefix="iradio-")
+        atexit.register(shutil.rmtree, tmp, True)
+        SETTINGS_FILE = f"{tmp}/iradio.json"
+        STATION_DB_FILE = f"{tmp}/stations.db"
+        PATH_LOGO_CACHE = f"{tmp}/logo_cache/"
 
 # ******************************************************************
 def player_setup():
     global vlc_instance, player
-    
-    vlc_instance = vlc.Instance('--input-repeat=-1', '--fullscreen')
-    player=vlc_instance.media_player_new()
+    if hal["vlc"] is None:
+        import vlc
+        hal["vlc"] = vlc
+    instance = hal["vlc"].Instance('--input-repeat=-1', '--fullscreen')
+    if instance is None:
+        # python-vlc liefert None, wenn libvlc nicht starten kann (z.B. Audio-Geraet fehlt)
+        raise RuntimeError("libvlc instance could not be created")
+    p = instance.media_player_new()
+    player_attach_events(p)
+    # erst setzen, wenn alles geklappt hat (vlc_instance None: VLC fehlt, siehe encoder_volume())
+    vlc_instance, player = instance, p
+
+# ******************************************************************
+def player_attach_events(p):
+    p.event_manager().event_attach(hal["vlc"].EventType.MediaPlayerPlaying, player_playing)
+    p.event_manager().event_attach(hal["vlc"].EventType.MediaPlayerEncounteredError, player_error)
+    p.event_manager().event_attach(hal["vlc"].EventType.MediaPlayerBuffering, player_buffering)
+
+# ******************************************************************
+def url_normalize(url):
+    # Leerraum und Muell vor dem Schema entfernen (z.B. "|http://...")
+    url = (url or "").strip()
+    m = re.search(r"[a-zA-Z][a-zA-Z0-9+.-]*://", url)
+    if m:
+        url = url[m.start():]
+    return url
+
+# ******************************************************************
+def playlist_parse(text, base_url):
+    # erste Stream-URL aus .pls/.m3u (HLS-Playlisten kann VLC selbst, also None)
+    if "#EXT-X-" in text:
+        return None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("["):
+            continue
+        m = re.match(r"File\d+\s*=\s*(.+)$", line, re.I)
+        if m:
+            return urljoin(base_url, m.group(1).strip())
+        if "=" in line and not "://" in line.split("=", 1)[0]:
+            continue    # sonstige pls-Eintraege (Title1=..., NumberOfEntries=...)
+        return urljoin(base_url, line)
+    return None
+
+# ******************************************************************
+def http_open(url, timeout):
+    # GET fuer Stream-Aufloesung und Logos (urllib erst hier laden, das kostet beim Start
+    # Zeit); headless ersetzt durch iradio_fake.http_open (kein Netz, siehe hal_setup())
+    from urllib.request import urlopen, Request
+    return urlopen(Request(url, headers={"User-Agent" : "IRadio"}), timeout=timeout)
+
+# ******************************************************************
+def resolve_stream_url(url, timeout=RESOLVE_TIMEOUT):
+    # Weiterleitungen folgen und Playlisten aufloesen; liefert die eigentliche Stream-URL;
+    # timeout (s) gilt fuer alles zusammen
+    deadline = time.perf_counter() + timeout
+    url = url_normalize(url)
+    for i in range(RESOLVE_MAX_DEPTH):
+        if not url.lower().startswith(("http://", "https://")):
+            return url
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError("deadline exceeded")
+        with hal["http_open"](url, remaining) as response:
+            final = response.geturl()      # urlopen folgt Weiterleitungen selbst
+            ctype = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            path = urlparse(final).path.lower()
+            if ctype not in PLAYLIST_TYPES and not path.endswith((".pls", ".m3u")):
+                # Stream selbst; nichts weiter lesen
+                return final
+            text = http_read(response, RESOLVE_MAX_PLAYLIST, deadline)[:RESOLVE_MAX_PLAYLIST].decode("utf-8", "replace")
+        entry = playlist_parse(text, final)
+        if entry is None:
+            return final
+        url = url_normalize(entry)
+    return url
+
+# ******************************************************************
+def resolve_cached(url):
+    # aufgeloeste URL aus dem Cache, wenn noch gueltig (sonst None)
+    with resolve_lock:
+        entry = resolve_cache.get(url)
+    if entry is not None and entry[1] > time_ms():
+        return entry[0]
+    return None
+
+# ******************************************************************
+def resolve_worker(url, uuid):
+    # laeuft im Worker-Thread; Ergebnis in Cache und (wenn vorhanden) in die DB
+    try:
+        final = resolve_stream_url(url)
+        with resolve_lock:
+            resolve_cache[url] = (final, time_ms() + RESOLVE_TTL)
+        if uuid is not None:
+            db_write("update stations set url_resolved = ? where stationuuid = ? and url_resolved is not ?", [(final, uuid, final)])
+    except Exception as e:
+        print(f"Resolve {url}: {e}")
+    finally:
+        with resolve_lock:
+            resolve_inflight.discard(url)
+
+# ******************************************************************
+def player_url(idx):
+    # URL, mit der VLC die Station idx starten soll: aufgeloeste URL aus dem Cache, sonst
+    # url_resolved aus der DB bzw. die (bereinigte) Original-URL; abgelaufene oder fehlende
+    # Cache-Eintraege werden im Hintergrund (neu) aufgeloest
+    url = stations[idx].url
+    resolved = resolve_cached(url)
+    if resolved is not None:
+        return resolved
+    details = stations.details(idx)
+    with resolve_lock:
+        start = url not in resolve_inflight
+        resolve_inflight.add(url)
+    if start:
+        resolve_executor.submit(resolve_worker, url, details.get("stationuuid"))
+    with resolve_lock:
+        entry = resolve_cache.get(url)
+    if entry is not None:
+        return entry[0]
+    return url_normalize(details.get("url_resolved") or url)
+
+# ******************************************************************
+async def probe_url(url, timeout=PROBE_TIMEOUT):
+    # Stream "anfassen": Status, Header (inkl. ICY) und die ersten Bytes lesen;
+    # liefert (ok, Info-dict); timeout (s) gilt fuer die ganze Pruefung, also fuer alle
+    # Weiterleitungen und Playlisten zusammen
+    import asyncio
+    info = {"url" : url}
+    try:
+        return await asyncio.wait_for(probe_follow(url, info), timeout)
+    except asyncio.TimeoutError:
+        info["error"] = "timeout"
+        return False, info
+
+# ******************************************************************
+async def probe_follow(url, info):
+    # Weiterleitungen und Playlisten folgen (ohne eigene Zeitgrenzen, siehe probe_url())
+    import asyncio
+    import ssl
+    redirects = 0
+    playlists = 0
+    while True:
+        # Angaben der vorigen Anfrage (Weiterleitung, Playlist) verwerfen
+        for k in ("status", "icy-name", "icy-br", "content-type"):
+            info.pop(k, None)
+        u = urlparse(url)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            info["error"] = "unsupported url"
+            return False, info
+        port = u.port or (443 if u.scheme == "https" else 80)
+        path = u.path or "/"
+        if u.query:
+            path = f"{path}?{u.query}"
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(
+                u.hostname, port, ssl=(ssl.create_default_context() if u.scheme == "https" else None))
+            writer.write((f"GET {path} HTTP/1.0\r\nHost: {u.netloc}\r\nUser-Agent: IRadio\r\n"
+                          f"Icy-MetaData: 1\r\nConnection: close\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            status = lines[0].split()
+            code = int(status[1]) if len(status) > 1 and status[1].isdigit() else 0
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            info["status"] = code
+            if code in (301, 302, 303, 307, 308) and "location" in headers:
+                redirects = redirects + 1
+                if redirects > PROBE_MAX_REDIRECTS:
+                    info["error"] = "too many redirects"
+                    return False, info
+                url = urljoin(url, headers["location"])
+                continue
+            if code != 200:
+                return False, info
+            for k in ("icy-name", "icy-br", "content-type"):
+                if k in headers:
+                    info[k] = headers[k]
+            ctype = headers.get("content-type", "").split(";")[0].strip().lower()
+            if ctype in PLAYLIST_TYPES or u.path.lower().endswith((".pls", ".m3u")):
+                # Playlist: gesund ist die Station nur, wenn der Eintrag (der Stream) es ist
+                text = await probe_read(reader, RESOLVE_MAX_PLAYLIST)
+                entry = playlist_parse(text.decode("utf-8", "replace"), url)
+                if entry is not None:
+                    playlists = playlists + 1
+                    if playlists >= RESOLVE_MAX_DEPTH:
+                        info["error"] = "playlists nested too deep"
+                        return False, info
+                    url = url_normalize(entry)
+                    continue
+                # HLS (loest VLC selbst auf) oder leere Playlist
+                info["bytes"] = len(text)
+                return len(text) > 0, info
+            data = await reader.read(PROBE_BYTES)
+            info["bytes"] = len(data)
+            return len(data) > 0, info
+        except Exception as e:
+            info["error"] = str(e) or type(e).__name__
+            return False, info
+        finally:
+            if writer is not None:
+                writer.close()
+
+# ******************************************************************
+async def probe_read(reader, limit):
+    # Antwort bis zum Ende (Connection: close), hoechstens limit Bytes
+    data = b""
+    while len(data) < limit:
+        chunk = await reader.read(limit - len(data))
+        if not chunk:
+            break
+        data = data + chunk
+    return data
+
+# ******************************************************************
+async def probe_station(sem, key, urls):
+    # alle URLs einer Station der Reihe nach; die erste funktionierende gewinnt
+    async with sem:
+        info = {}
+        for url in urls:
+            ok, info = await hal["probe_url"](url)
+            if ok:
+                return key, True, info
+        return key, False, info
+
+# ******************************************************************
+async def probe_all(entries, parallel=PROBE_PARALLEL):
+    import asyncio
+    sem = asyncio.Semaphore(parallel)
+    return await asyncio.gather(*(probe_station(sem, key, urls) for key, urls in entries))
+
+# ******************************************************************
+def probe_run(entries):
+    # Thread: alle Stationen pruefen, Ergebnis in einer Transaktion in die DB und an den Main-Loop
+    # (asyncio erst hier laden, das kostet beim Start Zeit)
+    import asyncio
+    t = time_ms()
+    results = asyncio.run(probe_all([(key, urls) for key, uuid, urls in entries]))
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # gather() liefert in der Reihenfolge von entries; nicht ueber die URL zuordnen, die kann
+    # bei mehreren Stationen gleich sein
+    rows = [(int(ok), now, now, int(ok), now, uuid) for (key, uuid, urls), (k, ok, info) in zip(entries, results) if uuid is not None]
+    try:
+        db_write("""update stations set lastcheckok = ?, lastchecktime = ?, lastlocalchecktime = ?,
+                    lastcheckoktime = case when ? then ? else lastcheckoktime end
+                    where stationuuid = ?""", rows)
+    except Exception as e:
+        print(f"Probe: {e}")
+    dead = sum(1 for key, ok, info in results if not ok)
+    print(f"Probe: {len(results)} stations, {dead} dead, {time_ms() - t:.0f} ms")
+    post_event(probe_done, results)
+
+# ******************************************************************
+def probe_start():
+    # Liste der zu pruefenden Stationen (alle Favoriten) im Main-Thread holen, pruefen im Hintergrund
+    if probe_state["running"]:
+        return
+    entries = []
+    if stations.defaults is not None:
+        for d in stations.defaults:
+            entries.append((d["url"], None, station_urls(d["url"], None)))
+    else:
+        try:
+            for row in db_query(SQL_FAVORITES_PROBE):
+                entries.append((row["url"], row["stationuuid"], station_urls(row["url"], row["url_resolved"])))
+        except (FileNotFoundError, sqlite3.Error) as e:
+            print(f"Probe: {e}")
+            return
+    probe_state["running"] = True
+    threading.Thread(target=probe_run, args=(entries,), name="probe", daemon=True).start()
+
+# ******************************************************************
+def probe_done(results):
+    probe_state["running"] = False
+    for key, ok, info in results:
+        stream_health[key] = {"ok" : ok, "url" : info.get("url") if ok else None, "time" : time_ms()}
+    if temps["station_list"]:
+        cycle_start("display_stations", 0, True)
+
+# ******************************************************************
+def station_urls(url, url_resolved):
+    # moegliche URLs einer Station (aufgeloeste zuerst, Duplikate raus)
+    urls = []
+    for u in (resolve_cached(url), url_resolved, url):
+        u = url_normalize(u)
+        if u and u not in urls:
+            urls.append(u)
+    return urls
+
+# ******************************************************************
+def station_dead(idx):
+    health = stream_health.get(stations[idx].url)
+    return health is not None and not health["ok"]
 
 # ******************************************************************
 def player_start():
     global media, player, vlc_instance
-    media=vlc_instance.media_new(stations[config['station_idx']]['url'])
+    idx = config['station_idx']
+    url = player_url(idx)
+    # Ergebnis der Stream-Pruefung beachten: andere funktionierende URL der Station nehmen
+    # bzw. tote Station melden; alle anderen URLs bleiben fuer den Failover
+    health = stream_health.get(stations[idx].url)
+    if health is not None:
+        if health["ok"] and health["url"]:
+            url = health["url"]
+        elif not health["ok"]:
+            print(f"{stations[idx].name}: stream was dead at last probe, trying anyway")
+    player_failover_urls[:] = [u for u in station_urls(stations[idx].url, stations.details(idx).get("url_resolved")) if u != url]
+    pb = prebuffer_take(stations[idx].url)
+    if pb is not None:
+        # Station laeuft schon (stumm) im Hintergrund, also nur umschalten
+        old = player
+        player = pb["player"]
+        media = pb["media"]
+        player_attach_events(player)
+        media_meta_reset()
+        media_attach_events(media)
+        media_meta_update()
+        player.audio_set_mute(False)
+        player.audio_set_volume(config["volume"])
+        old.stop()
+        old.release()
+        caching_watch(media, idx, pb["caching"], True)
+        player_first_sound(True)
+        prebuffer_stop_all()
+        return
+    prebuffer_stop_all()
+    media=vlc_instance.media_new(url)
     media.get_mrl()
+    caching_watch(media, idx, caching_option(media, idx))
+    media_meta_reset()
+    media_attach_events(media)
     player.set_media(media)
     player.audio_set_volume(config["volume"])
     # ~ player.audio_set_volume(70)
     player.play()
 
+# ******************************************************************
+def player_playing(event):
+    # VLC-Thread
+    caching_state["playing"] = True
+    player_first_sound(False)
+
+# ******************************************************************
+def player_first_sound(prebuffered):
+    # Zeit seit Einschalten/Stationswechsel bis zum ersten Ton ausgeben (und als Metrik)
+    if player_start_time["event"] is not None:
+        ms = time_ms() - player_start_time["time"]
+        print(f"{player_start_time['event']} --> first sound: {ms:.0f} ms{' (prebuffered)' if prebuffered else ''}")
+        metrics_observe("first_sound_ms", ms, event=player_start_time["event"], prebuffered=int(prebuffered))
+        player_start_time["event"] = None
+
+# ******************************************************************
+def player_error(event):
+    # VLC-Thread; Failover im Main-Loop
+    post_event(player_failover)
+
+# ******************************************************************
+def media_attach_events(m):
+    # Metadaten (ICY-Titel usw.) werden von VLC gemeldet, nicht mehr abgefragt
+    m.event_manager().event_attach(hal["vlc"].EventType.MediaMetaChanged, media_meta_event)
+
+# ******************************************************************
+def media_meta_event(event):
+    # VLC-Thread; Auswertung im Main-Loop
+    post_event(media_meta_update, True)
+
+# ******************************************************************
+def media_meta_reset():
+    history_title(None)
+    with state_lock:
+        media_meta["now_playing"] = None
+        media_meta["title"] = None
+        media_meta["genre"] = None
+        media_meta["events"] = False
+    # neues Medium: wieder abfragen, bis es Events liefert
+    if temps["application_on"]:
+        cycle_start("display_media_infos", time_ms() + REFRESH_MEDIA_INFOS, True)
+
+# ******************************************************************
+def media_meta_update(from_event=False):
+    # Tags lesen; nur wenn sich etwas geaendert hat, wird der Media-Info-Screen neu gezeichnet
+    if media is None:
+        return False
+    if from_event:
+        media_meta["events"] = True
+    tags = {
+            "now_playing"   : media.get_meta(hal["vlc"].Meta.NowPlaying),
+            "title"         : media.get_meta(hal["vlc"].Meta.Title),
+            "genre"         : media.get_meta(hal["vlc"].Meta.Genre),
+    }
+    if all(media_meta[k] == v for k, v in tags.items()):
+        return False
+    with state_lock:
+        media_meta.update(tags)
+    history_title(tags["now_playing"])
+    screen_changed("meta")
+    return True
+
+# ******************************************************************
+def history_title(title):
+    # neuer Titel (oder None) auf der aktuellen Station; vorherigen Eintrag abschliessen
+    now = int(time_ms()/1000)
+    if history_current["title"] is not None:
+        if history_current["title"] == title and history_current["uuid"] == history_station()[0]:
+            return
+        history_buffer.append((history_current["uuid"], history_current["station"], history_current["title"], history_current["start"], now))
+        history_current["title"] = None
+    if title:
+        history_current["uuid"], history_current["station"] = history_station()
+        history_current["title"] = title
+        history_current["start"] = now
+
+# ******************************************************************
+def history_station():
+    station = stations[config["station_idx"]]
+    return station.uuid, station.name
+
+# ******************************************************************
+def history_flush(close=False):
+    # gesammelte Eintraege in einer Transaktion schreiben; close schliesst auch den laufenden Titel ab
+    if close:
+        history_title(None)
+    if not history_buffer:
+        return
+    rows = list(history_buffer)
+    history_buffer.clear()
+    try:
+        db_write("insert into history (stationuuid, station, title, start_time, end_time) values (?, ?, ?, ?, ?)", rows)
+    except (sqlite3.Error, OSError) as e:
+        print(f"History: {e}")
+
+# ******************************************************************
+SQL_HISTORY_LAST = """select stationuuid, station, title, start_time, end_time from history
+                      order by start_time desc limit ?"""
+
+SQL_HISTORY_STATION = """select stationuuid, station, title, start_time, end_time from history
+                         where stationuuid = ? order by start_time desc limit ?"""
+
+SQL_HISTORY_RANGE = """select stationuuid, station, title, start_time, end_time from history
+                       where start_time >= ? and start_time < ? order by start_time"""
+
+def history_last(count=20):
+    return db_query(SQL_HISTORY_LAST, (count,))
+
+def history_by_station(uuid, count=20):
+    return db_query(SQL_HISTORY_STATION, (uuid, count))
+
+def history_range(start, end):
+    # start/end als Unix-Zeit (s) oder datetime
+    if isinstance(start, datetime):
+        start = int(start.timestamp())
+    if isinstance(end, datetime):
+        end = int(end.timestamp())
+    return db_query(SQL_HISTORY_RANGE, (start, end))
+
+# ******************************************************************
+def caching_get(idx):
+    # gelernte network-caching (ms) der Station idx; beim ersten Mal aus der DB
+    station = stations[idx]
+    key = station.uuid or station.url
+    entry = caching_values.get(key)
+    if entry is None:
+        entry = {"caching" : CACHING_DEFAULT, "bad" : 0, "underruns" : 0}
+        if station.uuid:
+            try:
+                rows = db_query(SQL_CACHING_GET, (station.uuid,))
+                if rows:
+                    entry = {"caching" : rows[0]["caching_ms"], "bad" : rows[0]["bad_ms"] or 0, "underruns" : rows[0]["underruns"]}
+            except (FileNotFoundError, sqlite3.Error) as e:
+                print(f"Caching: {e}")
+        caching_values[key] = entry
+    return entry["caching"]
+
+# ******************************************************************
+def caching_option(m, idx):
+    # Medien-Option fuer VLC setzen; Rueckgabe: verwendeter Wert
+    ms = caching_get(idx)
+    m.add_option(f":network-caching={ms}")
+    return ms
+
+# ******************************************************************
+def caching_watch(m, idx, ms, playing=False):
+    # ab jetzt die Statistik von m fuer Station idx auswerten (Zaehler relativ zum jetzigen Stand)
+    caching_state["media"] = None
+    caching_state["key"] = stations[idx].uuid or stations[idx].url
+    caching_state["uuid"] = stations[idx].uuid
+    caching_state["caching"] = ms
+    caching_state["lost"] = caching_lost(m)
+    caching_state["rebuffers"] = 0
+    caching_state["seen"] = 0
+    caching_state["rebuffering"] = False
+    caching_state["playing"] = playing
+    caching_state["clean"] = 0
+    caching_state["done"] = False
+    caching_state["media"] = m
+
+# ******************************************************************
+def caching_lost(m):
+    # verlorene Audio-Puffer laut libvlc (0, wenn keine Statistik verfuegbar)
+    stats = hal["vlc"].MediaStats()
+    try:
+        if m.get_stats(stats):
+            return stats.lost_abuffers
+    except Exception:
+        pass
+    return 0
+
+# ******************************************************************
+def player_buffering(event):
+    # VLC-Thread; Puffer laeuft nach dem Start leer --> ein Nachpuffern (nur zaehlen)
+    if not caching_state["playing"]:
+        return
+    if event.u.new_cache < 100:
+        if not caching_state["rebuffering"]:
+            caching_state["rebuffering"] = True
+            caching_state["rebuffers"] = caching_state["rebuffers"] + 1
+    else:
+        caching_state["rebuffering"] = False
+
+# ******************************************************************
+def caching_check():
+    # alle CACHING_CHECK_INTERVAL ms: Aussetzer seit der letzten Pruefung? Dann beim naechsten
+    # Start mehr puffern; nach CACHING_CLEAN_TIME ohne Aussetzer einen Schritt weniger
+    # (aber nicht bis zu einem Wert, bei dem es schon Aussetzer gab)
+    s = caching_state
+    m = s["media"]
+    if m is None or m is not media or not s["playing"] or s["done"]:
+        return
+    lost = caching_lost(m)
+    rebuffers = s["rebuffers"]
+    underrun = lost > s["lost"] or rebuffers > s["seen"]
+    s["lost"] = lost
+    s["seen"] = rebuffers
+    entry = caching_values[s["key"]]
+    if underrun:
+        caching_stats["underruns"] = caching_stats["underruns"] + 1
+        entry["underruns"] = entry["underruns"] + 1
+        entry["bad"] = max(entry["bad"], s["caching"])
+        ms = min(CACHING_MAX, int(s["caching"] * CACHING_UP))
+        if ms > entry["caching"]:
+            caching_stats["raised"] = caching_stats["raised"] + 1
+            entry["caching"] = ms
+        print(f"Caching: underrun at {s['caching']} ms, next start with {entry['caching']} ms")
+        caching_store(s["uuid"], entry)
+        s["done"] = True
+        return
+    s["clean"] = s["clean"] + CACHING_CHECK_INTERVAL
+    if s["clean"] >= CACHING_CLEAN_TIME:
+        s["done"] = True
+        ms = max(CACHING_MIN, int(s["caching"] * CACHING_DOWN))
+        if ms < entry["caching"] and ms > entry["bad"]:
+            caching_stats["lowered"] = caching_stats["lowered"] + 1
+            entry["caching"] = ms
+            caching_store(s["uuid"], entry)
+
+# ******************************************************************
+SQL_CACHING_GET = "select caching_ms, bad_ms, underruns from station_caching where stationuuid = ?"
+
+SQL_CACHING_PUT = """insert or replace into station_caching (stationuuid, caching_ms, bad_ms, underruns, updated)
+                     values (?, ?, ?, ?, ?)"""
+
+def caching_store(uuid, entry):
+    # nur Stationen aus der DB (Default-Stationen haben keine uuid, Wert bleibt im Speicher)
+    if not uuid:
+        return
+    try:
+        db_write(SQL_CACHING_PUT, [(uuid, entry["caching"], entry["bad"], entry["underruns"], int(time_ms()/1000))])
+    except (sqlite3.Error, OSError) as e:
+        print(f"Caching: {e}")
+
+# ******************************************************************
+def player_failover():
+    # naechste URL der aktuellen Station probieren; gibt es keine mehr, Station als tot markieren
+    global media
+    if not temps["application_on"]:
+        return
+    if player_failover_urls:
+        url = player_failover_urls.pop(0)
+        print(f"{stations[config['station_idx']].name}: stream error, failover to {url}")
+        media = vlc_instance.media_new(url)
+        caching_watch(media, config['station_idx'], caching_option(media, config['station_idx']))
+        media_attach_events(media)
+        player.set_media(media)
+        player.audio_set_volume(config["volume"])
+        player.play()
+    else:
+        print(f"{stations[config['station_idx']].name}: stream error, no more urls")
+        stream_health[stations[config['station_idx']].url] = {"ok" : False, "url" : None, "time" : time_ms()}
+
+# ******************************************************************
+def prebuffer_playing(event, p):
+    # VLC-Thread; manche Audio-Ausgaben setzen Mute beim Start zurueck
+    p.audio_set_mute(True)
+    p.audio_set_volume(0)
+
+# ******************************************************************
+def prebuffer_update():
+    # markierte Station (und ggf. Nachbarn) stumm vorpuffern; Anzahl und Bandbreite begrenzt
+    wanted = []
+    idx = temps["station_list_idx"]
+    candidates = [idx]
+    if PREBUFFER_NEIGHBOURS:
+        candidates = candidates + [idx + 1, idx - 1]
+    kbits = 0
+    for i in candidates:
+        if i < 0 or i >= STATIONS_COUNT or i == config["station_idx"]:
+            continue
+        if len(wanted) >= PREBUFFER_MAX:
+            break
+        rate = stations.details(i).get("bitrate") or PREBUFFER_DEFAULT_KBITS
+        if kbits + rate > PREBUFFER_MAX_KBITS:
+            continue
+        kbits = kbits + rate
+        wanted.append(i)
+    # nicht mehr benoetigte Puffer beenden (Schluessel ist die Original-URL der Station)
+    wanted = {stations[i].url : i for i in wanted}
+    for url in list(prebuffers):
+        if url not in wanted:
+            prebuffer_stop(url)
+    for url, i in wanted.items():
+        if url not in prebuffers:
+            p = vlc_instance.media_player_new()
+            m = vlc_instance.media_new(player_url(i))
+            ms = caching_option(m, i)
+            p.set_media(m)
+            p.audio_set_mute(True)
+            p.audio_set_volume(0)
+            p.event_manager().event_attach(hal["vlc"].EventType.MediaPlayerPlaying, prebuffer_playing, p)
+            p.play()
+            prebuffers[url] = {"player" : p, "media" : m, "caching" : ms}
+
+# ******************************************************************
+def prebuffer_take(url):
+    # vorgepufferten Player fuer url aus der Liste nehmen (oder None)
+    pb = prebuffers.pop(url, None)
+    if pb is not None:
+        pb["player"].event_manager().event_detach(hal["vlc"].EventType.MediaPlayerPlaying)
+    return pb
+
+# ******************************************************************
+def prebuffer_stop(url):
+    pb = prebuffers.pop(url)
+    pb["player"].stop()
+    pb["player"].release()
+
+# ******************************************************************
+def prebuffer_stop_all():
+    cycle_stop("prebuffer")
+    for url in list(prebuffers):
+        prebuffer_stop(url)
+
 # ******************************************************************
 def player_stop():
     global player
-    player.stop()
+    prebuffer_stop_all()
+    caching_state["media"] = None
+    if player is not None:
+        player.stop()
 
 # ******************************************************************
 def player_set_volume():
@@ -318,47 +1345,628 @@ def player_set_volume():
     player.audio_set_volume(config["volume"])
 
 # ******************************************************************
-def sql_execute(sql):
-    l = []
+def db_connect():
+    # persistente read-only Verbindung des aktuellen Threads; wurde die DB-Datei
+    # ersetzt (z.B. neu erzeugt), wird neu verbunden
+    global db_schema_checked
+    st = os.stat(STATION_DB_FILE)        # FileNotFoundError, wenn keine DB da ist
+    con = getattr(db_local, "con", None)
+    if con is not None and db_local.ino == st.st_ino:
+        return con
+    db_close()
+    if db_schema_checked != st.st_ino:
+        rw = db_connect_rw()
+        try:
+            db_check_plan(rw)
+        finally:
+            rw.close()
+        db_schema_checked = st.st_ino
+    con = sqlite3.connect(f"file:{quote(STATION_DB_FILE)}?mode=ro", uri=True, timeout=DB_TIMEOUT)
+    con.row_factory = sqlite3.Row
+    db_local.con = con
+    db_local.ino = st.st_ino
+    return con
+
+# ******************************************************************
+def db_connect_rw():
+    # Schreib-Verbindung (legt DB ggf. an); WAL, damit Lesen nicht durch Schreiben 
+    # (Import etc.) blockiert wird, ausserdem Schema auf aktuellen Stand bringen
+    rw = sqlite3.connect(STATION_DB_FILE, timeout=DB_TIMEOUT, isolation_level=None)
     try:
-        db=sqlite3.connect(STATION_DB_FILE)
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        result = cursor.execute(sql)
-        for row in result:
-            l.append(row)
-        db.commit()
-        db.close()
+        rw.execute("pragma journal_mode=wal")
+        db_migrate(rw)
     except:
-        print("No station-db, load default stations!")
-    return l
+        rw.close()
+        raise
+    return rw
+
+# ******************************************************************
+def db_write(sql, params):
+    # Aenderungen in einer Transaktion; ohne DB passiert nichts
+    if not os.path.isfile(STATION_DB_FILE):
+        return 0
+    t = time.perf_counter()
+    con = db_connect_rw()
+    try:
+        con.execute("begin immediate")
+        try:
+            changed = con.executemany(sql, params).rowcount
+            con.execute("commit")
+        except:
+            con.execute("rollback")
+            raise
+    except sqlite3.Error:
+        db_stats["errors"] = db_stats["errors"] + 1
+        raise
+    finally:
+        con.close()
+        t = (time.perf_counter() - t) * 1000
+        db_stats["queries"] = db_stats["queries"] + 1
+        db_stats["time_ms"] = db_stats["time_ms"] + t
+        metrics_observe("db_ms", t, kind="write")
+    return changed
+
+# ******************************************************************
+def db_close():
+    con = getattr(db_local, "con", None)
+    if con is not None:
+        con.close()
+        db_local.con = None
+
+# ******************************************************************
+def db_query(sql, params=()):
+    # SQL-Texte sind Konstanten mit Parametern, damit sqlite3 die vorbereiteten
+    # Statements aus seinem Cache wiederverwendet
+    t = time.perf_counter()
+    try:
+        return db_connect().execute(sql, params).fetchall()
+    except sqlite3.Error:
+        db_stats["errors"] = db_stats["errors"] + 1
+        db_close()
+        raise
+    finally:
+        t = (time.perf_counter() - t) * 1000
+        db_stats["queries"] = db_stats["queries"] + 1
+        db_stats["time_ms"] = db_stats["time_ms"] + t
+        metrics_observe("db_ms", t, kind="read")
+
+# ******************************************************************
+# Spalten der Tabelle stations (wie radio-browser)
+STATION_COLUMNS = {
+            "changeuuid"            : "text",
+            "stationuuid"           : "text primary key",
+            "name"                  : "text not null default ''",
+            "url"                   : "text not null default ''",
+            "url_resolved"          : "text",
+            "homepage"              : "text",
+            "favicon"               : "text",
+            "tags"                  : "text",
+            "country"               : "text",
+            "countrycode"           : "text",
+            "state"                 : "text",
+            "language"              : "text",
+            "votes"                 : "integer",
+            "lastchangetime"        : "text",
+            "codec"                 : "text",
+            "bitrate"               : "integer",
+            "hls"                   : "integer",
+            "lastcheckok"           : "integer",
+            "lastchecktime"         : "text",
+            "lastcheckoktime"       : "text",
+            "lastlocalchecktime"    : "text",
+            "clicktimestamp"        : "text",
+            "clickcount"            : "integer",
+            "clicktrend"            : "integer",
+}
+
+# ******************************************************************
+def db_table_columns(con, table):
+    return [row[1] for row in con.execute(f"pragma table_info({table})")]
+
+# ******************************************************************
+def db_migration_1(con):
+    # stations mit Primaerschluessel und Index auf name; favorites mit Position
+    columns = ", ".join(f"{name} {decl}" for name, decl in STATION_COLUMNS.items())
+    con.execute(f"create table stations_new ({columns})")
+    old = [c for c in db_table_columns(con, "stations") if c in STATION_COLUMNS]
+    if old:
+        # bisherige (von Hand angelegte) Tabelle uebernehmen; Duplikate fallen raus
+        cols = ", ".join(old)
+        con.execute(f"insert or ignore into stations_new ({cols}) select {cols} from stations where stationuuid is not null")
+        con.execute("drop table stations")
+    con.execute("alter table stations_new rename to stations")
+    con.execute("create index stations_name on stations (name collate nocase)")
+    con.execute("create table favorites_new (stationuuid text primary key, position integer not null)")
+    if "stationuuid" in db_table_columns(con, "favorites"):
+        # bisherige Reihenfolge (nach Name sortiert) als Position uebernehmen
+        con.execute("""insert or ignore into favorites_new (stationuuid, position)
+                       select f.stationuuid, row_number() over (order by s.name, f.stationuuid) - 1
+                       from favorites f join stations s on s.stationuuid = f.stationuuid""")
+        con.execute("drop table favorites")
+    con.execute("alter table favorites_new rename to favorites")
+    con.execute("create index favorites_position on favorites (position)")
+
+# ******************************************************************
+def db_migration_2(con):
+    # Volltextindex (FTS5) ueber stations; Trigger halten ihn auch beim Import aktuell
+    con.execute("""create virtual table stations_fts using fts5 (name, tags, country, language, codec,
+                   content='stations', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')""")
+    con.execute("""create trigger stations_fts_ai after insert on stations begin
+                     insert into stations_fts (rowid, name, tags, country, language, codec)
+                     values (new.rowid, new.name, new.tags, new.country, new.language, new.codec);
+                   end""")
+    con.execute("""create trigger stations_fts_ad after delete on stations begin
+                     insert into stations_fts (stations_fts, rowid, name, tags, country, language, codec)
+                     values ('delete', old.rowid, old.name, old.tags, old.country, old.language, old.codec);
+                   end""")
+    con.execute("""create trigger stations_fts_au after update of name, tags, country, language, codec on stations begin
+                     insert into stations_fts (stations_fts, rowid, name, tags, country, language, codec)
+                     values ('delete', old.rowid, old.name, old.tags, old.country, old.language, old.codec);
+                     insert into stations_fts (rowid, name, tags, country, language, codec)
+                     values (new.rowid, new.name, new.tags, new.country, new.language, new.codec);
+                   end""")
+    con.execute("insert into stations_fts (stations_fts) values ('rebuild')")
+
+# ******************************************************************
+def db_migration_3(con):
+    # Verlauf der gespielten Titel (Zeiten als Unix-Zeit in s)
+    con.execute("""create table history (id integer primary key, stationuuid text, station text,
+                   title text not null, start_time integer not null, end_time integer)""")
+    con.execute("create index history_start on history (start_time)")
+    con.execute("create index history_station on history (stationuuid, start_time)")
+
+# ******************************************************************
+def db_migration_4(con):
+    # gelernte network-caching pro Station (bad_ms: groesster Wert, bei dem es Aussetzer gab)
+    con.execute("""create table station_caching (stationuuid text primary key, caching_ms integer not null,
+                   bad_ms integer, underruns integer not null default 0, updated integer)""")
+
+# ******************************************************************
+def db_migration_5(con):
+    # favorites.position darf beim Einfuegen fehlen (z.B. pyiradio.py, das nur stationuuid
+    # kennt): Station kommt dann ans Ende der Liste
+    con.execute("create table favorites_new (stationuuid text primary key, position integer)")
+    con.execute("insert into favorites_new (stationuuid, position) select stationuuid, position from favorites")
+    con.execute("drop table favorites")
+    con.execute("alter table favorites_new rename to favorites")
+    con.execute("create index favorites_position on favorites (position)")
+    con.execute("""create trigger favorites_position_ai after insert on favorites when new.position is null begin
+                     update favorites set position = (select coalesce(max(position), -1) + 1 from favorites)
+                     where rowid = new.rowid;
+                   end""")
+
+DB_MIGRATIONS = [
+            db_migration_1,
+            db_migration_2,
+            db_migration_3,
+            db_migration_4,
+            db_migration_5,
+]
+
+# ******************************************************************
+def db_migrate(con):
+    # fehlende Migrationen jeweils in einer eigenen Transaktion ausfuehren
+    version = con.execute("pragma user_version").fetchone()[0]
+    for i in range(version, len(DB_MIGRATIONS)):
+        print(f"station-db: migration to version {i + 1}")
+        con.execute("begin immediate")
+        try:
+            DB_MIGRATIONS[i](con)
+            con.execute(f"pragma user_version = {i + 1}")
+            con.execute("commit")
+        except:
+            con.execute("rollback")
+            raise
+
+# ******************************************************************
+SQL_FAVORITES_COUNT = "select count(*) from favorites f join stations s on s.stationuuid = f.stationuuid"
+
+SQL_FAVORITES_PROBE = """select s.stationuuid, s.url, s.url_resolved
+                         from favorites f join stations s on s.stationuuid = f.stationuuid"""
+
+SQL_FAVORITES_WINDOW = """select s.stationuuid, s.name, s.url
+                          from favorites f join stations s on s.stationuuid = f.stationuuid
+                          order by f.position
+                          limit ? offset ?"""
+
+SQL_STATION_DETAILS = """select stationuuid, name, url, url_resolved, favicon, country, state, language, codec, bitrate
+                         from stations
+                         where stationuuid = ?"""
+
+def db_favorites_count():
+    return db_query(SQL_FAVORITES_COUNT)[0][0]
+
+def db_favorites_window(start, count):
+    # Ausschnitt der Favoriten (Reihenfolge nach Position), nur uuid, Name und URL
+    return db_query(SQL_FAVORITES_WINDOW, (count, start))
+
+def db_station_details(uuid):
+    rows = db_query(SQL_STATION_DETAILS, (uuid,))
+    if rows:
+        return dict(rows[0])
+    return None
+
+# ******************************************************************
+# Trefferliste nach Relevanz (bm25; Name zaehlt mehr als Tags usw.), dann Name;
+# fuer eine Suche wird nur einmal sortiert, danach werden die Seiten ueber die rowids geholt
+SQL_SEARCH = """select stations_fts.rowid
+                from stations_fts join stations s on s.rowid = stations_fts.rowid
+                where stations_fts match ?
+                order by bm25(stations_fts, 10.0, 3.0, 2.0, 2.0, 1.0), s.name"""
+
+SQL_SEARCH_PAGE = """select rowid, stationuuid, name, url, url_resolved, favicon, country, state, language, codec, bitrate
+                     from stations
+                     where rowid in (select value from json_each(?))"""
+
+# letzte Suche (FTS5-Ausdruck, Stand der DB und sortierte rowids)
+db_search_cache = {"query" : None, "version" : None, "rowids" : None}
+
+def db_search_query(text):
+    # Eingabe in FTS5-Syntax: jedes Wort als Praefix, alle Woerter muessen passen
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"*' for w in words)
+
+def db_search_rowids(text):
+    query = db_search_query(text)
+    if not query:
+        return array("q")
+    # data_version aendert sich, sobald eine andere Verbindung (Import, Trigger...) schreibt
+    version = (db_query("pragma data_version")[0][0], getattr(db_local, "ino", None))
+    if db_search_cache["query"] != query or db_search_cache["version"] != version:
+        db_search_cache["rowids"] = array("q", (row[0] for row in db_query(SQL_SEARCH, (query,))))
+        db_search_cache["query"] = query
+        db_search_cache["version"] = version
+    return db_search_cache["rowids"]
+
+def db_search(text, page=0, count=STATION_LIST_MAX_COUNT):
+    # eine Seite der Trefferliste, genau so gross wie die Stationsliste auf dem Display
+    rowids = db_search_rowids(text)[page * count:(page + 1) * count]
+    if not rowids:
+        return []
+    rows = {row["rowid"] : row for row in db_query(SQL_SEARCH_PAGE, (json.dumps(rowids.tolist()),))}
+    return [rows[r] for r in rowids if r in rows]
+
+def db_search_count(text):
+    return len(db_search_rowids(text))
+
+# ******************************************************************
+def db_check_plan(con):
+    # Favoriten duerfen weder stations komplett durchsuchen noch extra sortieren muessen, die
+    # Abfragen des Verlaufs muessen ueber einen Index laufen; liefert die Liste der Beanstandungen
+    plans = (
+            ("favorites", SQL_FAVORITES_WINDOW, (STATION_PREFETCH, 0),
+             lambda detail: detail.startswith("SCAN s") or detail.startswith("SCAN stations")),
+            ("history", SQL_HISTORY_LAST, (20,), lambda detail: "INDEX history_start" not in detail),
+            ("history", SQL_HISTORY_STATION, ("", 20),
+             lambda detail: not detail.startswith("SEARCH history USING INDEX history_station")),
+            ("history", SQL_HISTORY_RANGE, (0, 1), lambda detail: not detail.startswith("SEARCH history")),
+    )
+    problems = []
+    for name, sql, params, slow in plans:
+        for row in con.execute(f"explain query plan {sql}", params):
+            detail = row[3]
+            if slow(detail) or "TEMP B-TREE" in detail:
+                problems.append(detail)
+                print(f"station-db: slow {name} query plan: {detail}")
+    return problems
+
+# ******************************************************************
+# groesstes einzelnes Element (Zeichen); eine Station hat ca. 1-2 kB, mehr deutet auf eine
+# kaputte Datei hin (z.B. nicht geschlossener String), die sonst komplett im Puffer landen wuerde
+JSON_MAX_ELEMENT_SIZE = 1 << 20
+
+def json_stream_array(f, chunk_size=65536, max_size=JSON_MAX_ELEMENT_SIZE):
+    # Elemente eines JSON-Arrays einzeln liefern, ohne die ganze Datei einzulesen
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    first = True
+    while True:
+        # Trennzeichen/Leerraum ueberspringen
+        while pos < len(buf) and buf[pos] in " \t\r\n,[":
+            if buf[pos] == "[":
+                started = True
+            pos = pos + 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        if pos < len(buf) and started:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                pos = end
+                yield obj
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            if started or buf[pos:].strip():
+                raise ValueError("unexpected end of JSON array")
+            return
+        if len(buf) - pos > max_size:
+            raise ValueError(f"JSON element larger than {max_size} characters")
+        # mehr lesen; schon verarbeiteten Teil des Puffers verwerfen
+        data = f.read(chunk_size)
+        eof = (data == "")
+        if first:
+            # Byte Order Mark (z.B. von Windows-Editoren) am Dateianfang ignorieren
+            data = data.removeprefix("\ufeff")
+            first = False
+        buf = buf[pos:] + data
+        pos = 0
+
+# ******************************************************************
+IMPORT_BATCH_SIZE = 5000
+
+def import_stations(filename, batch_size=IMPORT_BATCH_SIZE):
+    # radio-browser-Dump (JSON-Array, optional gzip) einlesen; vorhandene Stationen werden
+    # nur geschrieben, wenn sich changeuuid geaendert hat
+    import gzip
+    columns = list(STATION_COLUMNS)
+    sql = f"""insert into stations ({", ".join(columns)}) values ({", ".join("?" * len(columns))})
+              on conflict (stationuuid) do update set {", ".join(f"{c} = excluded.{c}" for c in columns if c != "stationuuid")}
+              where stations.changeuuid is not excluded.changeuuid"""
+    opener = gzip.open if filename.endswith(".gz") else open
+    con = db_connect_rw()
+    rows = 0
+    changed = 0
+    t = time.perf_counter()
+    try:
+        with opener(filename, "rt", encoding="utf-8") as f:
+            batch = []
+            for station in json_stream_array(f):
+                if not isinstance(station, dict) or not station.get("stationuuid"):
+                    continue
+                batch.append([station.get(c) for c in columns])
+                if len(batch) >= batch_size:
+                    changed = changed + import_batch(con, sql, batch)
+                    rows = rows + len(batch)
+                    batch = []
+                    print(f"{rows} stations, {rows / (time.perf_counter() - t):.0f} rows/s", end="\r")
+            if batch:
+                changed = changed + import_batch(con, sql, batch)
+                rows = rows + len(batch)
+    finally:
+        con.close()
+    t = time.perf_counter() - t
+    print(f"{rows} stations read, {changed} inserted/updated, {rows - changed} unchanged; {t:.1f} s, {rows / max(t, 0.001):.0f} rows/s")
+    return rows, changed
+
+# ******************************************************************
+def import_batch(con, sql, batch):
+    # ein Batch = eine Transaktion
+    con.execute("begin immediate")
+    try:
+        changed = con.executemany(sql, batch).rowcount
+        con.execute("commit")
+    except:
+        con.execute("rollback")
+        raise
+    return changed
+
+# ***********************************************************************************************
+class Station:
+    # kompakter Eintrag der Stationsliste
+    __slots__ = ("uuid", "name", "url")
+
+    def __init__(self, uuid, name, url):
+        self.uuid = uuid
+        self.name = name
+        self.url = url
+
+# ***********************************************************************************************
+class StationList:
+    # Stationsliste, die nie komplett im Speicher liegt: gehalten werden nur kompakte Eintraege
+    # in Fenstern (STATION_PREFETCH) rund um die zuletzt angesprochenen Indizes; alle anderen
+    # Spalten (Land, Codec, Logo...) werden bei Bedarf ueber details() nachgeladen.
+    # Ohne DB (defaults) stammen die Eintraege aus DEFAULT_STATIONS.
+    def __init__(self, count, defaults=None):
+        self.count = count
+        self.defaults = defaults
+        self.cache = OrderedDict()          # Index --> Station
+        self.details_cache = OrderedDict()  # uuid --> dict
+        self.error = None                   # letzter DB-Fehler (nur einmal ausgeben)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= self.count:
+            raise IndexError(idx)
+        station = self.cache.get(idx)
+        if station is None:
+            self.load_window(idx)
+            # DB hat sich seit dem Zaehlen geaendert (oder ist weg/gesperrt)? Dann Platzhalter
+            station = self.cache.get(idx, Station(None, "", ""))
+        else:
+            self.cache.move_to_end(idx)
+        return station
+
+    def load_window(self, idx):
+        start = max(0, idx - STATION_PREFETCH // 2)
+        if self.defaults is not None:
+            rows = [(None, d["name"], d["url"]) for d in self.defaults[start:start + STATION_PREFETCH]]
+        else:
+            try:
+                rows = db_favorites_window(start, STATION_PREFETCH)
+                self.error = None
+            except (OSError, sqlite3.Error) as e:
+                # nichts cachen, beim naechsten Zugriff wieder versuchen
+                self.db_error(e)
+                rows = []
+        for i, row in enumerate(rows, start):
+            self.cache[i] = Station(row[0], row[1], row[2])
+            self.cache.move_to_end(i)
+        while len(self.cache) > STATION_CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def db_error(self, e):
+        if str(e) != self.error:
+            self.error = str(e)
+            print(f"Station-db error ({e})")
+
+    def details(self, idx):
+        # alle Spalten einer Station als dict
+        if self.defaults is not None:
+            return dict(self.defaults[idx])
+        station = self[idx]
+        details = self.details_cache.get(station.uuid)
+        if details is None:
+            try:
+                details = db_station_details(station.uuid)
+            except (OSError, sqlite3.Error) as e:
+                self.db_error(e)
+                return {"stationuuid" : station.uuid, "name" : station.name, "url" : station.url, "favicon" : ""}
+            if details is None:
+                details = {"stationuuid" : station.uuid, "name" : station.name, "url" : station.url, "favicon" : ""}
+            self.details_cache[station.uuid] = details
+            while len(self.details_cache) > STATION_DETAILS_CACHE_SIZE:
+                self.details_cache.popitem(last=False)
+        else:
+            self.details_cache.move_to_end(station.uuid)
+        return details
 
 # ***********************************************************************************************
 def load_stations():
     global stations, STATIONS_COUNT
-    temp_stations = sql_execute("select * from stations where stationuuid in (select stationuuid from favorites) order by name")
-    if len(temp_stations) > 0:
-        stations = temp_stations
-        STATIONS_COUNT = len(stations)
-        # ...fuer den seltenen Fall, dass weniger Stationen eingelesen wurden, als der aktuelle interne Index meint
-        if (config["station_idx"] >= STATIONS_COUNT):
-            config["station_idx"] = 0
-            temps["station_list_idx"] = config["station_idx"]
-
-# ***********************************************************************************************
-def load_webimage(url, dx, dy, logo_name, cache_path, default_logo):
-    # Datei schon im Cache?
-    if os.path.isfile(f"{cache_path}{logo_name}.png"):
-        # ja, dann von dort laden
-        im = Image.open(f"{cache_path}{logo_name}.png")
-    else:
-        # nein, dann von URL laden
+    try:
+        count = db_favorites_count()
+    except FileNotFoundError:
+        print("No station-db, load default stations!")
+        count = 0
+    except (OSError, sqlite3.Error) as e:
+        # z.B. gesperrt: bisherige Liste behalten (falls es schon eine gibt)
+        print(f"Station-db error ({e})!")
+        count = None
+    if count:
+        stations = StationList(count)
+    elif count == 0 or stations is None:
+        # keine DB (mehr) oder keine Favoriten: wirklich auf die Default-Stationen umschalten
+        stations = StationList(len(DEFAULT_STATIONS), DEFAULT_STATIONS)
+    STATIONS_COUNT = len(stations)
+    # ...fuer den seltenen Fall, dass weniger Stationen eingelesen wurden, als der aktuelle interne Index meint
+    if (config["station_idx"] >= STATIONS_COUNT):
+        config["station_idx"] = 0
+        temps["station_list_idx"] = config["station_idx"]
+    station_list_window()
+
+# ***********************************************************************************************
+def http_read(response, limit, deadline):
+    # Antwort von urlopen() stueckweise lesen, hoechstens limit + 1 Bytes (zu gross erkennt der
+    # Aufrufer) und nur bis deadline (perf_counter); der timeout von urlopen() gilt nur pro
+    # Socket-Operation, ein Server, der Byte fuer Byte liefert, haelt sonst beliebig lange auf
+    sock = getattr(getattr(response.fp, "raw", None), "_sock", None)
+    chunks = []
+    size = 0
+    while size <= limit:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError("deadline exceeded")
+        if sock is not None:
+            sock.settimeout(remaining)
+        chunk = response.read1(min(HTTP_CHUNK_SIZE, limit + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size = size + len(chunk)
+    return b"".join(chunks)
+
+# ***********************************************************************************************
+def logo_download(url, filename, timeout=LOGO_FETCH_TIMEOUT):
+    # laeuft im Worker-Thread; timeout (s) gilt fuer den ganzen Download
+    deadline = time.perf_counter() + timeout
+    try:
+        with hal["http_open"](url, timeout) as response:
+            data = http_read(response, LOGO_FETCH_MAX_SIZE, deadline)
+        if len(data) > LOGO_FETCH_MAX_SIZE:
+            raise ValueError("logo too large")
+        im = Image.open(BytesIO(data))
+        im.load()
+        # erst temporaer speichern, damit nie eine halbe Datei im Cache liegt
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        im.save(f"{filename}.tmp", format="PNG")
+        os.replace(f"{filename}.tmp", filename)
+        logo_disk_evict(os.path.dirname(filename), LOGO_DISK_CACHE_MAX)
+        ok = True
+        logo_stats["downloads"] = logo_stats["downloads"] + 1
+    except Exception as e:
+        print(f"Logo {url}: {e}")
+        ok = False
+        logo_stats["download_errors"] = logo_stats["download_errors"] + 1
+    with logo_lock:
+        del logo_inflight[url]
+        if not ok:
+            logo_failed[url] = time_ms()
+    if ok:
+        post_event(logo_loaded, url)
+    return ok
+
+# ***********************************************************************************************
+def logo_fetch(url, filename):
+    # Download anstossen, wenn er nicht schon laeuft oder die URL kuerzlich fehlgeschlagen ist
+    with logo_lock:
+        if url in logo_inflight:
+            return logo_inflight[url]
+        if time_ms() - logo_failed.get(url, -LOGO_FAILED_RETRY) < LOGO_FAILED_RETRY:
+            return None
+        future = logo_executor.submit(logo_download, url, filename)
+        logo_inflight[url] = future
+        return future
+
+# ***********************************************************************************************
+def logo_loaded(url):
+    # Logo ist da; Hauptbildschirm neu zeichnen, wenn es dort gerade gebraucht wird
+    if stations.details(config['station_idx']).get('favicon') == url:
+        screen_changed("logo")
+
+# ***********************************************************************************************
+def logo_hash(url):
+    # Dateiname im Cache aus URL (Stationsnamen enthalten "/" und sind nicht eindeutig)
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+# ***********************************************************************************************
+def logo_disk_evict(cache_path, max_bytes):
+    # am laengsten nicht benutzte Dateien loeschen, bis Cache wieder klein genug ist
+    files = []
+    total = 0
+    with os.scandir(cache_path) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total = total + st.st_size
+    files.sort()
+    for mtime, size, path in files:
+        if total <= max_bytes:
+            break
         try:
-            im = Image.open(urlopen(url))
-            im.save(f"{cache_path}{logo_name}.png")
-        except:
-            # URL ist keine Bilddatei, also Default-Logo laden
-            im = Image.open(F"{default_logo}")
+            os.remove(path)
+            total = total - size
+        except OSError:
+            pass
+
+# ***********************************************************************************************
+def logo_mem_get(key):
+    with logo_lock:
+        im = logo_mem_cache.get(key)
+        if im is not None:
+            logo_mem_cache.move_to_end(key)
+            logo_stats["mem_hits"] = logo_stats["mem_hits"] + 1
+        else:
+            logo_stats["mem_misses"] = logo_stats["mem_misses"] + 1
+        return im
+
+# ***********************************************************************************************
+def logo_mem_put(key, im):
+    with logo_lock:
+        logo_mem_cache[key] = im
+        logo_mem_cache.move_to_end(key)
+        while len(logo_mem_cache) > LOGO_MEM_CACHE_SIZE:
+            logo_mem_cache.popitem(last=False)
+
+# ***********************************************************************************************
+def logo_resize(im, dx, dy, mode):
     # Groesse des Logo entsprechend (dx, dy) anpassen 
     im_x = im.width
     im_y = im.height
@@ -368,28 +1976,86 @@ def load_webimage(url, dx, dy, logo_name, cache_path, default_logo):
     if im_y != dy:
         im_x = round(im_x * dy/im_y)
         im_y = dy
-    im = im.resize((im_x, im_y), Image.LANCZOS)
-    # irgendetwas stimmt nicht mit den Farben!?!?! ...dehalb erstmal Graustufen...
-    return im.convert("L") # ??? --> https://pillow.readthedocs.io/en/stable/handbook/concepts.html#concept-modes
+    im = im.convert("RGBA").resize((im_x, im_y), Image.LANCZOS)
+    # transparente Bereiche auf Hintergrundfarbe
+    bg = Image.new("RGBA", im.size, COLOR_BACKGROUND_NORMAL + (255,))
+    return Image.alpha_composite(bg, im).convert(mode)
+
+# ***********************************************************************************************
+def load_webimage(url, dx, dy, cache_path, default_logo, mode="RGB"):
+    # 1. Stufe: fertiges Bild im Speicher?
+    im = logo_mem_get((url, dx, dy, mode))
+    if im is not None:
+        return im
+    if url:
+        h = logo_hash(url)
+        scaled_file = f"{cache_path}{h}_{dx}x{dy}.png"
+        orig_file = f"{cache_path}{h}.png"
+        try:
+            # 2. Stufe: skaliertes Bild auf Platte?
+            if os.path.isfile(scaled_file):
+                with Image.open(scaled_file) as f:
+                    im = f.convert(mode)
+                os.utime(scaled_file)
+            # ...sonst Original (einmalig) skalieren und Ergebnis ebenfalls ablegen
+            elif os.path.isfile(orig_file):
+                with Image.open(orig_file) as f:
+                    im = logo_resize(f, dx, dy, mode)
+                im.save(scaled_file, format="PNG")
+                os.utime(orig_file)
+                logo_disk_evict(cache_path, LOGO_DISK_CACHE_MAX)
+        except Exception as e:
+            print(f"Logo-Cache {url}: {e}")
+            im = None
+        if im is not None:
+            logo_stats["disk_hits"] = logo_stats["disk_hits"] + 1
+            logo_mem_put((url, dx, dy, mode), im)
+            return im
+        # nicht im Cache, dann im Hintergrund von URL laden
+        logo_fetch(url, orig_file)
+    # ...und erstmal Default-Logo anzeigen
+    im = logo_mem_get((default_logo, dx, dy, mode))
+    if im is None:
+        with Image.open(default_logo) as f:
+            im = logo_resize(f, dx, dy, mode)
+        logo_mem_put((default_logo, dx, dy, mode), im)
+    return im
 
 # ***********************************************************************************************
 def time_ms():
+    if hal["clock"] is not None:
+        return hal["clock"].time_ms()
     return time.time_ns()/1000000
 
+# ***********************************************************************************************
+def time_now():
+    # datetime passend zu time_ms() (bei headless virtuelle Zeit)
+    return datetime.fromtimestamp(time_ms()/1000)
+
 # ***********************************************************************************************
 def seconds_to_next_minute():
-    t = int(time.time())
+    t = int(time_ms()/1000)
     return 60 - (t - (int(t / 60) * 60))
 
 
 # ***********************************************************************************************
 def cycle_start(name, time, on):
-    cycles[name]["time"] = time
-    cycles[name]["start"] = on
+    global cycle_seq
+    with cycle_lock:
+        cycle_seq = cycle_seq + 1
+        cycles[name]["time"] = time
+        cycles[name]["start"] = on
+        cycles[name]["seq"] = cycle_seq
+        if on:
+            heapq.heappush(cycle_heap, (time, cycle_seq, name))
+    # Aufruf aus fremdem Thread? Dann Main-Loop wecken, damit neue Deadline beachtet wird
+    if threading.current_thread() is not threading.main_thread():
+        wakeup_queue.put(None)
     
 # ***********************************************************************************************
 def cycle_stop(name):
-    cycles[name]["start"] = False
+    with cycle_lock:
+        cycles[name]["start"] = False
 
 # ***********************************************************************************************
 def cycle_must_run(name):
@@ -398,19 +2064,200 @@ def cycle_must_run(name):
     else:
         return False
 
+# ***********************************************************************************************
+def cycle_next_deadline():
+    # veraltete Heap-Eintraege (gestoppt bzw. neu gestartet) verwerfen
+    with cycle_lock:
+        while cycle_heap:
+            t, seq, name = cycle_heap[0]
+            if cycles[name]["start"] and cycles[name]["seq"] == seq:
+                return t
+            heapq.heappop(cycle_heap)
+    return None
+
+# ***********************************************************************************************
+def post_event(handler, *args):
+    # Events (z.B. aus GPIO-Callbacks) werden im Main-Loop abgearbeitet
+    wakeup_queue.put((handler, args))
+
+# ***********************************************************************************************
+def cycle_wait():
+    # bis zur naechsten Deadline oder bis zum naechsten Event schlafen
+    deadline = cycle_next_deadline()
+    if hal["clock"] is not None:
+        cycle_wait_virtual(deadline)
+        return
+    if deadline is None:
+        timeout = None
+    else:
+        timeout = max(0, (deadline - time_ms())/1000)
+    try:
+        if timeout == 0:
+            event = wakeup_queue.get_nowait()
+        else:
+            event = wakeup_queue.get(timeout=timeout)
+            scheduler_stats["wakeups"] = scheduler_stats["wakeups"] + 1
+    except queue.Empty:
+        event = None
+    # alle anstehenden Events abarbeiten
+    had_event = False
+    while event is not None or not wakeup_queue.empty():
+        if event is not None:
+            had_event = True
+            scheduler_stats["events"] = scheduler_stats["events"] + 1
+            handler, args = event
+            handler(*args)
+        try:
+            event = wakeup_queue.get_nowait()
+        except queue.Empty:
+            event = None
+    # Aufgewacht, ohne dass es etwas zu tun gibt?
+    if timeout != 0 and not had_event:
+        deadline = cycle_next_deadline()
+        if deadline is None or deadline > time_ms():
+            scheduler_stats["idle_wakeups"] = scheduler_stats["idle_wakeups"] + 1
+            scheduler_stats["minute_idle_wakeups"] = scheduler_stats["minute_idle_wakeups"] + 1
+    # Idle-Wakeups pro Minute
+    if time_ms() - scheduler_stats["minute_start"] >= 60000:
+        scheduler_stats["idle_wakeups_per_min"] = scheduler_stats["minute_idle_wakeups"]
+        scheduler_stats["minute_idle_wakeups"] = 0
+        scheduler_stats["minute_start"] = time_ms()
+
+# ***********************************************************************************************
+def cycle_wait_virtual(deadline):
+    # virtuelle Zeit: nicht schlafen, sondern die Uhr bis zur naechsten Deadline bzw. zum
+    # naechsten Timer (Fake-Hardware) vorstellen; vorher muss der Render-Thread fertig sein
+    # (bzw. auf das Ende des vorigen Bildes in virtueller Zeit warten, das ist dann auch ein Timer)
+    pending = render_wait_virtual()
+    if wakeup_queue.empty():
+        timer = hal["clock"].next_timer()
+        if pending is not None and (timer is None or pending < timer):
+            timer = pending
+        if deadline is None or (timer is not None and timer < deadline):
+            deadline = timer
+        if deadline is None or (hal["until"] is not None and deadline > hal["until"]):
+            deadline = hal["until"]
+        if deadline is not None:
+            # auch bei "jetzt" faellige Timer ausfuehren
+            hal["clock"].advance_to(max(deadline, time_ms()))
+            scheduler_stats["wakeups"] = scheduler_stats["wakeups"] + 1
+    while True:
+        try:
+            event = wakeup_queue.get_nowait()
+        except queue.Empty:
+            break
+        if event is None:
+            continue
+        handler, args = event
+        scheduler_stats["events"] = scheduler_stats["events"] + 1
+        handler(*args)
+
+# ***********************************************************************************************
+class QuadratureDecoder:
+    # Drehimpulsgeber als Zustandsautomat (Gray-Code); unabhaengig von GPIO, damit aufgezeichnete
+    # Flankenfolgen nachgespielt werden koennen (siehe check-encoder).
+    # feed() wird pro Flanke mit den Pegeln von CLK/DT aufgerufen; Rastungen werden (beschleunigt)
+    # aufsummiert, bis der Main-Loop sie mit take() abholt.
+
+    # Index: (alter Zustand << 2) | neuer Zustand, Zustand = (CLK << 1) | DT
+    # +1/-1 gueltiger Schritt, 0 kein Wechsel bzw. ungueltig (Sprung ueber zwei Zustaende)
+    TRANSITIONS = (
+         0, +1, -1,  0,
+        -1,  0,  0, +1,
+        +1,  0,  0, -1,
+         0, -1, +1,  0,
+    )
+
+    def __init__(self, accel=(), state=ENCODER_REST_STATE):
+        self.accel = accel          # ((max. Abstand in ms, Faktor), ...) aufsteigend
+        self.state = state
+        self.steps = 0              # Teilschritte seit der letzten Rastung
+        self.last_detent = None     # Zeitpunkt (ms) der letzten Rastung
+        self.pending = 0            # noch nicht abgeholte (beschleunigte) Rastungen
+        self.posted = False         # Event fuer den Main-Loop unterwegs?
+        self.detents = 0            # Statistik: Rastungen bzw. Events an den Main-Loop
+        self.events = 0
+        self.lock = threading.Lock()
+
+    def feed(self, clk, dt, t):
+        # True, wenn der Main-Loop benachrichtigt werden muss
+        new = (clk << 1) | dt
+        with self.lock:
+            self.steps += self.TRANSITIONS[(self.state << 2) | new]
+            self.state = new
+            if new != ENCODER_REST_STATE:
+                return False
+            # in der Rastung angekommen: mehr als ein halber Zyklus in eine Richtung zaehlt
+            direction = 0
+            if self.steps >= ENCODER_STEPS_PER_DETENT // 2:
+                direction = 1
+            elif self.steps <= -(ENCODER_STEPS_PER_DETENT // 2):
+                direction = -1
+            self.steps = 0
+            if direction == 0:
+                return False
+            self.pending += direction * self.factor(t)
+            self.last_detent = t
+            self.detents += 1
+            if self.posted:
+                return False
+            self.posted = True
+            self.events += 1
+            return True
+
+    def factor(self, t):
+        if self.last_detent is not None:
+            interval = t - self.last_detent
+            for limit, factor in self.accel:
+                if interval <= limit:
+                    return factor
+        return 1
+
+    def take(self):
+        with self.lock:
+            delta = self.pending
+            self.pending = 0
+            self.posted = False
+            return delta
+
+# ***********************************************************************************************
+def encoder_turn(decoder, handler):
+    # alle seit dem letzten Aufruf gesammelten Rastungen in einem Schritt verarbeiten
+    delta = decoder.take()
+    if delta != 0:
+        handler(delta)
+
+
 # ***********************************************************************************************
 def encoder_volume(direction):
     
     # radio on/off
     if (direction == 0):
-        temps["application_on"] = not temps["application_on"]
+        with state_lock:
+            temps["application_on"] = not temps["application_on"]
         if temps["application_on"]:
-            temps["main_screen_idx"] = 0
-            load_stations()                 # Stationen neu einlesen
-            settings_read()                 # Settings einlesen
+            player_start_time["event"] = "power-on"
+            player_start_time["time"] = time_ms()
+            # Start noch nicht ganz fertig (VLC, Stationen)?
+            if not boot_done.is_set():
+                boot_done.wait()
+            # VLC im Boot-Thread fehlgeschlagen: nochmal versuchen, sonst aus bleiben
+            if vlc_instance is None and not boot_try("vlc", player_setup):
+                print("power-on refused: no VLC")
+                player_start_time["event"] = None
+                with state_lock:
+                    temps["application_on"] = False
+                return
+            with state_lock:
+                temps["main_screen_idx"] = 0
+                load_stations()                 # Stationen neu einlesen
+                settings_read()                 # Settings einlesen
+                station_list_window()
             cycle_stop("display_app_off")
             cycle_start("display_main", 0 , True)
-            cycle_start("display_media_infos", time_ms() + 20000 , True)
+            cycle_start("probe_streams", time_ms() + PROBE_FIRST_DELAY, True)
+            cycle_start("history_flush", time_ms() + HISTORY_FLUSH_INTERVAL, True)
+            cycle_start("caching_check", time_ms() + CACHING_CHECK_INTERVAL, True)
             player_start()
         else:
             cycle_stop("display_main")
@@ -418,24 +2265,22 @@ def encoder_volume(direction):
             cycle_stop("display_stations")
             cycle_stop("reset_temp_station_idx")
             cycle_stop("display_media_infos")
+            cycle_stop("probe_streams")
+            cycle_stop("history_flush")
+            cycle_stop("caching_check")
             cycle_start("display_app_off", 0 , True)
             player_stop()
+            history_flush(close=True)
             settings_write()                # Settings schreiben
             pass
         return
         
     if temps["application_on"]:
-        if (direction < 0):
-            if (config["volume"] >= 5):
-                config["volume"] = config["volume"] - 5
-            else:
-                config["volume"] = 0
-        elif (direction > 0):
-            if (config["volume"] <= 95):
-                config["volume"] = config["volume"] + 5
-            else:
-                config["volume"] = 100
+        # direction: Anzahl (beschleunigter) Rastungen mit Vorzeichen
+        with state_lock:
+            config["volume"] = min(VOLUME_MAX, max(VOLUME_MIN, config["volume"] + direction * VOLUME_STEP))
         player_set_volume()
+        settings_changed()
         cycle_start("display_volume", 0 , True)
 
 # ***********************************************************************************************
@@ -445,182 +2290,582 @@ def encoder_selection(direction):
         if (direction == 0):
             # Button zum Umschalten Screen oder Auswahl Station?
             if temps["station_list"]:
-                config["station_idx"] = temps["station_list_idx"]
-                temps["main_screen_idx"] = 0
+                player_start_time["event"] = "select"
+                player_start_time["time"] = time_ms()
+                with state_lock:
+                    config["station_idx"] = temps["station_list_idx"]
+                    temps["main_screen_idx"] = 0
                 # ~ player_stop()
                 player_start()
+                settings_changed()
                 cycle_stop("reset_temp_station_idx")
             else:
-                temps["main_screen_idx"] = (temps["main_screen_idx"] + 1) % MAIN_SCREENS
+                with state_lock:
+                    temps["main_screen_idx"] = (temps["main_screen_idx"] + 1) % len(SCREENS)
             cycle_start("display_main", 0, True)
             return
             
-        if (direction < 0):
-            if (temps["station_list_idx"] > 0):
-                temps["station_list_idx"] = temps["station_list_idx"] - 1
-        elif (direction > 0):
-            if (temps["station_list_idx"] < (STATIONS_COUNT - 1)):
-                temps["station_list_idx"] = temps["station_list_idx"] + 1
+        with state_lock:
+            temps["station_list_idx"] = min(STATIONS_COUNT - 1, max(0, temps["station_list_idx"] + direction))
+            station_list_window()
         cycle_start("display_stations", 0 , True)
+        if PREBUFFER_ENABLED:
+            cycle_start("prebuffer", time_ms() + PREBUFFER_DELAY, True)
 
 # ***********************************************************************************************
 def encoder_event(pin):
+    # laeuft im GPIO-Thread; Pegel hier auswerten, Verarbeitung im Main-Loop
     
     # Volume
-    if (pin == VOLUME_DT_PIN):
-        if (GPIO.input(VOLUME_DT_PIN) == 1) and (GPIO.input(VOLUME_CLK_PIN) == 0):
-            encoder_volume(1)
-         
-    elif (pin == VOLUME_CLK_PIN):
-        if (GPIO.input(VOLUME_DT_PIN) == 0) and (GPIO.input(VOLUME_CLK_PIN) == 1):
-            encoder_volume(-1)
+    if (pin == VOLUME_DT_PIN) or (pin == VOLUME_CLK_PIN):
+        if volume_decoder.feed(hal["gpio"].input(VOLUME_CLK_PIN), hal["gpio"].input(VOLUME_DT_PIN), time_ms()):
+            post_event(encoder_turn, volume_decoder, encoder_volume)
 
     elif (pin == VOLUME_SW_PIN):
-        if (GPIO.input(VOLUME_SW_PIN) == 0):
-            encoder_volume(0)
+        if (hal["gpio"].input(VOLUME_SW_PIN) == 0):
+            encoder_stats["presses"] = encoder_stats["presses"] + 1
+            post_event(encoder_volume, 0)
     
     # Selection
-    elif (pin == SELECTION_DT_PIN):
-        if (GPIO.input(SELECTION_DT_PIN) == 1) and (GPIO.input(SELECTION_CLK_PIN) == 0):
-            encoder_selection(1)
-         
-    elif (pin == SELECTION_CLK_PIN):
-        if (GPIO.input(SELECTION_DT_PIN) == 0) and (GPIO.input(SELECTION_CLK_PIN) == 1):
-            encoder_selection(-1)
+    elif (pin == SELECTION_DT_PIN) or (pin == SELECTION_CLK_PIN):
+        if selection_decoder.feed(hal["gpio"].input(SELECTION_CLK_PIN), hal["gpio"].input(SELECTION_DT_PIN), time_ms()):
+            post_event(encoder_turn, selection_decoder, encoder_selection)
 
     elif (pin == SELECTION_SW_PIN):
-        if (GPIO.input(SELECTION_SW_PIN) == 0):
-            encoder_selection(0)
+        if (hal["gpio"].input(SELECTION_SW_PIN) == 0):
+            encoder_stats["presses"] = encoder_stats["presses"] + 1
+            post_event(encoder_selection, 0)
 
 # ***********************************************************************************************
 def encoder_setup():
-    GPIO.setmode(GPIO.BCM)
+    global volume_decoder, selection_decoder
+    hal["gpio"].setmode(hal["gpio"].BCM)
+    # Drehung: beide Flanken ohne bouncetime, Prellen faengt der Zustandsautomat ab
     # Volume
-    GPIO.setup(VOLUME_DT_PIN, GPIO.IN)
-    GPIO.setup(VOLUME_CLK_PIN, GPIO.IN)
-    GPIO.add_event_detect(VOLUME_DT_PIN, GPIO.RISING, callback=encoder_event, bouncetime=1)
-    GPIO.add_event_detect(VOLUME_CLK_PIN, GPIO.RISING, callback=encoder_event, bouncetime=1)
-    GPIO.setup(VOLUME_SW_PIN,GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.add_event_detect(VOLUME_SW_PIN, GPIO.FALLING, callback=encoder_event, bouncetime=10)
+    hal["gpio"].setup(VOLUME_DT_PIN, hal["gpio"].IN)
+    hal["gpio"].setup(VOLUME_CLK_PIN, hal["gpio"].IN)
+    volume_decoder = QuadratureDecoder(ENCODER_ACCEL_VOLUME, (hal["gpio"].input(VOLUME_CLK_PIN) << 1) | hal["gpio"].input(VOLUME_DT_PIN))
+    hal["gpio"].add_event_detect(VOLUME_DT_PIN, hal["gpio"].BOTH, callback=encoder_event)
+    hal["gpio"].add_event_detect(VOLUME_CLK_PIN, hal["gpio"].BOTH, callback=encoder_event)
+    hal["gpio"].setup(VOLUME_SW_PIN,hal["gpio"].IN, pull_up_down=hal["gpio"].PUD_UP)
+    hal["gpio"].add_event_detect(VOLUME_SW_PIN, hal["gpio"].FALLING, callback=encoder_event, bouncetime=10)
     # Selection
-    GPIO.setup(SELECTION_DT_PIN, GPIO.IN)
-    GPIO.setup(SELECTION_CLK_PIN, GPIO.IN)
-    GPIO.add_event_detect(SELECTION_DT_PIN, GPIO.RISING, callback=encoder_event, bouncetime=1)
-    GPIO.add_event_detect(SELECTION_CLK_PIN, GPIO.RISING, callback=encoder_event, bouncetime=1)
-    GPIO.setup(SELECTION_SW_PIN,GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.add_event_detect(SELECTION_SW_PIN, GPIO.FALLING, callback=encoder_event, bouncetime=10)
+    hal["gpio"].setup(SELECTION_DT_PIN, hal["gpio"].IN)
+    hal["gpio"].setup(SELECTION_CLK_PIN, hal["gpio"].IN)
+    selection_decoder = QuadratureDecoder(ENCODER_ACCEL_SELECTION, (hal["gpio"].input(SELECTION_CLK_PIN) << 1) | hal["gpio"].input(SELECTION_DT_PIN))
+    hal["gpio"].add_event_detect(SELECTION_DT_PIN, hal["gpio"].BOTH, callback=encoder_event)
+    hal["gpio"].add_event_detect(SELECTION_CLK_PIN, hal["gpio"].BOTH, callback=encoder_event)
+    hal["gpio"].setup(SELECTION_SW_PIN,hal["gpio"].IN, pull_up_down=hal["gpio"].PUD_UP)
+    hal["gpio"].add_event_detect(SELECTION_SW_PIN, hal["gpio"].FALLING, callback=encoder_event, bouncetime=10)
  
 # ***********************************************************************************************
 def tft_setup(): 
     global disp, draw, font, font_b, font_20, font_20_b,img, WIDTH, HEIGHT
-    disp = st7735.ST7735(port=0, cs=0, dc=23, rst=24, width=128, height=160, rotation=0, offset_left=0, offset_top=0, invert=False)
+    disp = hal["display"].ST7735(port=0, cs=0, dc=23, rst=24, width=128, height=160, rotation=0, offset_left=0, offset_top=0, invert=False)
     disp.begin()
     WIDTH = disp.width
     HEIGHT = disp.height
-    img = Image.new('RGB', (WIDTH, HEIGHT))
+    img = tft_buffers_setup(WIDTH, HEIGHT)
     draw = ImageDraw.Draw(img)
     draw.fontmode = "L"   
-    font = ImageFont.truetype(FONT_NORMAL, size=11)
-    font_b = ImageFont.truetype(FONT_BOLD, size=11)
-    font_20 = ImageFont.truetype(FONT_NORMAL, size=20)
-    font_20_b = ImageFont.truetype(FONT_BOLD, size=20)
+    # fuer den Off-Bildschirm; die fetten Fonts laedt tft_fonts_bold() im Hintergrund
+    font = tft_font(FONT_NORMAL, 11)
+    font_20 = tft_font(FONT_NORMAL, 20)
+
+# ***********************************************************************************************
+def tft_fonts_bold():
+    global font_b, font_20_b
+    font_b = tft_font(FONT_BOLD, 11)
+    font_20_b = tft_font(FONT_BOLD, 20)
+
+# ***********************************************************************************************
+def tft_font(name, size):
+    # ohne DejaVu (z.B. headless auf einem CI-Rechner) den eingebauten Font nehmen
+    try:
+        return ImageFont.truetype(name, size=size)
+    except OSError:
+        if not hal["headless"]:
+            raise
+        return ImageFont.load_default(size=size)
+
+# ***********************************************************************************************
+def text_cache_get(key, make):
+    # LRU fuer Layout (Zeilen, Breiten) und fertig gerasterte Texte; nur im Render-Thread benutzt
+    value = text_cache.get(key)
+    if value is not None:
+        text_cache.move_to_end(key)
+        text_stats["hits"] = text_stats["hits"] + 1
+        return value
+    text_stats["misses"] = text_stats["misses"] + 1
+    value = make()
+    text_cache[key] = value
+    while len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+        text_stats["evictions"] = text_stats["evictions"] + 1
+    return value
+
+# ***********************************************************************************************
+def text_wrap(text, width):
+    return text_cache_get(("wrap", text, width), lambda: textwrap.wrap(text, width))
+
+# ***********************************************************************************************
+def text_length(text, fnt):
+    return text_cache_get(("len", text, fnt), lambda: draw.textlength(text, font=fnt))
+
+# ***********************************************************************************************
+def text_sprite(text, fnt, fill, bg, frac, box):
+    # Text einmal auf seinen Hintergrund rastern: (Bild, Versatz der Bounding-Box); frac ist
+    # der Nachkomma-Anteil der Position (PIL rastert Glyphen subpixelgenau), box wie bei
+    # draw.rectangle(textbbox) inklusive rechter/unterer Kante
+    def make():
+        x0, y0, x1, y1 = draw.textbbox(frac, text, font=fnt)
+        x0, y0 = math.floor(x0), math.floor(y0)
+        x1, y1 = math.ceil(x1) + box, math.ceil(y1) + box
+        sprite = Image.new(img.mode, (max(1, x1 - x0), max(1, y1 - y0)), bg)
+        d = ImageDraw.Draw(sprite)
+        d.fontmode = draw.fontmode
+        d.text((frac[0] - x0, frac[1] - y0), text, font=fnt, fill=fill)
+        return sprite, (x0, y0)
+    return text_cache_get(("sprite", text, fnt, fill, bg, frac, box), make)
+
+# ***********************************************************************************************
+def tft_text(xy, text, fnt, fill, bg=COLOR_BACKGROUND_NORMAL, box=False):
+    # statt draw.text(): Sprite aus dem Cache einfuegen; bg muss dort schon liegen, ausser
+    # bei box (Text mit eigenem Hintergrund, z.B. Label oder markierte Station)
+    if not text:
+        return
+    x, y = math.floor(xy[0]), math.floor(xy[1])
+    sprite, (dx, dy) = text_sprite(text, fnt, fill, bg, (xy[0] - x, xy[1] - y), int(box))
+    img.paste(sprite, (x + dx, y + dy))
+
+# ***********************************************************************************************
+def tft_text_centered(y, text, fnt, fill, bg=COLOR_BACKGROUND_NORMAL):
+    tft_text(((WIDTH - text_length(text, fnt))/2, y), text, fnt, fill, bg)
+
+# ***********************************************************************************************
+def tft_clock_bar(now):
+    # Uhrzeit-Leiste als fertiger Streifen; neu gezeichnet wird nur, wenn die Minute wechselt
+    date_time = now.strftime("%a; %d.%m.%y; %H:%M")
+    if clock_bar["text"] != date_time:
+        strip = Image.new(img.mode, (WIDTH, 15), COLOR_BACKGROUND_CLOCK_BAR)
+        d = ImageDraw.Draw(strip)
+        d.fontmode = draw.fontmode
+        d.text(((WIDTH-text_length(date_time, font))/2, 0), date_time,  font=font, fill=COLOR_TEXT_CLOCK_BAR)
+        clock_bar["text"] = date_time
+        clock_bar["strip"] = strip
+        text_stats["clock_renders"] = text_stats["clock_renders"] + 1
+    img.paste(clock_bar["strip"], (0, 0))
+
+# ***********************************************************************************************
+def tft_buffers_setup(width, height, shared=True):
+    # alle Puffer fuer Bildaufbau und Umwandlung nach RGB565 einmalig anlegen;
+    # das gelieferte Bild (RGBX) teilt sich seinen Speicher mit tft_rgbx (shared=False
+    # oder wenn der Selbsttest scheitert: eigenes Bild, tft_push() kopiert dann jedes Mal)
+    global tft_frame_buf, tft_rgbx, tft_img, tft_shared, tft_cur, tft_last, tft_diff, tft_scratch, tft_out_buf, tft_out, tft_full_push
+    tft_frame_buf = bytearray(width * height * 4)
+    tft_rgbx = np.frombuffer(tft_frame_buf, dtype=np.uint8).reshape(height, width, 4)
+    tft_shared = shared and tft_shared_image(width, height)
+    if not tft_shared:
+        tft_img = Image.new("RGBX", (width, height))
+    tft_cur = np.zeros((height, width), dtype=np.uint16)
+    tft_last = np.zeros((height, width), dtype=np.uint16)
+    tft_diff = np.zeros((height, width), dtype=bool)
+    tft_scratch = np.zeros((height, width), dtype=np.uint16)
+    tft_out_buf = bytearray(width * height * 2)
+    tft_out = np.frombuffer(tft_out_buf, dtype=">u2")
+    tft_full_push = True
+    return tft_img
+
+# ***********************************************************************************************
+def tft_shared_image(width, height):
+    # Bild direkt auf tft_frame_buf anlegen; "readonly = 0" ist ein internes Attribut von
+    # Pillow (getestet mit 9.x bis 12.x), daher einen Punkt zeichnen und im numpy-Array
+    # nachsehen - klappt das nicht, zeichnet PIL in eine eigene Kopie (False)
+    global tft_img
+    tft_img = Image.frombuffer("RGBX", (width, height), tft_frame_buf, "raw", "RGBX", 0, 1)
+    tft_img.readonly = 0    # direkt in tft_frame_buf zeichnen (sonst legt PIL eine Kopie an)
+    try:
+        ImageDraw.Draw(tft_img).point((0, 0), fill=(1, 2, 3))
+        ok = tuple(tft_rgbx[0, 0, :3]) == (1, 2, 3)
+    except Exception:
+        ok = False
+    tft_rgbx[0, 0] = 0
+    if not ok:
+        print("tft: Pillow draws into a copy, falling back to copying every frame")
+    return ok
+
+# ***********************************************************************************************
+def tft_rgb565(rgbx, out, scratch):
+    # RGB(X) (numpy-Array) --> RGB565 in vorhandenes uint16-Array (ohne neue Puffer)
+    if TFT_SWAP_RB:
+        r = rgbx[:, :, 2]
+        b = rgbx[:, :, 0]
+    else:
+        r = rgbx[:, :, 0]
+        b = rgbx[:, :, 2]
+    np.bitwise_and(r, 0xF8, out=out)
+    np.left_shift(out, 8, out=out)
+    np.bitwise_and(rgbx[:, :, 1], 0xFC, out=scratch)
+    np.left_shift(scratch, 3, out=scratch)
+    np.bitwise_or(out, scratch, out=out)
+    np.right_shift(b, 3, out=scratch)
+    np.bitwise_or(out, scratch, out=out)
+    return out
+
+# ***********************************************************************************************
+def tft_changed_boxes(diff, gap=TFT_BAND_GAP):
+    # geaenderte Bereiche (Maske diff) als Liste von (x0, y0, x1, y1) (inklusive)
+    rows = np.flatnonzero(diff.any(axis=1))
+    boxes = []
+    if len(rows) == 0:
+        return boxes
+    bands = []
+    y0 = y1 = rows[0]
+    for y in rows[1:]:
+        if y - y1 > gap:
+            bands.append((y0, y1))
+            y0 = y
+        y1 = y
+    bands.append((y0, y1))
+    for y0, y1 in bands:
+        cols = np.flatnonzero(diff[y0:y1+1].any(axis=0))
+        boxes.append((int(cols[0]), int(y0), int(cols[-1]), int(y1)))
+    return boxes
+
+# ***********************************************************************************************
+def tft_push(display, image):
+    # statt display.display(image): nur die Bereiche senden, die sich gegenueber dem
+    # zuletzt uebertragenen Bild geaendert haben (Rotation 0 vorausgesetzt)
+    global tft_full_push
+    if image is tft_img and tft_shared:
+        rgbx = tft_rgbx
+    else:
+        # fremdes Bild (nicht im gemeinsamen Puffer), also erst umkopieren
+        tft_rgbx[:, :, :3] = np.asarray(image.convert("RGB"))
+        rgbx = tft_rgbx
+    tft_rgb565(rgbx, tft_cur, tft_scratch)
+    height, width = tft_cur.shape
+    if tft_full_push:
+        boxes = [(0, 0, width - 1, height - 1)]
+        tft_full_push = False
+    else:
+        np.not_equal(tft_cur, tft_last, out=tft_diff)
+        boxes = tft_changed_boxes(tft_diff)
+    count = 0
+    for x0, y0, x1, y1 in boxes:
+        n = (x1 - x0 + 1) * (y1 - y0 + 1)
+        # Fenster big-endian in festen Ausgabepuffer kopieren
+        tft_out[:n].reshape(y1 - y0 + 1, x1 - x0 + 1)[...] = tft_cur[y0:y1+1, x0:x1+1]
+        data = memoryview(tft_out_buf)[:2*n]
+        display.set_window(x0, y0, x1, y1)
+        for i in range(0, len(data), TFT_CHUNK_SIZE):
+            display.data(data[i:i+TFT_CHUNK_SIZE])
+        count = count + len(data)
+    np.copyto(tft_last, tft_cur)
+    tft_stats["frames"] = tft_stats["frames"] + 1
+    tft_stats["windows"] = tft_stats["windows"] + len(boxes)
+    tft_stats["bytes"] = tft_stats["bytes"] + count
+    tft_stats["last_bytes"] = count
+    return count
+
+
+
+
+# ***********************************************************************************************
+def station_list_window():
+    # welcher Bereich der Liste soll angezeigt werden? (nur unter state_lock aufrufen)
+    if (temps["station_list_idx"] < temps["station_list_top"]) :
+        temps["station_list_top"] = temps["station_list_idx"]
+        temps["station_list_bottom"] = temps["station_list_top"] + STATION_LIST_MAX_COUNT
+        
+    if ((temps["station_list_idx"] + 1) > temps["station_list_bottom"]):
+        temps["station_list_bottom"] = temps["station_list_idx"] + 1
+        temps["station_list_top"] = temps["station_list_bottom"] - STATION_LIST_MAX_COUNT
+        
+    if temps["station_list_bottom"] > STATIONS_COUNT:
+        temps["station_list_bottom"] = STATIONS_COUNT
+
+# ***********************************************************************************************
+def state_snapshot():
+    # konsistente Kopie aller Werte, die die tft_display_*-Funktionen brauchen
+    with state_lock:
+        st = dict(config)
+        st.update(temps)
+        if stations is None:
+            # Start: Stationen werden noch im Hintergrund geladen (Off-Bildschirm braucht sie nicht)
+            st["station"] = {}
+            st["station_window"] = []
+            st["stations_count"] = 0
+        else:
+            st["station"] = dict(stations.details(config["station_idx"]))
+            st["station_window"] = [(stations[i].name, station_dead(i)) for i in range(temps["station_list_top"], min(temps["station_list_bottom"], STATIONS_COUNT))]
+            st["stations_count"] = STATIONS_COUNT
+        st["meta"] = dict(media_meta)
+    return st
+
+# ***********************************************************************************************
+def render_request(screen, overlay=False, st=None):
+    # Auftrag in den Briefkasten legen; ein noch nicht gezeichneter Auftrag wird ersetzt,
+    # ein neues Vollbild verwirft auch ein noch ausstehendes Overlay-Fenster
+    job = (screen, st if st is not None else state_snapshot())
+    if screen is not tft_display_main:
+        # Hauptbildschirm ist (teilweise) verdeckt, danach also auf jeden Fall neu zeichnen
+        screen_last["key"] = None
+    with render_cond:
+        render_stats["requests"] = render_stats["requests"] + 1
+        if overlay:
+            if render_mailbox["overlay"] is not None:
+                render_stats["dropped"] = render_stats["dropped"] + 1
+            render_mailbox["overlay"] = job
+        else:
+            for slot in ("main", "overlay"):
+                if render_mailbox[slot] is not None:
+                    render_stats["dropped"] = render_stats["dropped"] + 1
+                    render_mailbox[slot] = None
+            render_mailbox["main"] = job
+        render_cond.notify_all()
+
+# ***********************************************************************************************
+def render_worker():
+    # einziger Thread, der in img zeichnet und das Display anspricht
+    while True:
+        with render_cond:
+            while not render_ready():
+                render_cond.wait()
+            main = render_mailbox["main"]
+            overlay = render_mailbox["overlay"]
+            render_mailbox["main"] = None
+            render_mailbox["overlay"] = None
+            render_stats["busy"] = True
+            started = time_ms()
+        cost = time.perf_counter()
+        try:
+            if main is not None:
+                t = time.perf_counter()
+                main[0](main[1])
+                metrics_observe("render_ms", (time.perf_counter() - t) * 1000, screen=render_name(main))
+            if overlay is not None:
+                t = time.perf_counter()
+                overlay[0](overlay[1])
+                metrics_observe("render_ms", (time.perf_counter() - t) * 1000, screen=render_name(overlay))
+            t = time.perf_counter()
+            tft_push(disp, img)
+            metrics_observe("push_ms", (time.perf_counter() - t) * 1000)
+            if hal["headless"]:
+                disp.end_frame()
+            render_stats["frames"] = render_stats["frames"] + 1
+            if render_stats["frames"] == 1:
+                boot_mark("first frame")
+        except Exception as e:
+            print(f"Render: {e}")
+        with render_cond:
+            render_stats["busy"] = False
+            if hal["render_scale"] is not None:
+                render_stats["free_at"] = started + (time.perf_counter() - cost) * 1000 * hal["render_scale"]
+            render_cond.notify_all()
+
+# ***********************************************************************************************
+def render_ready():
+    # (nur unter render_cond) liegt ein Auftrag vor, den der Render-Thread jetzt zeichnen darf?
+    # In virtueller Zeit erst, wenn das vorige Bild "fertig gezeichnet" ist (hal["render_scale"]),
+    # sonst wuerden Auftraege nie zusammengefasst bzw. verworfen
+    if render_mailbox["main"] is None and render_mailbox["overlay"] is None:
+        return False
+    return render_stats["flush"] or hal["render_scale"] is None or time_ms() >= render_stats["free_at"]
+
+# ***********************************************************************************************
+def render_name(job):
+    # Bildschirmname fuer die Metriken (Hauptbildschirme nach Registry, sonst Funktionsname)
+    func, st = job
+    if func is tft_display_main:
+        return SCREENS[st["main_screen_idx"] % len(SCREENS)]["name"]
+    return func.__name__.replace("tft_display_", "")
+
+# ***********************************************************************************************
+def render_wait_idle():
+    # warten, bis alle angeforderten Bilder gezeichnet sind (headless, virtuelle Zeit; z.B. am
+    # Ende eines Laufs), auch wenn das vorige Bild in virtueller Zeit noch nicht fertig waere
+    with render_cond:
+        render_stats["flush"] = True
+        render_cond.notify_all()
+        while render_stats["busy"] or render_mailbox["main"] is not None or render_mailbox["overlay"] is not None:
+            render_cond.wait()
+        render_stats["flush"] = False
 
 # ***********************************************************************************************
-def tft_display_main(): 
+def render_wait_virtual():
+    # warten, bis der Render-Thread nichts mehr tun darf (virtuelle Zeit); liefert die
+    # virtuelle Zeit, zu der ein noch wartender Auftrag gezeichnet werden kann (oder None)
+    with render_cond:
+        render_cond.notify_all()
+        while render_stats["busy"] or render_ready():
+            render_cond.wait()
+        if render_mailbox["main"] is None and render_mailbox["overlay"] is None:
+            return None
+        return render_stats["free_at"]
+
+
+
+
+# ***********************************************************************************************
+def tft_display_main(st): 
     # Bildschirm loeschen
     draw.rectangle((0, 0, WIDTH, HEIGHT), outline=COLOR_BACKGROUND_NORMAL, fill=COLOR_BACKGROUND_NORMAL)
     # Datum/Uhrzeit auf jedem Screen
-    now = datetime.now()
-    date_time = now.strftime("%a; %d.%m.%y; %H:%M")
-    draw.rectangle((0, 0, WIDTH, 14), outline=COLOR_BACKGROUND_CLOCK_BAR, fill=COLOR_BACKGROUND_CLOCK_BAR)
-    draw.text(((WIDTH-draw.textlength(date_time, font=font))/2, 0), date_time,  font=font, fill=COLOR_TEXT_CLOCK_BAR)
+    tft_clock_bar(time_now())
     # ~ draw.line([(0, 14), (WIDTH, 14)], fill=(255, 255, 255))
 
     # entsprechenden Screen anzeigen
-    if (temps["main_screen_idx"] == 0):
-        # Stationsname und Logo
-        y = 20
-        for line in textwrap.wrap(stations[config['station_idx']]['name'], 15):
-            draw.text(((WIDTH-draw.textlength(line, font=font_b))/2, y), line,  font=font_b, fill=COLOR_TEXT_NORMAL)
-            y = y +15
-        y = y + 5
-        logo_img = load_webimage(stations[config['station_idx']]['favicon'], 90, HEIGHT-y, stations[config['station_idx']]['name'], PATH_LOGO_CACHE, DEFAULT_LOGO)
-        img.paste(logo_img, (int((WIDTH-logo_img.width)/2), int(HEIGHT-logo_img.height)))
-        
-    elif (temps["main_screen_idx"] == 1):
-        # Media-Infos aus Stream
-        try:
-            y = 20
-            for line in textwrap.wrap(media.get_meta(Meta.NowPlaying), 18):
-                draw.text((5, y), line, font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            y = y + 5
-        except:
-            pass
-        try:
-            for line in textwrap.wrap(media.get_meta(Meta.Title), 18):
-                draw.text((5, y), line, font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            y = y + 5
-        except:
-            pass
-        try:
-            for line in textwrap.wrap(media.get_meta(Meta.Genre), 18):
-                draw.text((5, y), line, font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-        except:
-            pass
+    SCREENS[st["main_screen_idx"]]["render"](st)
+
+# ***********************************************************************************************
+def screen_station(st):
+    # Stationsname und Logo
+    y = 20
+    for line in text_wrap(st['station']['name'], 15):
+        tft_text_centered(y, line, font_b, COLOR_TEXT_NORMAL)
+        y = y +15
+    y = y + 5
+    logo_img = load_webimage(st['station']['favicon'], 90, HEIGHT-y, PATH_LOGO_CACHE, DEFAULT_LOGO)
+    img.paste(logo_img, (int((WIDTH-logo_img.width)/2), int(HEIGHT-logo_img.height)))
 
-    elif (temps["main_screen_idx"] == 2):
-        # Infos aus Stations-DB
+# ***********************************************************************************************
+def screen_media(st):
+    # Media-Infos aus Stream
+    try:
         y = 20
-        for line in textwrap.wrap(stations[config['station_idx']]['name'], 15):
-            draw.text(((WIDTH-draw.textlength(line, font=font_b))/2, y), line,  font=font_b, fill=COLOR_TEXT_NORMAL)
+        for line in text_wrap(st['meta']['now_playing'], 18):
+            tft_text((5, y), line, font, COLOR_TEXT_NORMAL)
             y = y + 15
         y = y + 5
-        try:
-            if len(stations[config['station_idx']]['country']) > 0:
-                draw.text((5, y), stations[config['station_idx']]['country'][0:20],  font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            if len(stations[config['station_idx']]['state']) > 0:
-                draw.text((5, y), stations[config['station_idx']]['state'][0:20],  font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            if len(stations[config['station_idx']]['language']) > 0:
-                draw.text((5, y), stations[config['station_idx']]['language'][0:20],  font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            if len(stations[config['station_idx']]['codec']) > 0:
-                draw.text((5, y), stations[config['station_idx']]['codec'],  font=font, fill=COLOR_TEXT_NORMAL)
-                y = y + 15
-            draw.text((5, y), F"{stations[config['station_idx']]['bitrate']}Kb/s",  font=font, fill=COLOR_TEXT_NORMAL)
-        except:
-            draw.text((5, y), "no database...",  font=font, fill=COLOR_TEXT_NORMAL)
+    except:
+        pass
+    try:
+        for line in text_wrap(st['meta']['title'], 18):
+            tft_text((5, y), line, font, COLOR_TEXT_NORMAL)
+            y = y + 15
+        y = y + 5
+    except:
+        pass
+    try:
+        for line in text_wrap(st['meta']['genre'], 18):
+            tft_text((5, y), line, font, COLOR_TEXT_NORMAL)
+            y = y + 15
+    except:
+        pass
+
+# ***********************************************************************************************
+def screen_details(st):
+    # Infos aus Stations-DB
+    y = 20
+    for line in text_wrap(st['station']['name'], 15):
+        tft_text_centered(y, line, font_b, COLOR_TEXT_NORMAL)
+        y = y + 15
+    y = y + 5
+    try:
+        if len(st['station']['country']) > 0:
+            tft_text((5, y), st['station']['country'][0:20], font, COLOR_TEXT_NORMAL)
+            y = y + 15
+        if len(st['station']['state']) > 0:
+            tft_text((5, y), st['station']['state'][0:20], font, COLOR_TEXT_NORMAL)
+            y = y + 15
+        if len(st['station']['language']) > 0:
+            tft_text((5, y), st['station']['language'][0:20], font, COLOR_TEXT_NORMAL)
+            y = y + 15
+        if len(st['station']['codec']) > 0:
+            tft_text((5, y), st['station']['codec'], font, COLOR_TEXT_NORMAL)
+            y = y + 15
+        tft_text((5, y), F"{st['station']['bitrate']}Kb/s", font, COLOR_TEXT_NORMAL)
+    except:
+        tft_text((5, y), "no database...", font, COLOR_TEXT_NORMAL)
+
+# ***********************************************************************************************
+def screen_tech(st):
+    # dies und das
+    tft_text((15, 30), "techn. Zeugs...", font, (255, 255, 255))
+    tft_text((15, 50), f"station_idx = {st['station_idx']}", font, COLOR_TEXT_NORMAL)
+    tft_text((15, 65), f"temp_st_idx = {st['station_list_idx']}", font, COLOR_TEXT_NORMAL)
+    tft_text((15, 80), f"volume = {st['volume']}", font, COLOR_TEXT_NORMAL)
+    tft_text((15, 95), f"main_screen = {st['main_screen_idx']}", font, COLOR_TEXT_NORMAL)
+    tft_text((15, 110), f"idle/min = {scheduler_stats['idle_wakeups_per_min']}", font, COLOR_TEXT_NORMAL)
+    tft_text((15, 125), f"spi = {tft_stats['last_bytes']} B", font, COLOR_TEXT_NORMAL)
+    lookups = text_stats["hits"] + text_stats["misses"]
+    tft_text((15, 140), f"text hits = {100 * text_stats['hits'] // max(1, lookups)}%", font, COLOR_TEXT_NORMAL)
+
+# ***********************************************************************************************
+def screen_register(name, render, refresh=None, depends=()):
+    # Hauptbildschirm anmelden: render(st) zeichnet unterhalb der Uhrzeit-Leiste, refresh (ms)
+    # erzwingt regelmaessiges Neuzeichnen, depends nennt die Eingaben (siehe SCREEN_INPUTS bzw.
+    # screen_changed()); gezeichnet wird nur, wenn sich eine davon geaendert hat
+    SCREENS.append({"name" : name, "render" : render, "refresh" : refresh, "depends" : ("minute",) + tuple(depends)})
+
+SCREENS = []
+screen_register("station", screen_station, depends=("station", "logo"))
+screen_register("media",   screen_media,   depends=("meta",))
+screen_register("details", screen_details, depends=("details",))
+screen_register("tech",    screen_tech,    refresh=5000, depends=("station", "volume", "stats"))
+
+# ***********************************************************************************************
+# Eingaben der Hauptbildschirme (Wert aus dem Zustand; Aenderung --> neu zeichnen)
+SCREEN_INPUTS = {
+            "minute"    : lambda st: time_now().strftime("%Y%m%d%H%M"),
+            "station"   : lambda st: (st["station_idx"], st["station"].get("name"), st["station"].get("favicon")),
+            "details"   : lambda st: tuple(sorted(st["station"].items())),
+            "meta"      : lambda st: (st["meta"]["now_playing"], st["meta"]["title"], st["meta"]["genre"]),
+            "volume"    : lambda st: st["volume"],
+            "stats"     : lambda st: (scheduler_stats["idle_wakeups_per_min"], tft_stats["last_bytes"],
+                                      text_stats["hits"] * 100 // max(1, text_stats["hits"] + text_stats["misses"])),
+}
 
-    elif (temps["main_screen_idx"] == 3):
-        # dies und das
-        draw.text((15, 30), "techn. Zeugs...",  font=font, fill=(255, 255, 255))
-        draw.text((15, 50), f"station_idx = {config['station_idx']}",  font=font, fill=COLOR_TEXT_NORMAL)
-        draw.text((15, 65), f"temp_st_idx = {temps['station_list_idx']}",  font=font, fill=COLOR_TEXT_NORMAL)
-        draw.text((15, 80), f"volume = {config['volume']}",  font=font, fill=COLOR_TEXT_NORMAL)
-        draw.text((15, 95), f"main_screen = {temps['main_screen_idx']}",  font=font, fill=COLOR_TEXT_NORMAL)
+# zuletzt gezeichneter Hauptbildschirm: (Index, Eingaben); None --> muss neu gezeichnet werden
+screen_last = {"key" : None, "dirty" : set()}
+screen_stats = {"renders" : 0, "skipped" : 0}
+
+# ***********************************************************************************************
+def screen_changed(dep):
+    # Eingabe ohne Zustandswert (z.B. Logo fertig geladen) bzw. Aenderung von aussen: neu
+    # zeichnen, wenn der aktuelle Hauptbildschirm davon abhaengt und gerade sichtbar ist
+    screen = SCREENS[temps["main_screen_idx"]]
+    if (dep in screen["depends"] and temps["application_on"] and
+        not temps["station_list"] and not temps["volume_window"]):
+        screen_last["dirty"].add(dep)
+        cycle_start("display_main", 0, True)
 
-    disp.display(img)
+# ***********************************************************************************************
+def screen_update():
+    # Hauptbildschirm nur zeichnen, wenn sich eine seiner Eingaben geaendert hat;
+    # liefert den Zeitpunkt (ms) fuer die naechste Pruefung
+    idx = temps["main_screen_idx"]
+    screen = SCREENS[idx]
+    st = state_snapshot()
+    key = (idx, tuple(SCREEN_INPUTS[dep](st) for dep in screen["depends"] if dep in SCREEN_INPUTS))
+    if key != screen_last["key"] or screen_last["dirty"]:
+        render_request(tft_display_main, st=st)
+        screen_last["key"] = key
+        screen_last["dirty"].clear()
+        screen_stats["renders"] = screen_stats["renders"] + 1
+    else:
+        screen_stats["skipped"] = screen_stats["skipped"] + 1
+    t = time_ms() + seconds_to_next_minute()*1000
+    if screen["refresh"] is not None:
+        t = min(t, time_ms() + screen["refresh"])
+    return t
 
 # ***********************************************************************************************
-def tft_display_app_off(): 
+def tft_display_app_off(st): 
     #Bildschirm loeschen
     draw.rectangle((0, 0, WIDTH, HEIGHT), outline=COLOR_BACKGROUND_NORMAL, fill=COLOR_BACKGROUND_NORMAL)
     # Datum/Uhrzeit anzeigen
-    now = datetime.now()
+    now = time_now()
     date = now.strftime("%a, %d.%m.%Y")
-    draw.text(((WIDTH-draw.textlength(date, font=font))/2, 60), date,  font=font, fill=COLOR_TEXT_NORMAL)
+    tft_text_centered(60, date, font, COLOR_TEXT_NORMAL)
     time = now.strftime("%H:%M")
-    draw.text(((WIDTH-draw.textlength(time, font=font_20))/2, 80), time,  font=font_20, fill=COLOR_TEXT_NORMAL)
-    disp.display(img)
+    tft_text_centered(80, time, font_20, COLOR_TEXT_NORMAL)
 
 # ***********************************************************************************************
-def tft_display_volume(): 
+def tft_display_volume(st): 
 
-    txt = F"Volume: {config['volume']}"
+    txt = F"Volume: {st['volume']}"
     txt_font = font
    
     dx_space = 5
@@ -633,16 +2878,13 @@ def tft_display_volume():
     # Fenster mit Label
     draw.rectangle((x, y, WIDTH-x, y + 6*dy_space), outline=COLOR_FRAME_WINDOW, fill=COLOR_BACKGROUND_WINDOW)
 
-    draw.rectangle((draw.textbbox((x+1, y-1), txt, font=txt_font, language="de-DE")), outline=COLOR_BACKGROUND_LABEL_WINDOW, fill=COLOR_BACKGROUND_LABEL_WINDOW)
-    draw.text((x+1, y-1), txt,  font=txt_font, fill=COLOR_TEXT_LABEL_WINDOW)
+    tft_text((x+1, y-1), txt, txt_font, COLOR_TEXT_LABEL_WINDOW, COLOR_BACKGROUND_LABEL_WINDOW, box=True)
     
     # ...auch hier sollte man noch kuerzen koennen!!!
-    draw.rectangle((x+dx_space, y+3*dy_space, x+dx_space + ((WIDTH - (x+dx_space)) - (x+dx_space)) * config["volume"]/VOLUME_MAX, y+3*dy_space+dy_bar), outline=COLOR_VOLUME_BAR, fill=COLOR_VOLUME_BAR)
+    draw.rectangle((x+dx_space, y+3*dy_space, x+dx_space + ((WIDTH - (x+dx_space)) - (x+dx_space)) * st["volume"]/VOLUME_MAX, y+3*dy_space+dy_bar), outline=COLOR_VOLUME_BAR, fill=COLOR_VOLUME_BAR)
 
-    disp.display(img)
-    
 # ***********************************************************************************************
-def tft_display_stations(): 
+def tft_display_stations(st): 
 
     label_font = font
 
@@ -653,111 +2895,378 @@ def tft_display_stations():
 
     # Fenster mit Label
     draw.rectangle((dx_space, dy_space, WIDTH-dx_space, HEIGHT-dy_space), outline=COLOR_FRAME_WINDOW, fill=COLOR_BACKGROUND_WINDOW)
-    draw.rectangle((draw.textbbox((dx_space+1, dy_space-1), "Stations:", font=label_font, language="de-DE")), outline=COLOR_BACKGROUND_LABEL_WINDOW, fill=COLOR_BACKGROUND_LABEL_WINDOW)
-    draw.text((dx_space+1, dy_space-1), "Stations:",  font=label_font, fill=COLOR_TEXT_LABEL_WINDOW)
-    
-    # welcher Bereich der Liste soll angezeigt wrden?
-    if (temps["station_list_idx"] < temps["station_list_top"]) :
-        temps["station_list_top"] = temps["station_list_idx"]
-        temps["station_list_bottom"] = temps["station_list_top"] + STATION_LIST_MAX_COUNT
-        
-    if ((temps["station_list_idx"] + 1) > temps["station_list_bottom"]):
-        temps["station_list_bottom"] = temps["station_list_idx"] + 1
-        temps["station_list_top"] = temps["station_list_bottom"] - STATION_LIST_MAX_COUNT
-        
-    if temps["station_list_bottom"] > STATIONS_COUNT:
-        temps["station_list_bottom"] = STATIONS_COUNT
+    tft_text((dx_space+1, dy_space-1), "Stations:", label_font, COLOR_TEXT_LABEL_WINDOW, COLOR_BACKGROUND_LABEL_WINDOW, box=True)
     
     # Pfeil oben/unten anzeigen, wenn da noch was ist, was nicht angezeigt wird
     t = ""
-    if temps["station_list_top"] > 0:
+    if st["station_list_top"] > 0:
         t = f"{chr(8593)}"  # Pfeil hoch
-    if temps["station_list_bottom"] < STATIONS_COUNT:
+    if st["station_list_bottom"] < st["stations_count"]:
         t = f"{t}{chr(8595)}"  # Pfeil runter
-    draw.text((WIDTH-dx_space - 4*dx_space, dy_space + 2), t, font=font, fill=COLOR_TEXT_NORMAL)
+    tft_text((WIDTH-dx_space - 4*dx_space, dy_space + 2), t, font, COLOR_TEXT_NORMAL, COLOR_BACKGROUND_WINDOW)
 
     # entsprechenden Ausschnitt der Stationsliste anzeigen
     x = 2*dx_space
     y = dy_space + 20
-    for i in range(temps["station_list_top"], temps["station_list_bottom"]):
-        # aktuelle (angewaehlte) Station hervorheben oder eben nicht
-        if i == temps["station_list_idx"]:
-            draw.rectangle((draw.textbbox((x, y), stations[i]["name"][0:max_str_len], font=font)), outline=COLOR_BACKGROUND_SELECTED_STATION, fill=COLOR_BACKGROUND_SELECTED_STATION)
-            draw.text((x, y), stations[i]["name"][0:max_str_len],  font=font, fill=COLOR_TEXT_SELECTED_STATION)
+    for i, (name, dead) in enumerate(st["station_window"], st["station_list_top"]):
+        # aktuelle (angewaehlte) Station hervorheben oder eben nicht; tote Streams grau
+        if i == st["station_list_idx"]:
+            tft_text((x, y), name[0:max_str_len], font, COLOR_TEXT_SELECTED_STATION, COLOR_BACKGROUND_SELECTED_STATION, box=True)
         else:
-            draw.text((x, y), stations[i]["name"][0:max_str_len],  font=font, fill=COLOR_TEXT_WINDOW)
+            tft_text((x, y), name[0:max_str_len], font, COLOR_TEXT_DEAD_STATION if dead else COLOR_TEXT_WINDOW, COLOR_BACKGROUND_WINDOW)
         y = y + 15
     
-    disp.display(img)
 
 # ***********************************************************************************************
 def reset_temp_station_idx():
-    temps["station_list_idx"] = config["station_idx"]
+    with state_lock:
+        temps["station_list_idx"] = config["station_idx"]
+        station_list_window()
+
+# ***********************************************************************************************
+# ***********************************************************************************************
+# ***********************************************************************************************
+
+
+# ***********************************************************************************************
+class Histogram:
+    # Verteilung von Dauern (ms); Buckets wie bei Prometheus (obere Grenzen, kumulativ ausgegeben)
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS_MS) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(METRICS_BUCKETS_MS, value)] += 1
+        self.sum = self.sum + value
+        self.count = self.count + 1
+
+    def buckets(self):
+        total = 0
+        result = []
+        for bound, n in zip(METRICS_BUCKETS_MS + ("+Inf",), self.counts):
+            total = total + n
+            result.append((bound, total))
+        return result
+
+# ***********************************************************************************************
+def metrics_observe(name, ms, **labels):
+    # Dauer in Histogramm eintragen (kostet nur ein bisect, auch wenn niemand abfragt)
+    key = (name, tuple(sorted(labels.items())))
+    h = metrics_hist.get(key)
+    if h is None:
+        h = metrics_hist.setdefault(key, Histogram())
+    h.observe(ms)
+
+# ***********************************************************************************************
+def metrics_vlc():
+    # Stream-Statistik von libvlc; wird nur bei einer Abfrage geholt
+    m = media
+    if m is None or not hasattr(hal["vlc"], "MediaStats"):
+        return {}
+    stats = hal["vlc"].MediaStats()
+    try:
+        if not m.get_stats(stats):
+            return {}
+    except Exception:
+        return {}
+    return {k : getattr(stats, k) for k in METRICS_VLC_FIELDS}
 
 # ***********************************************************************************************
+def metrics_collect():
+    # alle Zaehler/Statistiken als ein dict (fuer JSON und Prometheus)
+    groups = {
+            "scheduler"     : scheduler_stats,
+            "render"        : render_stats,
+            "tft"           : tft_stats,
+            "text_cache"    : text_stats,
+            "screen"        : screen_stats,
+            "logo"          : logo_stats,
+            "db"            : db_stats,
+            "encoder"       : encoder_stats,
+            "caching"       : caching_stats,
+    }
+    values = {}
+    for group, stats in groups.items():
+        for k, v in list(stats.items()):
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and k not in METRICS_SKIP:
+                values[f"{group}_{k}"] = v
+    for name, decoder in (("volume", volume_decoder), ("selection", selection_decoder)):
+        if decoder is not None:
+            values[f"encoder_{name}_detents"] = decoder.detents
+            values[f"encoder_{name}_events"] = decoder.events
+            values[f"encoder_{name}_coalesced"] = decoder.detents - decoder.events
+    values["logo_mem_cache_size"] = len(logo_mem_cache)
+    values["text_cache_size"] = len(text_cache)
+    values["prebuffers"] = len(prebuffers)
+    values["history_buffered"] = len(history_buffer)
+    values["streams_probed"] = len(stream_health)
+    values["streams_dead"] = sum(1 for h in list(stream_health.values()) if not h["ok"])
+    values["application_on"] = int(temps["application_on"])
+    values["boot_errors"] = len(boot_errors)
+    for k, v in metrics_vlc().items():
+        values[f"vlc_{k}"] = v
+    hist = {}
+    for (name, labels), h in list(metrics_hist.items()):
+        hist.setdefault(name, []).append({"labels" : dict(labels), "buckets" : h.buckets(), "sum" : round(h.sum, 3), "count" : h.count})
+    return {"values" : values, "histograms" : hist, "boot" : boot_timeline}
+
 # ***********************************************************************************************
+def metrics_prometheus():
+    # Textformat fuer Prometheus (alle Namen mit Praefix iradio_)
+    m = metrics_collect()
+    lines = []
+    for k, v in m["values"].items():
+        lines.append(f"iradio_{k} {v}")
+    for name, entries in m["histograms"].items():
+        lines.append(f"# TYPE iradio_{name} histogram")
+        for e in entries:
+            labels = "".join(f'{k}="{v}",' for k, v in e["labels"].items())
+            for bound, n in e["buckets"]:
+                lines.append(f'iradio_{name}_bucket{{{labels}le="{bound}"}} {n}')
+            labels = labels.rstrip(",")
+            lines.append(f"iradio_{name}_sum{{{labels}}} {e['sum']}")
+            lines.append(f"iradio_{name}_count{{{labels}}} {e['count']}")
+    return "\n".join(lines) + "\n"
+
 # ***********************************************************************************************
+def metrics_start(port=METRICS_PORT, addr=METRICS_ADDR):
+    # lokaler HTTP-Endpunkt /metrics; Arbeit faellt nur bei einer Abfrage an
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = metrics_prometheus().encode("utf-8")
+                ctype = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body = json.dumps(metrics_collect(), indent=2).encode("utf-8")
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((addr, port), Handler)
+    except OSError as e:
+        print(f"Metrics: {addr}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+# ***********************************************************************************************
+def metrics_dump(SignalNumber=None, Frame=None):
+    # SIGUSR1: alle Metriken als JSON in METRICS_DUMP_FILE
+    try:
+        with open(f"{METRICS_DUMP_FILE}.tmp", "w") as f:
+            json.dump(metrics_collect(), f, indent=2)
+        os.replace(f"{METRICS_DUMP_FILE}.tmp", METRICS_DUMP_FILE)
+        print(f"metrics written to: {METRICS_DUMP_FILE}")
+    except OSError as e:
+        print(f"Metrics: {e}")
+
+# ***********************************************************************************************
+def boot_mark(stage, start=None):
+    # Boot-Zeitleiste: Zeitpunkt seit Skriptstart, bei start auch die Dauer der Stufe
+    now = time.perf_counter()
+    entry = {
+            "stage"     : stage,
+            "thread"    : threading.current_thread().name,
+            "at_ms"     : round((now - boot_t0) * 1000, 1),
+            "ms"        : round((now - start) * 1000, 1) if start is not None else None,
+    }
+    boot_timeline.append(entry)
+    duration = f"{entry['ms']:7.1f} ms" if start is not None else " " * 10
+    print(f"boot: {stage:16s} {duration}  (at {entry['at_ms']:7.1f} ms, {entry['thread']})")
 
+# ***********************************************************************************************
+def boot_stage(stage, func, *args):
+    t = time.perf_counter()
+    result = func(*args)
+    boot_mark(stage, t)
+    return result
 
-# Signalhandler
-signal.signal(signal.SIGINT,signal_handler)
-# ~ signal.signal(signal.SIGKILL,signal_handler)
-signal.signal(signal.SIGHUP,signal_handler)
-signal.signal(signal.SIGQUIT,signal_handler)
-# ~ signal.signal(signal.SIGSTOP,signal_handler)
-signal.signal(signal.SIGTERM,signal_handler)
-signal.signal(signal.SIGPWR,signal_handler)
+# ***********************************************************************************************
+def boot_try(stage, func, *args):
+    # Stufe im Boot-Thread; ein Fehler wird festgehalten (und ausgegeben), statt den Thread
+    # zu beenden - die uebrigen Stufen laufen trotzdem
+    try:
+        boot_stage(stage, func, *args)
+        boot_errors.pop(stage, None)
+        return True
+    except Exception as e:
+        boot_errors[stage] = f"{type(e).__name__}: {e}"
+        print(f"boot: {stage} failed ({boot_errors[stage]})")
+        return False
 
-# Initialisierung
-settings_read()
-encoder_setup()
-player_setup()
-tft_setup()
-load_stations()
+# ***********************************************************************************************
+def boot_worker():
+    # Hintergrund: alles, was erst zum Einschalten gebraucht wird
+    try:
+        boot_try("vlc", player_setup)
+        boot_try("fonts (bold)", tft_fonts_bold)
+        with state_lock:
+            boot_try("stations", load_stations)
+        if METRICS_PORT and not hal["headless"]:
+            boot_try("metrics", metrics_start)
+    finally:
+        boot_done.set()
+        boot_mark("boot done")
 
-# Endlos-Loop
-# ~ try:
-while True :
+# ***********************************************************************************************
+def app_setup():
+    # Signalhandler
+    signal.signal(signal.SIGINT,signal_handler)
+    # ~ signal.signal(signal.SIGKILL,signal_handler)
+    signal.signal(signal.SIGHUP,signal_handler)
+    signal.signal(signal.SIGQUIT,signal_handler)
+    # ~ signal.signal(signal.SIGSTOP,signal_handler)
+    signal.signal(signal.SIGTERM,signal_handler)
+    signal.signal(signal.SIGPWR,signal_handler)
+    signal.signal(signal.SIGUSR1,metrics_dump)
+
+    # Initialisierung in Stufen: zuerst Encoder und Off-Bildschirm (Uhr), VLC, fette Fonts
+    # und Stationen folgen im Hintergrund (Einschalten wartet ggf. darauf, siehe boot_done)
+    boot_mark("imports")
+    boot_stage("settings", settings_read)
+    boot_stage("encoder", encoder_setup)
+    boot_stage("display", tft_setup)
+    threading.Thread(target=render_worker, name="render", daemon=True).start()
+    threading.Thread(target=boot_worker, name="boot", daemon=True).start()
+
+    scheduler_stats["minute_start"] = time_ms()
 
-    # Fenster Lautstaerke
-    if cycle_must_run("display_volume"):
-        tft_display_volume()
-        cycle_stop("display_volume")
-        cycle_start("display_main", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
-        continue
+# ***********************************************************************************************
+def main_loop(until=None):
+    # Endlos-Loop; until (ms) nur fuer headless: Ende bei Erreichen der (virtuellen) Zeit
+    hal["until"] = until
+    # ~ try:
+    while until is None or time_ms() < until:
+
+        # bis zur naechsten Deadline bzw. zum naechsten Event warten
+        cycle_wait()
+
+        # Fenster Lautstaerke
+        if cycle_must_run("display_volume"):
+            temps["volume_window"] = True
+            render_request(tft_display_volume, overlay=True)
+            cycle_stop("display_volume")
+            cycle_start("display_main", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
+            continue
 
-    # Fenster Stationsliste
-    if cycle_must_run("display_stations"):
-        temps["station_list"] = True
-        tft_display_stations()
-        cycle_stop("display_stations")
-        cycle_start("reset_temp_station_idx", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
-        cycle_start("display_main", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
-        continue
+        # Fenster Stationsliste
+        if cycle_must_run("display_stations"):
+            temps["station_list"] = True
+            render_request(tft_display_stations, overlay=True)
+            cycle_stop("display_stations")
+            cycle_start("reset_temp_station_idx", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
+            cycle_start("display_main", time_ms() + TIMEOUT_CLOSE_WINDOW, True)
+            continue
         
-    # temporaeren Stations-Index zuruecksetzen, weil Select-Button nicht gedrueckt wurde
-    if cycle_must_run("reset_temp_station_idx"):
-        reset_temp_station_idx()
-        cycle_stop("reset_temp_station_idx")
-        continue
-
-    # Hauptbildschirm
-    if cycle_must_run("display_main"):
-        temps["station_list"] = False
-        tft_display_main()
-        cycle_start("display_main", time_ms() + seconds_to_next_minute()*1000, True)
-        # Media-Info-Screen oeffters aktualisieren
-        if (temps["main_screen_idx"] == 1) and (seconds_to_next_minute()*1000 > REFRESH_MEDIA_INFOS):
-            cycle_start("display_main", time_ms() + REFRESH_MEDIA_INFOS, True)
-        continue
+        # temporaeren Stations-Index zuruecksetzen, weil Select-Button nicht gedrueckt wurde
+        if cycle_must_run("reset_temp_station_idx"):
+            reset_temp_station_idx()
+            cycle_stop("reset_temp_station_idx")
+            prebuffer_stop_all()
+            continue
+
+        # Settings nach Ruhepause schreiben
+        if cycle_must_run("settings_write"):
+            settings_write()
+            continue
+
+        # Titel-Verlauf schreiben
+        if cycle_must_run("history_flush"):
+            history_flush()
+            cycle_start("history_flush", time_ms() + HISTORY_FLUSH_INTERVAL, True)
+            continue
+
+        # Aussetzer des laufenden Streams auswerten (network-caching lernen)
+        if cycle_must_run("caching_check"):
+            caching_check()
+            cycle_start("caching_check", time_ms() + CACHING_CHECK_INTERVAL, True)
+            continue
+
+        # Streams aller Favoriten im Hintergrund pruefen
+        if cycle_must_run("probe_streams"):
+            probe_start()
+            cycle_start("probe_streams", time_ms() + PROBE_INTERVAL, True)
+            continue
+
+        # markierte Station(en) der Stationsliste vorpuffern
+        if cycle_must_run("prebuffer"):
+            cycle_stop("prebuffer")
+            prebuffer_update()
+            continue
+
+        # Hauptbildschirm
+        if cycle_must_run("display_main"):
+            temps["station_list"] = False
+            temps["volume_window"] = False
+            cycle_start("display_main", screen_update(), True)
+            continue
+
+        # Metadaten abfragen, falls der Stream keine Events liefert (Neuzeichnen nur bei Aenderung)
+        if cycle_must_run("display_media_infos"):
+            # liefert VLC Metadaten-Events, wird nicht mehr abgefragt (bis zum naechsten Medium)
+            if media_meta["events"]:
+                cycle_stop("display_media_infos")
+            else:
+                media_meta_update()
+                cycle_start("display_media_infos", time_ms() + REFRESH_MEDIA_INFOS, True)
+            continue
     
-    # Off-Bildschirm
-    if cycle_must_run("display_app_off"):
-        tft_display_app_off()
-        cycle_start("display_app_off", time_ms() + seconds_to_next_minute()*1000, True)
-        continue
+        # Off-Bildschirm
+        if cycle_must_run("display_app_off"):
+            render_request(tft_display_app_off)
+            cycle_start("display_app_off", time_ms() + seconds_to_next_minute()*1000, True)
+            continue
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+# ***********************************************************************************************
+# ***********************************************************************************************
+# ***********************************************************************************************
 
-    sleep(0.05)
+if __name__ == "__main__":
+    # Kommandozeile: Hilfsfunktionen ohne Radio-Betrieb; Checks/Benchmarks in iradio_check.py
+    if len(sys.argv) > 1:
+        if sys.argv[1] == "import" and len(sys.argv) == 3:
+            import_stations(sys.argv[2])
+            exit()
+        # iradio_check importiert "iradio" - das ist dieses Modul (nicht ein zweites Exemplar)
+        sys.modules.setdefault("iradio", sys.modules[__name__])
+        import iradio_check
+        code = iradio_check.main(sys.argv)
+        if code == 2:
+            print(f"       {sys.argv[0]} import <radio-browser-dump.json[.gz]>")
+        exit(code)
+
+    hal_setup(hal_hardware())
+    app_setup()
+    main_loop()
 
 # ~ except KeyboardInterrupt:
     # ~ settings_write()
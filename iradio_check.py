@@ -0,0 +1,1090 @@
+#!/usr/bin/env python3
+# ************************************************************************************************************
+#
+#   Checks und Benchmarks fuer IRadio
+#   =================================
+#
+# Wird von iradio.py fuer alle check-*/bench-* Kommandos und "headless" geladen (kann aber
+# auch direkt gestartet werden: "./iradio_check.py check-db"). Die Backends (GPIO, Display,
+# VLC, Netz) werden per iradio.hal_setup() uebergeben: iradio_fake.backend() fuer die
+# Ersatz-Hardware in virtueller Zeit, iradio.hal_network() fuer Checks gegen check_server().
+# Die Checks liefern True bei Fehlern (Exit-Code 1), die Benchmarks geben nur aus.
+#
+# ************************************************************************************************************
+
+import time
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from PIL import ImageDraw
+
+import iradio as ir
+import iradio_fake
+
+
+# ***********************************************************************************************
+def check_encoder():
+    # aufgezeichnete Flankenfolgen (CLK, DT, t in ms) nachspielen; Exit-Code 1 bei Abweichung
+    cw = [(1, 0), (0, 0), (0, 1), (1, 1)]
+    ccw = [(0, 1), (0, 0), (1, 0), (1, 1)]
+    bounce = [(1, 0), (1, 1), (1, 0), (0, 0), (1, 0), (0, 0), (0, 1), (1, 1)]
+    def replay(decoder, detents, interval):
+        t = 0
+        for seq in detents:
+            t += interval
+            for clk, dt in seq:
+                decoder.feed(clk, dt, t)
+        return decoder.take()
+    cases = [
+        ("cw",            (),                     [cw] * 3,               500,  3),
+        ("ccw",           (),                     [ccw] * 3,              500, -3),
+        ("bounce",        (),                     [bounce, bounce],       500,  2),
+        ("half+back",     (),                     [cw[:2] + ccw[2:]],     500,  0),
+        ("missed state",  (),                     [[(0, 1), (1, 0), (1, 1)]], 500, -1),
+        ("slow",          ir.ENCODER_ACCEL_SELECTION, [cw] * 5,              500,  5),
+        ("fast",          ir.ENCODER_ACCEL_SELECTION, [cw] * 5,              20,   1 + 4 * 5),
+        ("fast volume",   ir.ENCODER_ACCEL_VOLUME,    [ccw] * 5,             20,  -(1 + 4 * 2)),
+    ]
+    failed = 0
+    for name, accel, detents, interval, expect in cases:
+        got = replay(ir.QuadratureDecoder(accel), detents, interval)
+        ok = got == expect
+        failed += not ok
+        print(f"{name:14s} {'ok' if ok else 'FAIL'}  expected {expect:4d}, got {got:4d}")
+    return failed
+
+# ***********************************************************************************************
+class BenchDisplay:
+    # Display-Ersatz fuer Benchmarks; zaehlt nur die uebertragenen Bytes
+    def __init__(self):
+        self.bytes = 0
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        pass
+    def data(self, data):
+        self.bytes = self.bytes + len(data)
+
+# ***********************************************************************************************
+def bench_rgb565(frames=500, width=128, height=160):
+    # Vergleich bisheriger Weg (wie st7735.ST7735.display()) mit tft_push()
+    import tracemalloc
+
+    def old_push(display, image):
+        pb = np.array(image.convert("RGB")).astype("uint16")
+        color = ((pb[:, :, 0] & 0xF8) << 8) | ((pb[:, :, 1] & 0xFC) << 3) | (pb[:, :, 2] >> 3)
+        pixelbytes = np.dstack(((color >> 8) & 0xFF, color & 0xFF)).flatten().tolist()
+        display.set_window()
+        for i in range(0, len(pixelbytes), ir.TFT_CHUNK_SIZE):
+            display.data(pixelbytes[i:i + ir.TFT_CHUNK_SIZE])
+
+    def run(name, image, push):
+        display = BenchDisplay()
+        d = ImageDraw.Draw(image)
+        tracemalloc.start()
+        peak = 0
+        t = time.perf_counter()
+        for i in range(frames):
+            # "Lautstaerke-Balken" wandert, Rest bleibt gleich
+            d.rectangle((10, 70, width - 10, 80), fill=(0, 0, 0))
+            d.rectangle((10, 70, 10 + i % (width - 20), 80), fill=(0, 0, 255))
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            push(display, image)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        t = time.perf_counter() - t
+        tracemalloc.stop()
+        print(f"{name:10s} {frames/t:8.1f} frames/s  {peak:8d} bytes allocated/frame (peak)  {display.bytes/frames:8.0f} bytes sent/frame")
+
+    image = Image.new("RGB", (width, height))
+    run("old", image, old_push)
+    image = ir.tft_buffers_setup(width, height)
+    run("tft_push", image, ir.tft_push)
+
+# ***********************************************************************************************
+def check_tft(frames=300, width=128, height=160, seed=1):
+    # tft_push() gegen Framebuffer-Display (iradio_fake): zufaellige Aenderungen (Rechtecke,
+    # Punkte, Linien, auch gar keine); nach jedem Frame muss der Display-Inhalt genau dem
+    # umgewandelten Bild entsprechen - mit gemeinsamem Puffer (Selbsttest in tft_buffers_setup())
+    # und mit dem kopierenden Weg. Exit-Code 1 bei Abweichung
+    import random
+    failed = 0
+    for shared in (True, False):
+        rnd = random.Random(seed)
+        display = iradio_fake.ST7735(width=width, height=height)
+        image = ir.tft_buffers_setup(width, height, shared)
+        if ir.tft_shared != shared:
+            print(f"shared buffer: expected {shared}, got {ir.tft_shared}")
+            failed = failed + 1
+        d = ImageDraw.Draw(image)
+        color = lambda: (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+        rgbx = np.zeros((height, width, 4), dtype=np.uint8)
+        expect = np.zeros((height, width), dtype=np.uint16)
+        scratch = np.zeros((height, width), dtype=np.uint16)
+        bad_frames = 0
+        for i in range(frames):
+            for j in range(rnd.randrange(4)):
+                kind = rnd.randrange(3)
+                x0, y0 = rnd.randrange(width), rnd.randrange(height)
+                if kind == 0:
+                    x1, y1 = rnd.randrange(x0, width), rnd.randrange(y0, height)
+                    d.rectangle((x0, y0, x1, y1), fill=color())
+                elif kind == 1:
+                    d.point((x0, y0), fill=color())
+                else:
+                    d.line((x0, y0, rnd.randrange(width), rnd.randrange(height)), fill=color())
+            ir.tft_push(display, image)
+            # Soll unabhaengig vom gemeinsamen Puffer aus dem Bild selbst
+            rgbx[:, :, :3] = np.asarray(image.convert("RGB"))
+            ir.tft_rgb565(rgbx, expect, scratch)
+            if not np.array_equal(display.fb, expect):
+                bad = np.argwhere(display.fb != expect)
+                print(f"frame {i}: {len(bad)} pixels differ, first at x={bad[0][1]}, y={bad[0][0]}")
+                bad_frames = bad_frames + 1
+                # Display wieder auf Stand bringen, sonst schlagen alle folgenden Frames fehl
+                display.fb[...] = expect
+        failed = failed + bad_frames
+        print(f"{'shared' if shared else 'copying'}: {frames} frames, {display.windows} windows, {display.bytes} bytes "
+              f"(full frames: {frames * width * height * 2}), {'ok' if not bad_frames else f'{bad_frames} FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def bench_make_db(filename, count, favorites, base="http://127.0.0.1"):
+    # synthetische Stations-DB (Aufbau wie radio-browser); Stream-URLs base/<Nummer>
+    db = sqlite3.connect(filename)
+    db.execute("""create table stations (changeuuid, stationuuid, name, url, url_resolved, homepage, favicon, tags,
+                  country, countrycode, state, language, votes, lastchangetime, codec, bitrate, hls,
+                  lastcheckok, lastchecktime, lastcheckoktime, lastlocalchecktime, clicktimestamp, clickcount, clicktrend)""")
+    db.execute("create table favorites (stationuuid)")
+    db.executemany("insert into stations values (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                   ((f"c-{i}", f"s-{i}", f"Station {i:05d}", f"{base}/{i}", f"{base}/{i}",
+                     "", "", "rock,metal", "Germany", "DE", "", "german", 0, "", "MP3", 128, 0,
+                     1, "", "", "", "", 0, 0) for i in range(count)))
+    db.executemany("insert into favorites values (?)", ((f"s-{i}",) for i in range(0, count, count // favorites)))
+    db.commit()
+    db.close()
+
+# ***********************************************************************************************
+def check_db(count=3000, favorites=100):
+    # Migration einer synthetischen DB im alten (radio-browser-)Aufbau und Abfrageplan der
+    # Favoriten pruefen; die DB des Radios wird nicht angefasst. Exit-Code 1 bei Abweichung
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        ir.STATION_DB_FILE = f"{tmp}/stations.db"
+        ir.db_schema_checked = None
+        bench_make_db(ir.STATION_DB_FILE, count, favorites)
+        con = ir.db_connect_rw()
+        try:
+            version = con.execute("pragma user_version").fetchone()[0]
+            step = count // favorites
+            expect = [f"s-{i}" for i in range(0, count, step)][:ir.STATION_PREFETCH]
+            window = [row[0] for row in con.execute(ir.SQL_FAVORITES_WINDOW, (ir.STATION_PREFETCH, 0))]
+            cases = [
+                ("schema version",  version == len(ir.DB_MIGRATIONS)),
+                ("favorites count", con.execute(ir.SQL_FAVORITES_COUNT).fetchone()[0] == favorites),
+                ("favorites order", window == expect),
+                ("favorites plan",  not ir.db_check_plan(con)),
+            ]
+            # Favorit nur mit stationuuid (wie pyiradio.py) --> ans Ende
+            con.execute("insert into favorites (stationuuid) values ('s-1')")
+            position = con.execute("select position from favorites where stationuuid = 's-1'").fetchone()[0]
+            cases.append(("favorite append", position == favorites))
+        finally:
+            con.close()
+        # DB verschwindet im Betrieb: Platzhalter statt Absturz, beim Einschalten Default-Stationen
+        ir.stations = None
+        ir.load_stations()
+        ir.db_close()
+        os.remove(ir.STATION_DB_FILE)
+        far = ir.stations[favorites - 1]
+        cases.append(("db gone: station", far.uuid is None))
+        cases.append(("db gone: details", ir.stations.details(favorites - 1)["stationuuid"] is None))
+        cases.append(("db gone: snapshot", ir.state_snapshot()["stations_count"] == favorites + 1))
+        ir.load_stations()
+        cases.append(("db gone: defaults", ir.stations.defaults is ir.DEFAULT_STATIONS))
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def check_import(count=10000, changed=300, added=200):
+    # import_stations() mit erzeugten radio-browser-Dumps (gzip, mit BOM): erster Import,
+    # erneuter Import mit geaenderten und neuen Stationen (Zaehler), Spitzenspeicher bei
+    # vierfacher Dateigroesse (muss gleich bleiben) und kaputte Dateien (schnell abbrechen).
+    # Exit-Code 1 bei Abweichung
+    import gzip
+    import tempfile
+    import tracemalloc
+
+    def dump(filename, n, changes=0, bom=True):
+        # Stationen s-0..s-(n-1); die ersten changes mit neuer changeuuid und neuem Namen
+        with gzip.open(filename, "wt", encoding="utf-8") as f:
+            f.write("\ufeff[\n" if bom else "[\n")
+            for i in range(n):
+                new = i < changes
+                station = {"changeuuid" : f"c-{i}{'-new' if new else ''}", "stationuuid" : f"s-{i}",
+                           "name" : f"Station {i:06d}{' (neu)' if new else ''}", "url" : f"http://127.0.0.1/{i}",
+                           "url_resolved" : f"http://127.0.0.1/{i}", "homepage" : "", "favicon" : "",
+                           "tags" : "rock,pop", "country" : "Germany", "countrycode" : "DE", "language" : "german",
+                           "votes" : i, "codec" : "MP3", "bitrate" : 128, "lastcheckok" : 1}
+                f.write(("," if i else "") + json.dumps(station) + "\n")
+            f.write("]\n")
+
+    def run(filename):
+        # Import mit Spitzenspeicher (Python-Objekte, in Bytes)
+        tracemalloc.start()
+        try:
+            result = ir.import_stations(filename)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, peak
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ir.STATION_DB_FILE = f"{tmp}/stations.db"
+        ir.db_schema_checked = None
+        dump(f"{tmp}/first.json.gz", count)
+        dump(f"{tmp}/second.json.gz", count + added, changed)
+        (rows, written), peak = run(f"{tmp}/first.json.gz")
+        cases = [("first import",   (rows, written) == (count, count))]
+        (rows, written), _ = run(f"{tmp}/second.json.gz")
+        cases.append(("re-import",      (rows, written) == (count + added, changed + added)))
+        con = ir.db_connect_rw()
+        try:
+            names = [row[0] for row in con.execute("select name from stations where stationuuid in ('s-0', 's-1', ?)",
+                                                   (f"s-{count + added - 1}",))]
+            cases.append(("updated rows",   con.execute("select count(*) from stations").fetchone()[0] == count + added and
+                                            len([n for n in names if n.endswith("(neu)")]) == 2))
+        finally:
+            con.close()
+        # Speicher: vierfache Datei (neue DB), Spitze darf nicht mitwachsen
+        os.remove(ir.STATION_DB_FILE)
+        ir.db_schema_checked = None
+        dump(f"{tmp}/large.json.gz", 4 * count)
+        (rows, written), large = run(f"{tmp}/large.json.gz")
+        print(f"peak memory: {peak / 1024:.0f} kB ({count} stations), {large / 1024:.0f} kB ({4 * count} stations)")
+        cases.append(("flat memory",    rows == 4 * count and large < peak * 1.5))
+        # kaputte Dateien: nicht geschlossener String bzw. abgeschnittenes Array
+        with gzip.open(f"{tmp}/broken.json.gz", "wt", encoding="utf-8") as f:
+            f.write('[{"stationuuid" : "x", "name" : "' + "x" * (4 * ir.JSON_MAX_ELEMENT_SIZE))
+        with gzip.open(f"{tmp}/truncated.json.gz", "wt", encoding="utf-8") as f:
+            f.write('[{"stationuuid" : "x"}, {"stationuuid" : "y", "na')
+        for name in ("broken", "truncated"):
+            try:
+                ir.import_stations(f"{tmp}/{name}.json.gz")
+                ok = False
+            except ValueError as e:
+                print(f"{name}: {e}")
+                ok = True
+            cases.append((name,         ok))
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def check_search(count=3000, favorites=100):
+    # Volltextsuche (db_search*) auf einer synthetischen DB: Praefixe, mehrere Woerter, Umlaute
+    # bzw. Akzente, Seiten der Trefferliste und Aenderungen ueber die Trigger (auch bei schon
+    # gecachter Suche). Exit-Code 1 bei Abweichung
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        ir.STATION_DB_FILE = f"{tmp}/stations.db"
+        ir.db_schema_checked = None
+        bench_make_db(ir.STATION_DB_FILE, count, favorites)
+        con = ir.db_connect_rw()
+        try:
+            con.executemany("insert into stations (stationuuid, name, url, tags, country) values (?, ?, ?, ?, ?)",
+                            (("k-1", "Radio Köln", "http://127.0.0.1/k1", "pop", "Germany"),
+                             ("k-2", "Café del Mar", "http://127.0.0.1/k2", "chillout", "Spain"),
+                             ("k-3", "Rockland Radio", "http://127.0.0.1/k3", "rock", "Germany")))
+            con.commit()
+            names = lambda text, page=0: [row["name"] for row in ir.db_search(text, page)]
+            size = ir.STATION_LIST_MAX_COUNT
+            pages = [names("station", p) for p in range(3)]
+            cases = [
+                ("prefix",          names("rockl") == ["Rockland Radio"]),
+                ("words",           names("radio ko") == ["Radio Köln"]),
+                ("diacritics",      names("koln") == ["Radio Köln"] and names("cafe") == ["Café del Mar"]),
+                ("umlaut query",    names("köln") == ["Radio Köln"]),
+                ("quotes",          names('"rock') == names("rock")),
+                ("count",           ir.db_search_count("station") == count),
+                ("page size",       all(len(p) == size for p in pages)),
+                ("pages disjoint",  len(set(pages[0] + pages[1] + pages[2])) == 3 * size),
+                ("last page",       len(names("station", (count - 1) // size)) == (count % size or size)),
+                ("past the end",    names("station", count // size + 1) == []),
+            ]
+            # Aenderungen (z.B. durch einen Import) muessen ohne Neuaufbau gefunden werden, auch
+            # wenn die gleiche Suche gerade im Cache liegt
+            names("koln")
+            con.execute("update stations set name = 'Radio Koeln Classic' where stationuuid = 'k-1'")
+            con.execute("delete from stations where stationuuid = 'k-2'")
+            con.execute("insert into stations (stationuuid, name, url) values ('k-4', 'Rockabilly Cafe', 'http://127.0.0.1/k4')")
+            con.commit()
+            cases.append(("trigger update", names("koln") == [] and names("koeln") == ["Radio Koeln Classic"]))
+            cases.append(("trigger delete", names("cafe") == ["Rockabilly Cafe"]))
+            cases.append(("trigger insert", names("rockabilly") == ["Rockabilly Cafe"]))
+        finally:
+            con.close()
+            ir.db_close()
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def check_history(stations=20):
+    # Titel-Verlauf ueber den Fake-Player: zwei Titel auf einer Station, Stationswechsel, ein
+    # Titel auf der zweiten, ausschalten; geschrieben wird gesammelt (erst beim Ausschalten bzw.
+    # alle HISTORY_FLUSH_INTERVAL ms). Prueft history_last/by_station/range und dass diese
+    # Abfragen ueber die Indizes laufen (db_check_plan()). Exit-Code 1 bei Abweichung
+    ir.hal_setup(iradio_fake.backend())
+    bench_make_db(ir.STATION_DB_FILE, stations, stations)
+    ir.app_setup()
+    ir.boot_done.wait()
+    gpio = ir.hal["gpio"]
+    clock = ir.hal["clock"]
+    rows = lambda: ir.db_query("select count(*) from history")[0][0]
+    titles = lambda result: [row["title"] for row in result]
+
+    def play(title, ms):
+        # Titel beginnt jetzt, laeuft ms; liefert die Startzeit (s, wie in history)
+        start = int(clock.now / 1000)
+        headless_now_playing(title)
+        ir.main_loop(clock.now + ms)
+        return start
+
+    gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+    ir.main_loop(clock.now + 2000)
+    first = ir.stations[ir.config["station_idx"]].uuid
+    t1 = play("Artist A - Song 1", 60000)
+    t2 = play("Artist A - Song 2", 60000)
+    gpio.turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 1, clock.now, 20)
+    ir.main_loop(clock.now + 500)
+    gpio.press(ir.SELECTION_SW_PIN, clock.now)
+    ir.main_loop(clock.now + 2000)
+    second = ir.stations[ir.config["station_idx"]].uuid
+    t3 = play("Artist B - Song 1", 30000)
+    cases = [("stations",   first != second and None not in (first, second)),
+             ("batched",    rows() == 0 and len(ir.history_buffer) == 2)]
+    gpio.press(ir.VOLUME_SW_PIN, clock.now)
+    ir.main_loop(clock.now + 1000)
+    ir.render_wait_idle()
+    last = ir.history_last(10)
+    cases.append(("written",        rows() == 3 and not ir.history_buffer))
+    cases.append(("last",           titles(last) == ["Artist B - Song 1", "Artist A - Song 2", "Artist A - Song 1"]))
+    # Ende: naechster Titel, Stationswechsel (Sekunden abgeschnitten) bzw. Ausschalten
+    spans = [(row["start_time"], row["end_time"]) for row in reversed(last)]
+    cases.append(("times",          spans[0] == (t1, t2) and spans[1][0] == t2 and t2 + 60 <= spans[1][1] <= t3 and
+                                    spans[2][0] == t3 and t3 + 30 <= spans[2][1] <= t3 + 31))
+    cases.append(("by station",     titles(ir.history_by_station(first)) == ["Artist A - Song 2", "Artist A - Song 1"] and
+                                    titles(ir.history_by_station(second)) == ["Artist B - Song 1"]))
+    cases.append(("range",          titles(ir.history_range(t2, t3 + 1)) == ["Artist A - Song 2", "Artist B - Song 1"] and
+                                    titles(ir.history_range(datetime.fromtimestamp(t1), datetime.fromtimestamp(t2))) == ["Artist A - Song 1"]))
+    con = ir.db_connect_rw()
+    try:
+        cases.append(("plan", not ir.db_check_plan(con)))
+    finally:
+        con.close()
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:12s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def bench_db(count=30000, favorites=100, rounds=20):
+    # Favoriten laden (Teil von Einschalten --> erster Ton): bisher vs. StationList; danach
+    # Einschalten --> "Playing" komplett auf der Ersatz-Hardware (headless)
+    import tempfile
+
+    def old_load():
+        l = []
+        db=sqlite3.connect(ir.STATION_DB_FILE)
+        db.row_factory = sqlite3.Row
+        for row in db.execute("select * from stations where stationuuid in (select stationuuid from favorites) order by name"):
+            l.append(row)
+        db.commit()
+        db.close()
+        return l
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ir.STATION_DB_FILE = f"{tmp}/stations.db"
+        ir.db_schema_checked = None
+        bench_make_db(ir.STATION_DB_FILE, count, favorites)
+        # Schema einmalig migrieren, sonst misst "first" nur die Migration
+        ir.db_connect_rw().close()
+        def new_load():
+            l = ir.StationList(ir.db_favorites_count())
+            l[0]
+            return l
+
+        for name, load in (("old", old_load), ("StationList", new_load)):
+            t = time.perf_counter()
+            n = len(load())
+            first = (time.perf_counter() - t) * 1000
+            t = time.perf_counter()
+            for i in range(rounds):
+                load()
+            t = (time.perf_counter() - t) * 1000 / rounds
+            print(f"{name:14s} {count} stations, {n} favorites: first {first:7.2f} ms, then {t:7.2f} ms")
+        ir.db_close()
+
+    # Einschalten (Tastendruck) --> MediaPlayerPlaying; echte Zeit, "Playing" meldet der
+    # Fake-Player nach vlc.start_delay ms virtueller Zeit (die hier nicht mitzaehlt)
+    ir.hal_setup(iradio_fake.backend())
+    bench_make_db(ir.STATION_DB_FILE, count, favorites)
+    ir.db_connect_rw().close()
+    ir.app_setup()
+    ir.boot_done.wait()
+    press = lambda t: ir.hal["gpio"].press(ir.VOLUME_SW_PIN, t, 20)
+    on = []
+    for i in range(rounds):
+        on.append(bench_op(press, ir.hal["vlc"].start_delay + 500, until="playing"))
+        ir.cycle_stop("probe_streams")
+        bench_op(press)
+    latency = bench_percentiles([op["latency"] for op in on if op["latency"] is not None])
+    print(f"power-on --> playing ({count} stations, {favorites} favorites): {latency}")
+
+# ***********************************************************************************************
+def headless_now_playing(title):
+    # neuer ICY-Titel auf dem gerade laufenden (Fake-)Medium
+    if ir.media is not None:
+        ir.media.set_meta(ir.hal["vlc"].Meta.NowPlaying, title)
+
+# ***********************************************************************************************
+def headless_run(seconds=120):
+    # Radio ohne Hardware in virtueller Zeit: einschalten, Lautstaerke, Stationsliste, Auswahl,
+    # Titelwechsel, Screens durchschalten, ausschalten; danach Statistik ausgeben
+    ir.hal_setup(iradio_fake.backend())
+    ir.app_setup()
+    clock = ir.hal["clock"]
+    gpio = ir.hal["gpio"]
+    t0 = clock.now
+    t = gpio.press(ir.VOLUME_SW_PIN, t0 + 1000)                            # einschalten
+    t = gpio.turn(ir.VOLUME_CLK_PIN, ir.VOLUME_DT_PIN, 4, t + 2000, 20)      # schnell lauter
+    t = gpio.turn(ir.VOLUME_CLK_PIN, ir.VOLUME_DT_PIN, -2, t + 1000, 300)    # langsam leiser
+    t = gpio.turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 3, t + 6000, 300)
+    t = gpio.press(ir.SELECTION_SW_PIN, t + 500)                           # Station auswaehlen
+    clock.at(t + 3000, headless_now_playing, "Artist A - Song 1")
+    clock.at(t + 8000, headless_now_playing, "Artist B - Song 2")
+    for i in range(len(ir.SCREENS)):
+        t = gpio.press(ir.SELECTION_SW_PIN, t + 10000)                     # Screens durchschalten
+    end = t0 + seconds * 1000
+    gpio.press(ir.VOLUME_SW_PIN, end - 5000)                               # ausschalten
+    wall = time.perf_counter()
+    ir.main_loop(end)
+    ir.render_wait_idle()
+    wall = time.perf_counter() - wall
+    print(f"headless: {seconds} s virtual time in {wall:.2f} s")
+    print(f"display : {ir.disp.frame_count} frames, {ir.disp.windows} windows, {ir.disp.bytes} SPI bytes")
+    print(f"render  : {ir.render_stats}")
+    print(f"gpio    : {gpio.edges} edges")
+    print(f"sched   : {ir.scheduler_stats}")
+    print(f"config  : {ir.config}, history buffered: {len(ir.history_buffer)}")
+
+# ***********************************************************************************************
+def check_meta():
+    # Metadaten ueber VLC-Events (Fake-Player) auf dem Media-Info-Screen: gleicher Titel zeichnet
+    # nicht neu, neuer Titel genau einmal, nach dem ersten Event wird nicht mehr abgefragt; ein
+    # Stream ohne Events wird weiter alle REFRESH_MEDIA_INFOS ms abgefragt. Exit-Code 1 bei Abweichung
+    # (Start kurz nach einer vollen Minute, damit die Uhrzeit nicht dazwischen neu zeichnet)
+    ir.hal_setup(iradio_fake.backend((time.time() // 60) * 60000 + 1000))
+    ir.app_setup()
+    ir.boot_done.wait()
+    gpio = ir.hal["gpio"]
+    clock = ir.hal["clock"]
+    meta = ir.hal["vlc"].Meta
+
+    def run(inject, ms):
+        # Eingabe einspielen, ms virtuelle Zeit laufen lassen; liefert die Anzahl neuer Frames
+        frames = ir.disp.frame_count
+        inject(clock.now)
+        ir.main_loop(clock.now + ms)
+        ir.render_wait_idle()
+        return ir.disp.frame_count - frames
+
+    polling = lambda: ir.cycles["display_media_infos"]["start"]
+    run(lambda t: gpio.press(ir.VOLUME_SW_PIN, t), 2000)
+    run(lambda t: gpio.press(ir.SELECTION_SW_PIN, t), 1000)             # Media-Info-Screen
+    cases = [("media screen",       ir.temps["main_screen_idx"] == 1),
+             ("polling at start",   polling())]
+    cases.append(("first title",    run(lambda t: headless_now_playing("Artist A - Song 1"), 1000) == 1))
+    cases.append(("polling stopped", run(lambda t: None, ir.REFRESH_MEDIA_INFOS + 1000) == 0 and not polling()))
+    cases.append(("same title",     run(lambda t: headless_now_playing("Artist A - Song 1"), 1000) == 0))
+    cases.append(("new title",      run(lambda t: headless_now_playing("Artist B - Song 2"), 1000) == 1))
+    # andere Station, deren Medium keine Events liefert: Titel aendert sich "still"
+    run(lambda t: gpio.turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 1, t, 20), 500)
+    run(lambda t: gpio.press(ir.SELECTION_SW_PIN, t), 1000)
+    run(lambda t: gpio.press(ir.SELECTION_SW_PIN, t), 1000)
+    cases.append(("polling rearmed", polling()))
+    ir.media.meta[meta.NowPlaying] = "Artist C - Song 3"
+    cases.append(("fallback poll",  run(lambda t: None, ir.REFRESH_MEDIA_INFOS + 500) == 1 and polling()))
+    cases.append(("fallback title", ir.media_meta["now_playing"] == "Artist C - Song 3"))
+    cases.append(("fallback same",  run(lambda t: None, ir.REFRESH_MEDIA_INFOS + 500) == 0))
+    run(lambda t: gpio.press(ir.VOLUME_SW_PIN, t), 1000)
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def check_boot():
+    # VLC startet im Boot-Thread nicht (Fake-VLC wirft): Fehler wird festgehalten, der Boot-Thread
+    # laedt trotzdem die Stationen, Einschalten wird abgelehnt (Main-Loop laeuft weiter); ist
+    # VLC wieder da, klappt das naechste Einschalten. Exit-Code 1 bei Abweichung
+    ir.hal_setup(iradio_fake.backend())
+    vlc = ir.hal["vlc"]
+    vlc.instance_error = OSError("no audio device")
+    gpio = ir.hal["gpio"]
+    clock = ir.hal["clock"]
+    try:
+        ir.app_setup()
+        ir.boot_done.wait()
+        cases = [("error recorded",     "vlc" in ir.boot_errors and ir.vlc_instance is None),
+                 ("stations loaded",    ir.stations is not None and "stations" not in ir.boot_errors)]
+        gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+        ir.main_loop(clock.now + 2000)
+        cases.append(("power-on refused",   not ir.temps["application_on"] and ir.metrics_collect()["values"]["boot_errors"] == 1))
+        vlc.instance_error = None
+        playing = len(vlc.playing_times)
+        gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+        ir.main_loop(clock.now + 2000)
+        cases.append(("retry",              ir.temps["application_on"] and not ir.boot_errors and len(vlc.playing_times) > playing))
+        gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+        ir.main_loop(clock.now + 1000)
+        ir.render_wait_idle()
+    finally:
+        vlc.instance_error = None
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:18s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def check_caching(sessions=8, jitter=2500):
+    # headless: Station 0 mit Jitter (Luecken bis jitter ms), Station 1 ohne; je sessions mal
+    # einschalten, CACHING_CLEAN_TIME spielen, ausschalten. Erwartet: Station 0 landet knapp
+    # ueber jitter und spielt zuletzt ohne Aussetzer, Station 1 beim kleinsten Wert
+    ir.hal_setup(iradio_fake.backend())
+    ir.app_setup()
+    clock = ir.hal["clock"]
+    ir.boot_done.wait()
+    ir.hal["vlc"].jitter[ir.stations[0].url] = jitter
+    failed = 0
+    for idx in (0, 1):
+        for i in range(sessions):
+            ir.config["station_idx"] = idx
+            underruns = ir.caching_stats["underruns"]
+            t = ir.hal["gpio"].press(ir.VOLUME_SW_PIN, clock.now + 1000)
+            ir.hal["gpio"].press(ir.VOLUME_SW_PIN, t + ir.CACHING_CLEAN_TIME + 60000)
+            ir.main_loop(t + ir.CACHING_CLEAN_TIME + 70000)
+            print(f"station {idx}, session {i + 1}: played with {ir.caching_state['caching']:5d} ms, "
+                  f"underruns {ir.caching_stats['underruns'] - underruns}, next {ir.caching_get(idx):5d} ms")
+        ms = ir.caching_get(idx)
+        ok = (jitter <= ms <= jitter * ir.CACHING_UP and underruns == ir.caching_stats["underruns"]) if idx == 0 else ms == ir.CACHING_MIN
+        failed += not ok
+        print(f"station {idx}: {ms} ms {'ok' if ok else 'FAIL'}")
+    ir.render_wait_idle()
+    return failed
+
+# ***********************************************************************************************
+def check_server(routes):
+    # lokaler HTTP-Server fuer die check-*-Kommandos; routes: Pfad --> Funktion(handler)
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            route = routes.get(self.path)
+            if route is None:
+                self.send_error(404)
+                return
+            try:
+                route(self)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="check-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# ***********************************************************************************************
+def check_reply(handler, body, ctype="application/octet-stream", code=200, headers=(), interval=None):
+    # Antwort eines check_server(); mit interval (s) wird body Byte fuer Byte "getroepfelt"
+    handler.send_response(code)
+    handler.send_header("Content-Type", ctype)
+    handler.send_header("Content-Length", str(len(body)))
+    for k, v in headers:
+        handler.send_header(k, v)
+    handler.end_headers()
+    if interval is None:
+        handler.wfile.write(body)
+        return
+    for i in range(len(body)):
+        handler.wfile.write(body[i:i+1])
+        handler.wfile.flush()
+        time.sleep(interval)
+
+# ***********************************************************************************************
+def check_logo(timeout=1):
+    # logo_download() gegen lokalen Server: gutes, langsames (1 Byte / 0.2 s), kaputtes und zu
+    # grosses Logo sowie 404; Exit-Code 1 bei Abweichung oder wenn ein Download laenger als
+    # timeout (plus Reserve) dauert
+    import tempfile
+    ir.hal_setup(ir.hal_network())
+    buf = BytesIO()
+    Image.new("RGB", (32, 32), (255, 0, 0)).save(buf, format="PNG")
+    png = buf.getvalue()
+    routes = {
+            "/ok.png"       : lambda h: check_reply(h, png, "image/png"),
+            "/slow.png"     : lambda h: check_reply(h, png, "image/png", interval=0.2),
+            "/broken.png"   : lambda h: check_reply(h, b"this is no image", "image/png"),
+            "/big.png"      : lambda h: check_reply(h, png + bytes(ir.LOGO_FETCH_MAX_SIZE), "image/png"),
+    }
+    server, base = check_server(routes)
+    cases = [
+        ("ok",      "/ok.png",      True),
+        ("slow",    "/slow.png",    False),
+        ("broken",  "/broken.png",  False),
+        ("too big", "/big.png",     False),
+        ("missing", "/missing.png", False),
+    ]
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, path, expect in cases:
+            url = base + path
+            filename = f"{tmp}/{ir.logo_hash(url)}.png"
+            with ir.logo_lock:
+                ir.logo_inflight[url] = None
+            t = time.perf_counter()
+            got = ir.logo_download(url, filename, timeout)
+            t = time.perf_counter() - t
+            ok = got == expect and os.path.isfile(filename) == expect and t < timeout + 0.5
+            failed += not ok
+            print(f"{name:8s} {'ok' if ok else 'FAIL'}  expected {expect}, got {got}, {t*1000:6.0f} ms")
+    server.shutdown()
+    return failed
+
+# ***********************************************************************************************
+def check_resolve(timeout=1):
+    # resolve_stream_url() gegen lokalen Server: 302-Ketten, .pls, verschachtelte .m3u, HLS,
+    # Playlist-Schleife und langsame Playlist (muss nach timeout abbrechen); Exit-Code 1 bei
+    # Abweichung
+    ir.hal_setup(ir.hal_network())
+    redirect = lambda path: (lambda h: check_reply(h, b"", code=302, headers=(("Location", path),)))
+    routes = {
+            "/stream"       : lambda h: check_reply(h, bytes(4096), "audio/mpeg"),
+            "/r1"           : redirect("/r2"),
+            "/r2"           : redirect("/list.pls"),
+            "/list.pls"     : lambda h: check_reply(h, b"[playlist]\nNumberOfEntries=1\nFile1=/stream\nTitle1=Test\n", "audio/x-scpls"),
+            "/outer.m3u"    : lambda h: check_reply(h, b"#EXTM3U\n#EXTINF:-1,Test\ninner.m3u\n", "audio/x-mpegurl"),
+            "/inner.m3u"    : lambda h: check_reply(h, f"{base}/stream\n".encode(), "audio/x-mpegurl"),
+            "/hls.m3u8"     : lambda h: check_reply(h, b"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n", "application/x-mpegurl"),
+            "/loop.pls"     : lambda h: check_reply(h, b"[playlist]\nFile1=/loop.pls\n", "audio/x-scpls"),
+            "/slow.pls"     : lambda h: check_reply(h, b"[playlist]\nFile1=/stream\n" + b"\n" * 100, "audio/x-scpls", interval=0.2),
+    }
+    server, base = check_server(routes)
+    cases = [
+        ("stream",          "/stream",      "/stream"),
+        ("302->302->pls",   "/r1",          "/stream"),
+        ("nested m3u",      "/outer.m3u",   "/stream"),
+        ("hls",             "/hls.m3u8",    "/hls.m3u8"),
+        ("playlist loop",   "/loop.pls",    "/loop.pls"),
+        ("slow playlist",   "/slow.pls",    None),
+    ]
+    failed = 0
+    for name, path, expect in cases:
+        t = time.perf_counter()
+        try:
+            got = ir.resolve_stream_url(base + path, timeout)
+        except Exception as e:
+            got = None
+            print(f"{name}: {e}")
+        t = time.perf_counter() - t
+        if got is not None and got.startswith(base):
+            got = got[len(base):]
+        ok = got == expect and t < timeout + 0.5
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}  expected {expect}, got {got}, {t*1000:6.0f} ms")
+    server.shutdown()
+    return failed
+
+# ***********************************************************************************************
+def check_probe(timeout=1):
+    # probe_url() gegen lokalen Server: gesunder, toter (Port zu), 404, langsamer, leerer Stream,
+    # Weiterleitungs-Schleife, Playlisten auf gesunde bzw. tote Streams und Weiterleitungen, die
+    # einzeln schnell genug, zusammen aber zu langsam sind; Exit-Code 1 bei Abweichung oder wenn
+    # eine Pruefung laenger als timeout (plus Reserve fuer den Verbindungsabbau) dauert
+    import asyncio
+    import socket
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    closed = f"http://127.0.0.1:{s.getsockname()[1]}"
+    s.close()
+
+    def slow(h):
+        h.send_response(200)
+        h.send_header("Content-Type", "audio/mpeg")
+        h.end_headers()
+        h.wfile.flush()
+        time.sleep(timeout * 3)
+
+    def hop(target):
+        # Weiterleitung nach 0.6 * timeout
+        def reply(h):
+            time.sleep(timeout * 0.6)
+            check_reply(h, b"", code=302, headers=(("Location", target),))
+        return reply
+
+    pls = lambda target: (lambda h: check_reply(h, f"[playlist]\nNumberOfEntries=1\nFile1={target}\n".encode(), "audio/x-scpls"))
+    routes = {
+            "/stream"       : lambda h: check_reply(h, bytes(8192), "audio/mpeg", headers=(("icy-name", "Test"),)),
+            "/slow"         : slow,
+            "/empty"        : lambda h: check_reply(h, b"", "audio/mpeg"),
+            "/loop"         : lambda h: check_reply(h, b"", code=302, headers=(("Location", "/loop"),)),
+            "/r"            : lambda h: check_reply(h, b"", code=302, headers=(("Location", "/list.pls"),)),
+            "/list.pls"     : pls("/stream"),
+            "/dead.pls"     : pls("/missing"),
+            "/closed.pls"   : pls(f"{closed}/stream"),
+            "/nested.m3u"   : lambda h: check_reply(h, b"#EXTM3U\ninner.m3u\n", "audio/x-mpegurl"),
+            "/inner.m3u"    : lambda h: check_reply(h, b"#EXTM3U\n/stream\n", "audio/x-mpegurl"),
+            "/hls.m3u8"     : lambda h: check_reply(h, b"#EXTM3U\n#EXT-X-VERSION:3\n", "application/x-mpegurl"),
+            "/hop1"         : hop("/hop2"),
+            "/hop2"         : hop("/stream"),
+    }
+    server, base = check_server(routes)
+    cases = [
+        ("healthy",         f"{base}/stream",       True),
+        ("dead (closed)",   f"{closed}/stream",     False),
+        ("404",             f"{base}/missing",      False),
+        ("slow",            f"{base}/slow",         False),
+        ("empty",           f"{base}/empty",        False),
+        ("redirect loop",   f"{base}/loop",         False),
+        ("302 -> pls",      f"{base}/r",            True),
+        ("pls -> 404",      f"{base}/dead.pls",     False),
+        ("pls -> closed",   f"{base}/closed.pls",   False),
+        ("nested m3u",      f"{base}/nested.m3u",   True),
+        ("hls",             f"{base}/hls.m3u8",     True),
+        ("slow hops",       f"{base}/hop1",         False),
+    ]
+    failed = 0
+    for name, url, expect in cases:
+        t = time.perf_counter()
+        got, info = asyncio.run(ir.probe_url(url, timeout))
+        t = time.perf_counter() - t
+        ok = got == expect and t < timeout + 0.1
+        failed += not ok
+        print(f"{name:16s} {'ok' if ok else 'FAIL'}  expected {expect}, got {got}, {t*1000:6.0f} ms  {info}")
+    # probe_run(): zwei Stationen mit gleicher URL bekommen beide ihr Ergebnis in der DB
+    import tempfile
+    ir.hal_setup(ir.hal_network())
+    with tempfile.TemporaryDirectory() as tmp:
+        ir.STATION_DB_FILE = f"{tmp}/stations.db"
+        ir.db_schema_checked = None
+        bench_make_db(ir.STATION_DB_FILE, 3, 3)
+        entries = [(url, uuid, [url]) for url, uuid in ((f"{base}/stream", "s-0"), (f"{base}/stream", "s-1"), (f"{base}/missing", "s-2"))]
+        ir.probe_run(entries)
+        con = ir.db_connect_rw()
+        try:
+            checked = {row[0] : row[1] for row in con.execute("select stationuuid, lastcheckok from stations where lastchecktime != ''")}
+        finally:
+            con.close()
+    ok = checked == {"s-0" : 1, "s-1" : 1, "s-2" : 0}
+    failed += not ok
+    print(f"{'same url':16s} {'ok' if ok else 'FAIL'}  {checked}")
+    server.shutdown()
+    return failed
+
+# ***********************************************************************************************
+def bench_percentiles(values):
+    # p50/p90/p99/max in ms (values in s)
+    if not values:
+        return None
+    v = sorted(values)
+    pick = lambda q: v[min(len(v) - 1, int(q * len(v)))] * 1000
+    return {"n" : len(v), "p50" : round(pick(0.5), 3), "p90" : round(pick(0.9), 3),
+            "p99" : round(pick(0.99), 3), "max" : round(v[-1] * 1000, 3)}
+
+# ***********************************************************************************************
+def bench_op(inject, window=200, until="frame"):
+    # eine Eingabe einspielen, window ms virtuelle Zeit laufen lassen; Latenz (echte Zeit) bis
+    # zum ersten fertigen Frame ("frame"), bis zum Start von VLC ("play"), bis zum Event
+    # MediaPlayerPlaying ("playing") bzw. bis zum ersten Ton ("sound", auch vorgepuffert),
+    # dazu CPU-Zeit, Frames und Bytes
+    frames = ir.disp.frame_count
+    plays = len(ir.hal["vlc"].play_times)
+    playing = len(ir.hal["vlc"].playing_times)
+    sounds = len(ir.hal["vlc"].sound_times)
+    nbytes = ir.disp.bytes
+    dropped = ir.render_stats["dropped"]
+    c = time.process_time()
+    t = time.perf_counter()
+    inject(ir.hal["clock"].now)
+    ir.main_loop(ir.hal["clock"].now + window)
+    ir.render_wait_idle()
+    if until == "frame":
+        done = ir.disp.frame_times[frames:]
+    elif until == "play":
+        done = ir.hal["vlc"].play_times[plays:]
+    elif until == "playing":
+        done = ir.hal["vlc"].playing_times[playing:]
+    else:
+        done = ir.hal["vlc"].sound_times[sounds:]
+    return {
+            "latency"   : done[0] - t if done else None,
+            "cpu"       : time.process_time() - c,
+            "frames"    : ir.disp.frame_count - frames,
+            "dropped"   : ir.render_stats["dropped"] - dropped,
+            "bytes"     : ir.disp.bytes - nbytes,
+    }
+
+# ***********************************************************************************************
+def bench_ops(name, results, ops):
+    # Ergebnisse einer Operation zusammenfassen
+    results[name] = {
+            "latency_ms"    : bench_percentiles([op["latency"] for op in ops if op["latency"] is not None]),
+            "cpu_ms"        : bench_percentiles([op["cpu"] for op in ops]),
+            "frames"        : sum(op["frames"] for op in ops),
+            "dropped"       : sum(op["dropped"] for op in ops),
+            "bytes"         : sum(op["bytes"] for op in ops),
+    }
+
+# ***********************************************************************************************
+def bench_timeit(func, rounds, setup=None):
+    times = []
+    for i in range(rounds):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return bench_percentiles(times)
+
+# ***********************************************************************************************
+def bench_e2e(out=None, rounds=30, count=2000, favorites=500):
+    # Ende-zu-Ende-Benchmark auf der Ersatz-Hardware (headless, virtuelle Zeit); Latenzen,
+    # CPU-Zeit, Frames und Bytes pro Operation als JSON (Datei out bzw. stdout)
+    import platform
+    import shutil
+    ir.hal_setup(iradio_fake.backend())
+    bench_make_db(ir.STATION_DB_FILE, count, favorites)
+    ir.db_connect_rw().close()
+    ir.app_setup()
+    results = {
+            "meta"          : {"time" : datetime.now().isoformat(timespec="seconds"), "python" : platform.python_version(),
+                               "machine" : platform.machine(), "rounds" : rounds, "stations" : count, "favorites" : favorites},
+            "operations"    : {},
+            "functions"     : {},
+    }
+    ops = results["operations"]
+    press = lambda pin: (lambda t: ir.hal["gpio"].press(pin, t, 20))
+    turn = lambda clk, dt, n, interval: (lambda t: ir.hal["gpio"].turn(clk, dt, n, t, interval))
+
+    # Einschalten --> Hauptbildschirm (und wieder aus)
+    on = []
+    for i in range(rounds):
+        on.append(bench_op(press(ir.VOLUME_SW_PIN)))
+        ir.cycle_stop("probe_streams")
+        bench_op(press(ir.VOLUME_SW_PIN))
+    bench_ops("power_on_to_main_screen", ops, on)
+    bench_op(press(ir.VOLUME_SW_PIN))
+    ir.cycle_stop("probe_streams")
+    ir.main_loop(ir.hal["clock"].now + 2000)
+
+    # eine Rastung --> Pixel auf dem Display
+    bench_ops("volume_detent_to_pixels", ops,
+              [bench_op(turn(ir.VOLUME_CLK_PIN, ir.VOLUME_DT_PIN, 1 if i % 2 else -1, 500)) for i in range(rounds)])
+    bench_ops("selection_detent_to_pixels", ops,
+              [bench_op(turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 1, 500)) for i in range(rounds)])
+
+    # Auswahl --> MediaPlayerPlaying (kommt vom Fake start_delay ms virtuelle Zeit nach play())
+    select = []
+    for i in range(rounds):
+        bench_op(turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 1, 500))
+        select.append(bench_op(press(ir.SELECTION_SW_PIN), ir.hal["vlc"].start_delay + 200, until="playing"))
+    bench_ops("select_to_play", ops, select)
+    ir.main_loop(ir.hal["clock"].now + ir.TIMEOUT_CLOSE_WINDOW + 1000)
+
+    # schnelles Blaettern: Frames pro Sekunde (echte Zeit) und verworfene Frames; Zeichnen kostet
+    # virtuelle Zeit (einfach bzw. zehnfach, etwa ein langsamer Raspberry), waehrenddessen
+    # eingehende Auftraege werden zusammengefasst
+    render_scale = ir.hal["render_scale"]
+    for scale, name in ((1, "fast_scroll"), (10, "fast_scroll[x10]")):
+        ir.hal["render_scale"] = scale
+        frames = ir.disp.frame_count
+        dropped = ir.render_stats["dropped"]
+        nbytes = ir.disp.bytes
+        c = time.process_time()
+        t = time.perf_counter()
+        detents = 200
+        ir.hal["gpio"].turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, detents, ir.hal["clock"].now, 10)
+        ir.main_loop(ir.hal["clock"].now + detents * 10 + 100)
+        ir.render_wait_idle()
+        t = time.perf_counter() - t
+        ops[name] = {
+                "detents"       : detents,
+                "render_scale"  : scale,
+                "frames"        : ir.disp.frame_count - frames,
+                "dropped"       : ir.render_stats["dropped"] - dropped,
+                "bytes"         : ir.disp.bytes - nbytes,
+                "frames_per_s"  : round((ir.disp.frame_count - frames) / t, 1),
+                "cpu_ms"        : round((time.process_time() - c) * 1000, 3),
+        }
+        ir.main_loop(ir.hal["clock"].now + ir.TIMEOUT_CLOSE_WINDOW + 1000)
+    ir.hal["render_scale"] = render_scale
+
+    # einzelne Funktionen (Zeichnen ohne Push, Logos, Stationsliste)
+    fn = results["functions"]
+    for i in range(len(ir.SCREENS)):
+        with ir.state_lock:
+            ir.temps["main_screen_idx"] = i
+        st = ir.state_snapshot()
+        fn[f"tft_display_main[{i}]"] = bench_timeit(lambda: ir.tft_display_main(st), rounds)
+    st = ir.state_snapshot()
+    fn["tft_display_stations"] = bench_timeit(lambda: ir.tft_display_stations(st), rounds)
+    fn["tft_push"] = bench_timeit(lambda: ir.tft_push(ir.disp, ir.img), rounds)
+    url = "http://127.0.0.1/bench-logo.png"
+    os.makedirs(ir.PATH_LOGO_CACHE, exist_ok=True)
+    orig = f"{ir.PATH_LOGO_CACHE}{ir.logo_hash(url)}.png"
+    scaled = f"{ir.PATH_LOGO_CACHE}{ir.logo_hash(url)}_90x100.png"
+    shutil.copyfile(ir.DEFAULT_LOGO, orig)
+    webimage = lambda: ir.load_webimage(url, 90, 100, ir.PATH_LOGO_CACHE, ir.DEFAULT_LOGO)
+    def cold():
+        ir.logo_mem_cache.clear()
+        if os.path.exists(scaled):
+            os.remove(scaled)
+    fn["load_webimage[resize]"] = bench_timeit(webimage, rounds, cold)
+    fn["load_webimage[disk]"] = bench_timeit(webimage, rounds, ir.logo_mem_cache.clear)
+    fn["load_webimage[mem]"] = bench_timeit(webimage, rounds)
+    fn["load_stations"] = bench_timeit(ir.load_stations, rounds)
+
+    text = json.dumps(results, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return results
+
+
+# ***********************************************************************************************
+def check_prebuffer(rounds=5, stations=12, connect=0.15):
+    # Stationswechsel ohne und mit Vorpuffern: Streams kommen von einem lokalen Server (Antwort
+    # erst nach connect s), der Fake-VLC verbindet sich wirklich; je Runde eine Rastung in der
+    # Stationsliste, PREBUFFER_DELAY abwarten, auswaehlen. Gemessen wird bis zum ersten Ton (echte
+    # Zeit) bzw. first_sound_ms (virtuelle Zeit). Exit-Code 1, wenn vorgepuffert nicht schneller ist
+    def stream(h):
+        time.sleep(connect)
+        check_reply(h, bytes(4096), "audio/mpeg")
+
+    server, base = check_server({f"/{i}" : stream for i in range(stations)})
+    backend = iradio_fake.backend()
+    backend.update(ir.hal_network())
+    ir.hal_setup(backend)
+    bench_make_db(ir.STATION_DB_FILE, stations, stations, base)
+    vlc = ir.hal["vlc"]
+    vlc.http_open = ir.http_open
+    gpio = ir.hal["gpio"]
+    clock = ir.hal["clock"]
+    prebuffer_enabled = ir.PREBUFFER_ENABLED
+    try:
+        ir.app_setup()
+        ir.boot_done.wait()
+        gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+        ir.main_loop(clock.now + 3000)
+        results = {}
+        for prebuffer in (False, True):
+            ir.PREBUFFER_ENABLED = prebuffer
+            wall = []
+            for i in range(rounds):
+                bench_op(lambda t: gpio.turn(ir.SELECTION_CLK_PIN, ir.SELECTION_DT_PIN, 1, t, 20), ir.PREBUFFER_DELAY + 1000)
+                wall.append(bench_op(lambda t: gpio.press(ir.SELECTION_SW_PIN, t, 20), 2000, until="sound")["latency"])
+            h = ir.metrics_hist.get(("first_sound_ms", (("event", "select"), ("prebuffered", int(prebuffer)))))
+            results[prebuffer] = (bench_percentiles([w for w in wall if w is not None]), h.sum / h.count if h else None, h.count if h else 0)
+            print(f"{'with' if prebuffer else 'without':7s} prebuffering: {results[prebuffer][1]} ms virtual, wall {results[prebuffer][0]}")
+        gpio.press(ir.VOLUME_SW_PIN, clock.now + 100)
+        ir.main_loop(clock.now + 1000)
+        ir.render_wait_idle()
+    finally:
+        ir.PREBUFFER_ENABLED = prebuffer_enabled
+        vlc.http_open = None
+        server.shutdown()
+    off, on = results[False], results[True]
+    cases = [
+        ("all switches measured",   off[0] is not None and on[0] is not None and off[0]["n"] == on[0]["n"] == rounds),
+        ("all prebuffered",         on[2] == rounds),
+        ("faster (virtual)",        off[1] is not None and on[1] is not None and on[1] < off[1]),
+        ("faster (wall)",           off[0] is not None and on[0] is not None and on[0]["p50"] < off[0]["p50"]),
+    ]
+    failed = 0
+    for name, ok in cases:
+        failed += not ok
+        print(f"{name:22s} {'ok' if ok else 'FAIL'}")
+    return failed
+
+# ***********************************************************************************************
+def main(argv):
+    # Kommandozeile (siehe usage); liefert den Exit-Code
+    if len(argv) > 1:
+        if argv[1] == "bench-rgb565":
+            bench_rgb565()
+            return 0
+        elif argv[1] == "bench-db":
+            bench_db()
+            return 0
+        elif argv[1] == "check-encoder":
+            return 1 if check_encoder() else 0
+        elif argv[1] == "check-tft":
+            return 1 if check_tft() else 0
+        elif argv[1] == "check-caching":
+            return 1 if check_caching() else 0
+        elif argv[1] == "check-boot":
+            return 1 if check_boot() else 0
+        elif argv[1] == "check-meta":
+            return 1 if check_meta() else 0
+        elif argv[1] == "check-logo":
+            return 1 if check_logo() else 0
+        elif argv[1] == "check-resolve":
+            return 1 if check_resolve() else 0
+        elif argv[1] == "check-probe":
+            return 1 if check_probe() else 0
+        elif argv[1] == "check-prebuffer":
+            return 1 if check_prebuffer() else 0
+        elif argv[1] == "bench-e2e":
+            bench_e2e(argv[2] if len(argv) > 2 else None)
+            return 0
+        elif argv[1] == "headless":
+            headless_run(int(argv[2]) if len(argv) > 2 else 120)
+            return 0
+        elif argv[1] == "check-db":
+            return 1 if check_db() else 0
+        elif argv[1] == "check-search":
+            return 1 if check_search() else 0
+        elif argv[1] == "check-import":
+            return 1 if check_import() else 0
+        elif argv[1] == "check-history":
+            return 1 if check_history() else 0
+    print(f"usage: {argv[0]} [check-db|check-import|check-search|check-history|check-encoder|check-tft|check-caching|check-boot|check-meta|check-logo|check-resolve|check-probe|check-prebuffer|headless [s]|bench-rgb565|bench-db|bench-e2e [out.json]]")
+    return 2
+
+# ***********************************************************************************************
+# ***********************************************************************************************
+# ***********************************************************************************************
+
+if __name__ == "__main__":
+    import sys
+    exit(main(sys.argv))
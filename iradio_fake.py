@@ -0,0 +1,469 @@
+# ************************************************************************************************************
+#
+#   Ersatz-Hardware fuer IRadio (ohne Raspberry Pi, Display und VLC)
+#   ================================================================
+#
+# Wird von iradio.py geladen, wenn es mit "headless" gestartet wird (siehe hal_setup()).
+# Nachgebildet wird nur, was iradio.py von RPi.GPIO, st7735 und vlc tatsaechlich benutzt:
+#
+# * VirtualClock: virtuelle Zeit (ms); der Main-Loop schlaeft nicht, sondern springt
+#   direkt zur naechsten Deadline bzw. zum naechsten Timer
+# * FakeGPIO: Pegel im Speicher, Flanken koennen (auch zeitgesteuert) eingespielt werden,
+#   z.B. Drehungen (turn()) und Tastendruecke (press())
+# * ST7735: Framebuffer-Display; zaehlt Fenster/Bytes und merkt sich die Frames
+# * vlc: Instance/MediaPlayer/Media mit Events und per Skript setzbaren Metadaten; Streams
+#   koennen Jitter haben (Aussetzer, solange network-caching kleiner ist)
+# * Netz: http_open() (Stream-Aufloesung, Logos) und probe_url() (Stream-Pruefung) ohne
+#   echte Verbindungen; Inhalte koennen per Skript (web) vorgegeben werden
+#
+# ************************************************************************************************************
+
+import heapq
+import sys
+import threading
+import time
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+
+# ***********************************************************************************************
+class VirtualClock:
+    # virtuelle Zeit in ms; Timer (at()) werden beim Vorstellen der Uhr ausgefuehrt
+    def __init__(self, start_ms):
+        self.now = start_ms
+        self.timers = []
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def time_ms(self):
+        return self.now
+
+    def at(self, t, func, *args):
+        with self.lock:
+            self.seq = self.seq + 1
+            heapq.heappush(self.timers, (t, self.seq, func, args))
+
+    def after(self, ms, func, *args):
+        self.at(self.now + ms, func, *args)
+
+    def next_timer(self):
+        with self.lock:
+            return self.timers[0][0] if self.timers else None
+
+    def advance_to(self, t):
+        # Uhr vorstellen und alle bis dahin faelligen Timer ausfuehren
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0][0] > t:
+                    break
+                when, seq, func, args = heapq.heappop(self.timers)
+            self.now = max(self.now, when)
+            func(*args)
+        self.now = max(self.now, t)
+
+
+# ***********************************************************************************************
+class FakeGPIO:
+    # Teilmenge von RPi.GPIO; Eingaenge haben ohne eingespielte Flanke Pegel 1 (Pull-up)
+    BCM = 11
+    IN = 1
+    OUT = 0
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.levels = {}
+        self.callbacks = {}     # pin --> (Flanke, Callback)
+        self.edges = 0
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None):
+        self.levels.setdefault(pin, 1)
+
+    def input(self, pin):
+        return self.levels.get(pin, 1)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def cleanup(self):
+        self.callbacks.clear()
+
+    def set_level(self, pin, level):
+        # Pegel setzen; bei passender Flanke wird der Callback (wie im GPIO-Thread) aufgerufen
+        old = self.levels.get(pin, 1)
+        self.levels[pin] = level
+        if old == level or pin not in self.callbacks:
+            return
+        edge, callback = self.callbacks[pin]
+        if edge == self.BOTH or (edge == self.RISING and level == 1) or (edge == self.FALLING and level == 0):
+            self.edges = self.edges + 1
+            callback(pin)
+
+    def turn(self, clk, dt, detents, t=None, interval=100):
+        # Drehung um detents Rastungen (Vorzeichen = Richtung) ab Zeitpunkt t, eine Rastung
+        # pro interval ms; ein Gray-Code-Zyklus pro Rastung, Ruhelage CLK=1/DT=1
+        if detents > 0:
+            seq = [(dt, 0), (clk, 0), (dt, 1), (clk, 1)]
+        else:
+            seq = [(clk, 0), (dt, 0), (clk, 1), (dt, 1)]
+        t = self.clock.now if t is None else t
+        for i in range(abs(detents)):
+            for j, (pin, level) in enumerate(seq):
+                self.clock.at(t + i * interval + j * interval / 8, self.set_level, pin, level)
+        return t + abs(detents) * interval
+
+    def press(self, pin, t=None, duration=100):
+        t = self.clock.now if t is None else t
+        self.clock.at(t, self.set_level, pin, 0)
+        self.clock.at(t + duration, self.set_level, pin, 1)
+        return t + duration
+
+
+# ***********************************************************************************************
+class ST7735:
+    # Framebuffer-Display (RGB565, big-endian wie auf dem SPI-Bus); gleiche Schnittstelle,
+    # wie sie tft_push() von st7735.ST7735 benutzt
+    def __init__(self, port=0, cs=0, dc=None, rst=None, width=128, height=160, rotation=0,
+                 offset_left=0, offset_top=0, invert=False, keep_frames=0):
+        self.width = width
+        self.height = height
+        self.fb = np.zeros((height, width), dtype=">u2")
+        self.window = (0, 0, width - 1, height - 1)
+        self.pos = 0
+        self.windows = 0
+        self.bytes = 0
+        self.frames = []                # die letzten keep_frames Frames (als Bild)
+        self.frame_times = []           # Ende jedes Frames (perf_counter, echte Zeit)
+        self.frame_count = 0
+        self.keep_frames = keep_frames
+
+    def begin(self):
+        pass
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        x1 = self.width - 1 if x1 is None else x1
+        y1 = self.height - 1 if y1 is None else y1
+        self.window = (x0, y0, x1, y1)
+        self.pos = 0
+        self.windows = self.windows + 1
+
+    def data(self, data):
+        # Daten fortlaufend in das aktuelle Fenster schreiben
+        x0, y0, x1, y1 = self.window
+        w = x1 - x0 + 1
+        pixels = np.frombuffer(bytes(data), dtype=">u2")
+        y, x = np.divmod(np.arange(self.pos, self.pos + len(pixels)), w)
+        self.fb[y0 + y, x0 + x] = pixels
+        self.pos = self.pos + len(pixels)
+        self.bytes = self.bytes + len(data)
+
+    def end_frame(self):
+        self.frame_times.append(time.perf_counter())
+        self.frame_count = self.frame_count + 1
+        if self.keep_frames:
+            self.frames.append(self.image())
+            del self.frames[:-self.keep_frames]
+
+    def image(self):
+        # Framebuffer zurueck nach RGB (Bildschirminhalt, wie er auf dem Panel steht)
+        c = self.fb.astype(np.uint16)
+        rgb = np.dstack(((c >> 11) << 3, ((c >> 5) & 0x3F) << 2, (c & 0x1F) << 3)).astype(np.uint8)
+        return Image.fromarray(rgb, "RGB")
+
+
+# ***********************************************************************************************
+class _EventManager:
+    def __init__(self):
+        self.handlers = {}
+
+    def event_attach(self, event_type, callback, *args):
+        self.handlers[event_type] = (callback, args)
+
+    def event_detach(self, event_type):
+        self.handlers.pop(event_type, None)
+
+    def send(self, event_type, new_cache=100):
+        if event_type in self.handlers:
+            callback, args = self.handlers[event_type]
+            callback(_Event(event_type, new_cache), *args)
+
+
+class _Event:
+    def __init__(self, event_type, new_cache=100):
+        self.type = event_type
+        self.u = _EventUnion(new_cache)
+
+
+class _EventUnion:
+    def __init__(self, new_cache):
+        self.new_cache = new_cache
+
+
+# ***********************************************************************************************
+class vlc:
+    # Teilmenge des vlc-Moduls (python-vlc); wird in iradio.py als "vlc" eingesetzt
+
+    class EventType:
+        MediaPlayerPlaying = "MediaPlayerPlaying"
+        MediaPlayerEncounteredError = "MediaPlayerEncounteredError"
+        MediaMetaChanged = "MediaMetaChanged"
+        MediaPlayerBuffering = "MediaPlayerBuffering"
+
+    class Meta:
+        Title = 0
+        Genre = 2
+        NowPlaying = 12
+
+    # Skript: URL --> Metadaten beim Start; URLs in fail liefern einen Fehler; jitter: URL -->
+    # laengste Luecke (ms) im Stream, alle jitter_period ms eine; ist network-caching kleiner,
+    # laeuft der Puffer leer (Buffering-Events, verlorene Audio-Puffer)
+    meta = {}
+    fail = set()
+    jitter = {}
+    jitter_period = 60000
+    clock = None
+    start_delay = 300           # ms bis "Playing"
+    play_times = []             # Aufrufe von play() (perf_counter, echte Zeit)
+    playing_times = []          # gemeldete MediaPlayerPlaying (perf_counter, echte Zeit)
+    sound_times = []            # erster Ton: Playing ohne Mute bzw. Mute aus (perf_counter)
+    http_open = None            # gesetzt (z.B. iradio.http_open): play() verbindet sich wirklich
+    instance_error = None       # Exception fuer Instance() (VLC startet nicht)
+
+    class MediaStats:
+        # wie libvlc_media_stats_t; die Fake-Medien zaehlen nur gelesene Bytes hoch
+        def __init__(self):
+            self.read_bytes = 0
+            self.input_bitrate = 0.0
+            self.demux_read_bytes = 0
+            self.demux_bitrate = 0.0
+            self.demux_corrupted = 0
+            self.demux_discontinuity = 0
+            self.decoded_audio = 0
+            self.played_abuffers = 0
+            self.lost_abuffers = 0
+
+    class Media:
+        def __init__(self, mrl):
+            self.mrl = mrl
+            self.meta = dict(vlc.meta.get(mrl, {}))
+            self.events = _EventManager()
+            self.created = vlc.clock.now if vlc.clock else 0
+            self.options = []
+            self.underruns = 0
+
+        def get_mrl(self):
+            return self.mrl
+
+        def get_meta(self, key):
+            return self.meta.get(key)
+
+        def set_meta(self, key, value):
+            # z.B. neuer ICY-Titel; wie bei VLC folgt ein MediaMetaChanged
+            self.meta[key] = value
+            self.events.send(vlc.EventType.MediaMetaChanged)
+
+        def event_manager(self):
+            return self.events
+
+        def add_option(self, option):
+            self.options.append(option)
+
+        def caching(self):
+            # zuletzt gesetztes :network-caching=... (sonst VLC-Default)
+            ms = 1000
+            for option in self.options:
+                if option.startswith(":network-caching="):
+                    ms = int(option.split("=", 1)[1])
+            return ms
+
+        def get_stats(self, stats):
+            # 128 kbit/s seit dem Anlegen (virtuelle Zeit)
+            ms = (vlc.clock.now if vlc.clock else 0) - self.created
+            stats.read_bytes = stats.demux_read_bytes = int(ms * 16)
+            stats.input_bitrate = stats.demux_bitrate = 16.0 / 1000
+            stats.decoded_audio = stats.played_abuffers = int(ms / 26)
+            stats.lost_abuffers = self.underruns * 20
+            return True
+
+        def gap(self, player):
+            # Luecke im Stream: reicht der Puffer nicht, meldet VLC Nachpuffern
+            if not player.playing or player.media is not self:
+                return
+            if self.caching() < vlc.jitter.get(self.mrl, 0):
+                self.underruns = self.underruns + 1
+                player.events.send(vlc.EventType.MediaPlayerBuffering, 0)
+                player.events.send(vlc.EventType.MediaPlayerBuffering, 100)
+            vlc.clock.after(vlc.jitter_period, self.gap, player)
+
+    class MediaPlayer:
+        def __init__(self):
+            self.media = None
+            self.volume = 0
+            self.mute = False
+            self.playing = False
+            self.started_ok = False
+            self.events = _EventManager()
+
+        def event_manager(self):
+            return self.events
+
+        def set_media(self, media):
+            self.media = media
+
+        def get_media(self):
+            return self.media
+
+        def play(self):
+            media = self.media
+            self.playing = True
+            vlc.play_times.append(time.perf_counter())
+            if media is None:
+                return
+            if media.mrl in vlc.fail or not self.connect(media.mrl):
+                event = vlc.EventType.MediaPlayerEncounteredError
+            else:
+                event = vlc.EventType.MediaPlayerPlaying
+            # wie bei VLC kommt das Event spaeter und aus einem anderen "Thread"
+            vlc.clock.after(vlc.start_delay, self.started, media, event)
+
+        def connect(self, mrl):
+            # Stream (bzw. Playlist) wirklich anfordern, erste Bytes lesen (blockiert, echte Zeit)
+            if vlc.http_open is None:
+                return True
+            try:
+                with vlc.http_open(mrl, 5) as response:
+                    return len(response.read(1)) > 0
+            except OSError:
+                return False
+
+        def started(self, media, event):
+            if self.playing and self.media is media:
+                if event == vlc.EventType.MediaPlayerPlaying:
+                    self.started_ok = True
+                    vlc.playing_times.append(time.perf_counter())
+                    if not self.mute:
+                        vlc.sound_times.append(time.perf_counter())
+                self.events.send(event)
+                if media.meta:
+                    media.events.send(vlc.EventType.MediaMetaChanged)
+                if media.mrl in vlc.jitter and event == vlc.EventType.MediaPlayerPlaying:
+                    vlc.clock.after(vlc.jitter_period, media.gap, self)
+
+        def stop(self):
+            self.playing = False
+            self.started_ok = False
+
+        def release(self):
+            self.playing = False
+            self.started_ok = False
+
+        def audio_set_volume(self, volume):
+            self.volume = volume
+
+        def audio_set_mute(self, mute):
+            # vorgepufferter Player wird hoerbar
+            if self.mute and not mute and self.playing and self.started_ok:
+                vlc.sound_times.append(time.perf_counter())
+            self.mute = mute
+
+    class Instance:
+        def __init__(self, *args):
+            # Skript: instance_error gesetzt --> libvlc startet nicht
+            if vlc.instance_error is not None:
+                raise vlc.instance_error
+            self.players = []
+
+        def media_new(self, mrl):
+            return vlc.Media(mrl)
+
+        def media_player_new(self):
+            p = vlc.MediaPlayer()
+            self.players.append(p)
+            return p
+
+
+# ***********************************************************************************************
+# Skript: URL --> (Content-Type, Inhalt); nicht eingetragene URLs sind Streams, solche mit
+# Bild-Endung bekommen ein graues Platzhalter-Logo; URLs in vlc.fail liefern 404
+web = {}
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp")
+
+
+class _Response:
+    # das, was iradio.py von der Antwort von urlopen() benutzt
+    def __init__(self, url, ctype, body):
+        self.url = url
+        self.headers = {"Content-Type" : ctype}
+        self.fp = None
+        self.body = BytesIO(body)
+
+    def geturl(self):
+        return self.url
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    def read1(self, size=-1):
+        return self.body.read(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def placeholder_logo():
+    buf = BytesIO()
+    Image.new("RGB", (64, 64), (128, 128, 128)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# ***********************************************************************************************
+def http_open(url, timeout=None):
+    # Ersatz fuer iradio.http_open()
+    if url in vlc.fail:
+        raise HTTPError(url, 404, "Not Found", {}, None)
+    if url in web:
+        ctype, body = web[url]
+    elif urlparse(url).path.lower().endswith(IMAGE_SUFFIXES):
+        ctype, body = "image/png", placeholder_logo()
+    else:
+        ctype, body = "audio/mpeg", bytes(4096)
+    return _Response(url, ctype, body)
+
+
+# ***********************************************************************************************
+async def probe_url(url, timeout=None):
+    # Ersatz fuer iradio.probe_url(): alles gesund, ausser URLs in vlc.fail
+    if url in vlc.fail:
+        return False, {"url" : url, "status" : 404}
+    return True, {"url" : url, "status" : 200, "content-type" : "audio/mpeg", "bytes" : 4096}
+
+
+# ***********************************************************************************************
+def backend(start_ms=None, render_scale=1.0):
+    # alle Backends fuer iradio.hal_setup() (Gegenstueck zu iradio.hal_hardware()); Zeichnen
+    # kostet render_scale mal die echte Zeit als virtuelle Zeit (z.B. 10: langsamer Raspberry)
+    clock = VirtualClock(time.time_ns()/1000000 if start_ms is None else start_ms)
+    vlc.clock = clock
+    return {
+            "headless"      : True,
+            "clock"         : clock,
+            "gpio"          : FakeGPIO(clock),
+            "display"       : sys.modules[__name__],
+            "vlc"           : vlc,
+            "http_open"     : http_open,
+            "probe_url"     : probe_url,
+            "render_scale"  : render_scale,
+    }